@@ -3,7 +3,7 @@ import shutil
 import logging
 import argparse
 from funcs import GnssConfig, GnssTime, gns_sat, hms2sod, read_site_list, MAX_THREAD, timeblock, mkdir, \
-    get_grg_wsb, check_turboedit_log, check_brd_orbfit, backup_files, edit_ics, \
+    get_grg_wsb, check_turboedit_log, check_brd_orbfit, screen_brd_sats, backup_files, edit_ics, \
     GrtClockRepair, GrtTurboedit, GrtPreedit, GrtOi, GrtOrbfit, GrtEditres, multi_run
 
 
@@ -209,14 +209,24 @@ class ProcGen:
                 return True
             else:
                 return False
+        # bad broadcast ephemerides are screened against the precise orbits before the fit if they are available,
+        # otherwise a second orbfit iteration is needed to get rid of them
+        f_sp3 = self._config.get_xml_file('sp3', check=True, quiet=True)
+        f_nav = self._config.get_xml_file('rinexn', check=True)
+        screened = bool(f_sp3 and f_nav)
+        if screened:
+            sat_rm = screen_brd_sats(f_nav[0], f_sp3, self._config.all_gnssat)
+            self._config.sat_rm += sat_rm
+
         orb_ac = self._config.orb_ac
         self._config.orb_ac = 'brd'
 
         GrtPreedit(self._config).run()
         GrtOi(self._config, 'oi').run()
         GrtOrbfit(self._config, 'orbfit').run()
-        GrtOi(self._config, 'oi').run()
-        GrtOrbfit(self._config, 'orbfit').run()
+        if not screened:
+            GrtOi(self._config, 'oi').run()
+            GrtOrbfit(self._config, 'orbfit').run()
 
         sat_rm = check_brd_orbfit(self._config.get_xml_file('orbdif', sec='output_files')[0])
         self._config.sat_rm += sat_rm
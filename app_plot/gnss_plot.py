@@ -6,9 +6,10 @@ import logging
 from datetime import datetime
 import matplotlib.dates as mdates
 from typing import List
-from funcs.gnss_files import read_sp3_file
-from funcs.gnss_time import GnssTime, sod2hms, mjd2ymd
-from funcs.coordinate import ell2cart, cart2ell
+from funcs.gnss_files import read_sp3_file, read_atx_antenna, read_panda_sum, read_enu_file, \
+    read_upd_file, update_upd_store, query_upd, upd_table, read_flt_file
+from funcs.gnss_time import GnssTime, sod2hms
+from funcs.coordinate import ell2cart, cart2ell, xyz2enu
 from funcs.constants import gns_name, gns_sat
 
 
@@ -31,117 +32,47 @@ def isint(value):
 
 
 def read_atxpcv(catx, f_atx):
-    with open(f_atx) as file_object:
-        lines = file_object.readlines()
-
-    isfound = False
-    ibeg = 0;
-    iend = 0;
-    j = 0
-    for i in range(len(lines)):
-        if lines[i].find('START OF ANTENNA') == 60:
-            ibeg = i
-            for j in range(i + 1, len(lines)):
-                if lines[j].find('TYPE / SERIAL NO') == 60:
-                    anttype = lines[j][0:13]
-                    if anttype.strip() == catx:
-                        isfound = True
-                if lines[j].find('END OF ANTENNA') == 60:
-                    break
-            iend = j
-            if isfound:
-                break
-
-    if not isfound:
+    ant = read_atx_antenna(f_atx, catx, 13)
+    if ant is None:
         msg = f"ATX {catx} not found in {f_atx.rstrip()}!"
         print(msg)
         return
 
-    dazi = 0;
-    dzen = 0;
-    zen1 = 0;
-    zen2 = 0
-    for i in range(ibeg, iend):
-        if lines[i][0] == '#':
-            continue
-        if lines[i].find('DAZI') == 60:
-            dazi = float(lines[i][0:8])
-        if lines[i].find('ZEN1 / ZEN2 / DZEN') == 60:
-            zen1 = float(lines[i][0:8])
-            zen2 = float(lines[i][8:14])
-            dzen = float(lines[i][14:20])
-
+    dazi, zen1, zen2, dzen = ant['dazi'], ant['zen1'], ant['zen2'], ant['dzen']
     if dazi == 0 or dzen == 0:
         return
 
     nazi = int(360 / dazi) + 1
     nzen = int((zen2 - zen1) / dzen) + 1
     dpcv = np.zeros((nazi, nzen), dtype=float)
-
-    isfound = False
-    for i in range(ibeg, iend):
-        if lines[i].find('NOAZI') == 3:
-            isfound = True
-            continue
-        if not isfound:
-            continue
-        if lines[i].find('END OF FREQUENCY') == 60:
-            break
-        azi = float(lines[i][0:8])
-        azi = 90 - azi
-        if azi < 0:
-            azi = azi + 360
-        row = int(azi / dazi)
-        if row >= nazi:
-            continue
-        for j in range(nzen):  # 天顶角 -> 高度角
-            dpcv[row][nzen - j - 1] = float(lines[i][8 + j * 8:16 + j * 8])
-
+    if not ant['freq']:
+        return dpcv
+
+    # azimuth dependent PCV of the first frequency, 天顶角 -> 高度角
+    pcv = next(iter(ant['freq'].values()))['pcv']
+    if pcv.size == 0:
+        return dpcv
+    azi = 90 - pcv[:, 0]
+    azi[azi < 0] += 360
+    row = (azi / dazi).astype(int)
+    keep = row < nazi
+    dpcv[row[keep], ::-1] = pcv[keep, 1:nzen + 1]
     return dpcv
 
 
 def read_enu(f_enu):
-    try:
-        with open(f_enu) as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        logging.error(f"file not found {f_enu}")
-        return pd.DataFrame()
-
-    data = []
-    for line in lines:
-        info = line.split()
-        if len(info) == 4:
-            if info[0] == "RMS":
-                break
-            sod = float(info[0])
-            de = float(info[1])
-            dn = float(info[2])
-            du = float(info[3])
-            data.append({"sod": sod, "de": de, "dn": dn, "du": du})
-
-    return pd.DataFrame(data)
-
+    return read_enu_file(f_enu)
 
-def dxyz2enu(ell: List[float], dxyz: List[float]):
-    sinPhi = math.sin(ell[0])
-    cosPhi = math.cos(ell[0])
-    sinLam = math.sin(ell[1])
-    cosLam = math.cos(ell[1])
 
-    n = -sinPhi * cosLam * dxyz[0] - sinPhi * sinLam * dxyz[1] + cosPhi * dxyz[2]
-    e = -sinLam * dxyz[0] + cosLam * dxyz[1]
-    u = cosPhi * cosLam * dxyz[0] + cosPhi * sinLam * dxyz[1] + sinPhi * dxyz[2]
-
-    return e, n, u
+def dxyz2enu(ell: List[float], dxyz):
+    """ ell: latitude and longitude of the site in radians; dxyz: one difference or an (epoch, 3) array """
+    enu = xyz2enu(dxyz, math.degrees(ell[0]), math.degrees(ell[1]))
+    return enu[..., 0], enu[..., 1], enu[..., 2]
 
 
 def read_enu_kin(f_enu, xyz: List[float]):
-    try:
-        with open(f_enu) as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        logging.error(f"{f_enu} not found")
+    data = read_flt_file(f_enu)
+    if data is None:
         return
 
     if not xyz or len(xyz) < 3:
@@ -149,21 +80,8 @@ def read_enu_kin(f_enu, xyz: List[float]):
 
     b, l, h = cart2ell(xyz[0], xyz[1], xyz[2], 'WGS84')
     ell = [math.radians(b), math.radians(l), h]
-
-    data = []
-    for line in lines:
-        info = line.split()
-        if len(info) == 7:
-            mjd = float(info[1])
-            sod = float(info[2])
-            x = float(info[3])
-            y = float(info[4])
-            z = float(info[5])
-            dxyz = [x - xyz[0], y - xyz[1], z - xyz[2]]
-            de, dn, du = dxyz2enu(ell, dxyz)
-            data.append({"mjd": mjd, "sod": sod, "de": de, "dn": dn, "du": du})
-
-    return pd.DataFrame(data)
+    de, dn, du = dxyz2enu(ell, data[['x', 'y', 'z']].to_numpy() - np.asarray(xyz[0:3], dtype=float))
+    return pd.DataFrame({"mjd": data['mjd'], "sod": data['sod'], "de": de, "dn": dn, "du": du})
 
 
 def read_orbdif_old(sats_in, f_name):
@@ -799,111 +717,17 @@ def draw_slromc_points(omc1, omc2, labs="", exc_sites="", save_file=""):
 
 # Residuals analysis
 def read_residuals_sum(sats_in, f_name, intv=300, sites_in=[]):
-    """"Read phase residuals from Panda sum file"""
-    res_all = {}
+    """
+    Read phase residuals from Panda sum file
+    return a dict of 'site', 'sat', 'sec' and 'res': an int16 masked array (site, epoch, satellite),
+    see read_panda_sum; empty dict on failure
+    """
     if len(sats_in) == 0:
         msg = 'The input satellite list is empty!'
         print(msg)
-        return res_all
-
-    try:
-        with open(f_name) as file_object:
-            lines = file_object.readlines()
-    except FileNotFoundError:
-        msg = "Error, the file " + f_name + " does not exist"
-        print(msg)
-        return res_all
-
-    # get the satellites and sites in sum file
-    iflag = 0
-    sites = []
-    sats = []
-    for line in lines:
-        if line.find('NAME') == 1:
-            if iflag == 0:
-                sats = line[15:].replace('\n', '').split()
-                iflag = 1
-                continue
-            else:
-                break
-        if iflag == 1:
-            sites.append(line[1:5])
-
-    if 'SUMM' in sites:
-        sites.remove('SUMM')
-    if len(sats) <= 0:
-        msg = 'No satellite in file!'
-        print(msg)
-        return res_all
-    if len(sites) <= 0:
-        msg = 'No station in file!'
-        print(msg)
-        return res_all
-
-    # get the number of epochs
-    iflag = 0
-    nepo = 0
-    for line in lines:
-        if line.find('EPOCH') == 1:
-            if iflag == 0:
-                iflag = 1
-                continue
-            else:
-                break
-        if iflag == 1:
-            nepo = int(line[0:9])
-
-    if nepo <= 0:
-        msg = 'No epochs in file!'
-        print(msg)
-        return res_all
-
-    ipt0 = 0
-    for i in range(len(lines)):
-        if lines[i].find('Residual of every satellite for each station') >= 0:
-            ipt0 = i
-            break
-
-    if ipt0 == 0:
-        msg = 'Cannot find Residual of every satellite for each station!'
-        print(msg)
-        return res_all
-
-    for isite in range(len(sites)):
-        if len(sites_in) > 0:
-            if not sites[isite] in sites_in:
-                continue
-
-        ipt1 = ipt0 + 1 + isite * 290
-        ipt2 = ipt1 + 289
-        if ipt2 > len(lines):
-            break
-        site_name = lines[ipt1][4:8]
-        if not site_name in sites:
-            msg = 'Wrong station: ' + site_name
-            print(msg)
-            continue
-        res_site = []
-        for i in range(ipt1 + 1, ipt2):
-            new_rec = {}
-            iepo = int(lines[i][0:8])
-            sec = (iepo - 1) * intv
-            new_rec = {'sec': sec}
-            for isat in range(len(sats)):
-                if not sats[isat] in sats_in:
-                    continue
-                res_rec = lines[i][8 * isat + 8:8 * isat + 13].lstrip()
-                if len(res_rec) <= 0:
-                    continue
-                if res_rec.find('*') >= 0:
-                    continue
-                new_rec[sats[isat]] = int(res_rec)
-            res_site.append(new_rec)
-
-        res_site_pd = pd.DataFrame(res_site)
-        res_all[sites[isite]] = res_site_pd
-
-    return res_all
+        return {}
+    res_all = read_panda_sum(f_name, sats_in, sites_in, intv)
+    return res_all if res_all else {}
 
 
 def read_residuals(f_name):
@@ -1017,92 +841,29 @@ def _sat2sys(sat):
     return 'C2' if sat[0] == 'C' and sat < 'C17' else sat[0]
 
 
-def read_daily_upd(files: dict):
-    upd_first = {}
-    data = []
-    ref_sats = {
-        "G":  ["G05", "G08", "G06", "G01", "G30"],
-        "R":  ["R18", "R02", "R03", "R04", "R05"],
-        "E":  ["E01", "E02", "E03", "E04", "E07"],
-        "C":  ["C21", "C22", "C23", "C24", "C25"],
-        "C2": ["C09", "C08", "C11", "C13", "C16"]
-    }
-    for mjd, file in files.items():
-        try:
-            with open(file) as f:
-                lines = f.readlines()
-        except FileNotFoundError:
-            logging.warning(f"file not found {file}")
-            continue
-
-        year, mon, day = mjd2ymd(mjd)
-        cal_time = datetime(year, mon, day)
-        data_tmp = {}
-        for line in lines:
-            if not line.startswith(' '):
-                continue
-            sat, val, sig, nobs, *_ = line.split()
-            data_tmp[sat] = [float(val), float(sig), int(nobs)]
-
-        ref_val = {"G": 0, "R": 0, "E": 0, "C": 0, "C2": 0}
-        for sys, sats in ref_sats.items():
-            for sat in sats:
-                if sat in data_tmp.keys():
-                    ref_val[sys] = data_tmp[sat][0]
-                    break
-            if ref_val[sys] == 0:
-                for sat, vals in data_tmp.items():
-                    if sys == _sat2sys(sat):
-                        ref_val[sys] = vals[0]
-                        break
-
-        for sat, vals in data_tmp.items():
-            vals[0] -= ref_val[_sat2sys(sat)]
-            if not sat in upd_first:
-                if vals[0] > 0.5:
-                    vals[0] -= 1
-                elif vals[0] <= -0.5:
-                    vals[0] += 1
-                upd_first[sat] = vals[0]
-            else:
-                if vals[0] > upd_first[sat] + 0.5:
-                    vals[0] -= 1
-                elif vals[0] < upd_first[sat] - 0.5:
-                    vals[0] += 1
-            data.append({
-                'date': cal_time, 'sat': sat, 'upd': vals[0], 'sig': vals[1],
-                'nobs': vals[2], 'sys': gns_name(sat[0])
-            })
-
-    return pd.DataFrame(data)
+def read_daily_upd(files: dict, store_dir='', kind=''):
+    """
+    read daily UPD files {mjd: file}, re-referenced and unwrapped, satellites in file order
+    with store_dir and kind (wl, ewl...) the files are ingested into the yearly UPD stores and queried from there,
+    the satellites of a day are then sorted by name
+    """
+    if store_dir and kind:
+        update_upd_store(files, store_dir, kind)
+        data = query_upd(store_dir, kind, min(files), max(files), days=list(files))
+    else:
+        frames = [read_upd_file(file, mjd) for mjd, file in files.items()]
+        frames = [dd for dd in frames if dd is not None and not dd.empty]
+        data = upd_table(pd.concat(frames)) if frames else pd.DataFrame()
+    if data.empty:
+        return data
+    return data[['date', 'sat', 'upd', 'sig', 'nobs', 'sys']]
 
 
 def read_epo_upd(file):
-    try:
-        with open(file) as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        logging.warning(f"file not found {file}")
+    data = read_upd_file(file)
+    if data is None or data.empty:
         return pd.DataFrame()
-
-    cal_time = datetime(1970, 1, 1)
-    data = []
-    for line in lines:
-        if not line.startswith(' '):
-            continue
-        if line.startswith(' EPOCH-TIME'):
-            mjd, sod = line[12:].split()
-            year, mon, day = mjd2ymd(int(mjd))
-            hh, mm, ss = sod2hms(sod)
-            cal_time = datetime(year, mon, day, hh, mm, ss)
-        elif len(line) >= 37:
-            sat, val, sig, nobs, *_ = line.split()
-            data.append({
-                'date': cal_time, 'mjd': float(mjd), 'sod': float(sod), 'sat': sat, 'upd': float(val), 'sig': float(sig),
-                'nobs': int(nobs), 'sys': gns_name(sat[0])
-            })
-
-    return pd.DataFrame(data)
+    return upd_table(data, ref_sats=False, unwrap=False)
 
 
 def draw_upd(data, figfile="", figtitle="", grid=True, dform="%H:%M", linestyle='.', dpi=300):
@@ -1,5 +1,8 @@
 import logging
+import sys
 import pandas as pd
+sys.path.append('/home/jqwu/projects/gnss_scripts')
+from funcs import build_rnxo_catalog, read_rnxo_catalog
 
 def get_ant_type(file):
     rec_type = []
@@ -61,6 +64,19 @@ def get_site_list(wkdir, doy0, doy1, site_list='site_list'):
     return pd.DataFrame(tmp)
 
 
+def get_site_catalog(obs_dir, year, doy0, doy1, update=True):
+    """
+    number of days, antenna and receiver of each site between doy0 and doy1 from the RINEX header catalog
+    of obs_dir/yyyy (only new or changed files are scanned when update is True)
+    """
+    cat = build_rnxo_catalog(obs_dir, year) if update else read_rnxo_catalog(obs_dir, year)
+    if cat is None or cat.empty:
+        return pd.DataFrame(columns=['site', 'num', 'ant', 'rec'])
+    cat = cat[(cat.doy >= doy0) & (cat.doy <= doy1)].sort_values('doy')
+    data = cat.groupby('site').agg(num=('doy', 'nunique'), ant=('ant', 'last'), rec=('rec', 'last'))
+    return data.reset_index()
+
+
 if __name__ == '__main__':
     # antenna with five frequency Galileo PCOPCV and triple-frequency GPS PCOPCV
     select_ant = [
@@ -95,27 +111,15 @@ if __name__ == '__main__':
     doy0 = 180
     doy1 = 240
 
-    file = '/home/jqwu/gnss_data/obs_E/2022/180/ant_type'
-    ant = get_ant_type(file)
-
-    file = '/home/jqwu/gnss_data/obs_E/2022/180/rec_type'
-    rec = get_rec_type(file)
-
     # select Galileo sites
-    wkdir='/home/jqwu/gnss_data/obs_E/2022'
-    data_E = get_site_list(wkdir, doy0, doy1, 'site_list')
-    data = pd.merge(data_E, ant)
-    data = pd.merge(data, rec)
+    data = get_site_catalog('/home/jqwu/gnss_data/obs_E', 2022, doy0, doy1)
     data = pd.merge(data, da)
 
     sites_E = list(data[data.num > 56].site.values)
     sites_E.sort()
 
     # selcet GPS sites
-    wkdir='/home/jqwu/gnss_data/obs_G/2022'
-    data_G = get_site_list(wkdir, doy0, doy1, 'site_list')
-    data = pd.merge(data_G, ant)
-    data = pd.merge(data, rec)
+    data = get_site_catalog('/home/jqwu/gnss_data/obs_G', 2022, doy0, doy1)
     data = pd.merge(data, da)
 
     sites_G = list(data[data.num > 56].site.values)
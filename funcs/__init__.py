@@ -2,5 +2,8 @@ from .grt_cmd import *
 from .constants import *
 from .gnss_config import *
 from .gnss_time import *
+from .gnss_cache import *
+from .gnss_compress import *
 from .gnss_files import *
+from .gnss_nav import *
 from .gnss_tools import *
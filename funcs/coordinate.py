@@ -2,7 +2,7 @@
 # ========================= imports =========================
 import numpy as _np
 # ===========================================================
-__all__ = ["ell2cart", "cart2ell","ell2topo"]
+__all__ = ["ell2cart", "cart2ell", "xyz2ell", "ell2topo", "enu_matrix", "xyz2enu", "rtn_matrix", "xyz2rtn"]
 
 class _Ellipsoid:
     def __init__(self,a,b):
@@ -11,6 +11,8 @@ class _Ellipsoid:
         self.f = (a-b)/a # flattening: $f = \frac{a-b}{a}$
         self.e1 = _np.sqrt((a**2-b**2)/a**2) # first eccentricity  : $e   = \sqrt{\frac{a^2-b^2}{a^2}}$
         self.e2 = _np.sqrt((a**2-b**2)/b**2) # second eccentricity : $e^' = \sqrt{\frac{a^2-b^2}{b^2}}$
+        self.e1sq = (a**2-b**2)/a**2
+        self.e2sq = (a**2-b**2)/b**2
     def radiusOfCurvature(self,phi):
         # Meridian radius of curvature (M)
         M = self.a*(1-self.e1**2)/(1-self.e1**2*_np.sin(_np.deg2rad(phi))**2)**(3/2) #$M = \frac{a(1 - e^2)}{(1 - e^2\sin(\phi)^2)^(3/2)}$
@@ -18,12 +20,17 @@ class _Ellipsoid:
         N = self.a/(1-self.e1**2*_np.sin(_np.deg2rad(phi))**2)**(1/2) #$N = \frac{a}{(1 - e^2\sin(\phi)^2)^(1/2)} $
         return M, N
 # -----------------------------------------------------------------------------
+_AXES = {'GRS80'  : [6378137.000, 6356752.314140],
+         'WGS84'  : [6378137.000, 6356752.314245],
+         'Hayford': [6378388.000, 6356911.946000]}
+_ellipsoids = {}
+
 def _ellipsoid(ellipsoidName):
-    axes = {'GRS80'  : [6378137.000, 6356752.314140],
-            'WGS84'  : [6378137.000, 6356752.314245],
-            'Hayford': [6378388.000, 6356911.946000]}[ellipsoidName]
-    a, b = axes[0], axes[1]
-    return _Ellipsoid(a,b)
+    """ ellipsoid constants, built once per name """
+    if ellipsoidName not in _ellipsoids:
+        a, b = _AXES[ellipsoidName]
+        _ellipsoids[ellipsoidName] = _Ellipsoid(a,b)
+    return _ellipsoids[ellipsoidName]
 
 def ell2cart(lat, lon, h, ellipsoid = 'GRS80'):
     """
@@ -41,23 +48,38 @@ def ell2cart(lat, lon, h, ellipsoid = 'GRS80'):
 def cart2ell(x, y, z, ellipsoid = 'GRS80'):
     """
     This function converts 3D cartesian coordinates to geodetic coordinates
+    x, y, z may be scalars or arrays (e.g. all epochs of a kinematic orbit), the latitude of every element is iterated
+    from Bowring's closed-form estimate until it changes by less than 1e-12 rad
     """
-    ellipsoid = _ellipsoid(ellipsoid) # create an ellipsoid instance
+    ellipsoid = _ellipsoid(ellipsoid)
+    x, y, z = _np.asarray(x, dtype=float), _np.asarray(y, dtype=float), _np.asarray(z, dtype=float)
+    a, e1sq = ellipsoid.a, ellipsoid.e1sq
     lon = _np.arctan2(y,x) # $\lambda = \atan\frac{y}{x}$
     p = _np.sqrt(x**2+ y**2) # $p = \sqrt{x^2+y^2}$
-    N_init = ellipsoid.a # initial value of prime vertical radius N
-    h_init = _np.sqrt(x**2 + y**2 + z**2) - _np.sqrt(ellipsoid.a * ellipsoid.b)
-    lat_init = _np.arctan2(z, (1 - N_init * ellipsoid.e1**2 / (N_init + h_init)) * p)
-    while True:
-        N = ellipsoid.a / _np.sqrt(1-(ellipsoid.e1**2 * _np.sin(lat_init)**2))
-        h = (p / _np.cos(lat_init)) - N
-        lat = _np.arctan2(z, (1 - N * ellipsoid.e1**2 / (N + h)) * p)
-        if _np.abs(lat_init - lat) < 1e-8 and _np.abs(h_init - h) < 1e-8:
+    beta = _np.arctan2(a*z, ellipsoid.b*p)
+    lat = _np.arctan2(z+ellipsoid.e2sq*ellipsoid.b*_np.sin(beta)**3, p-e1sq*a*_np.cos(beta)**3)
+    for _ in range(10):
+        sin_lat = _np.sin(lat)
+        w = _np.sqrt(1-e1sq*sin_lat**2)
+        # $h = p\cos\phi + z\sin\phi - a\sqrt{1-e^2\sin^2\phi}$ also holds at the poles
+        h = p*_np.cos(lat) + z*sin_lat - a*w
+        N = a / w
+        lat_new = _np.arctan2(z, (1 - N * e1sq / (N + h)) * p)
+        dlat = _np.abs(lat_new - lat)
+        lat = lat_new
+        if not _np.any(dlat >= 1e-12):
             break
-        lat_init = lat
-        h_init   = h
+    sin_lat = _np.sin(lat)
+    h = p*_np.cos(lat) + z*sin_lat - a*_np.sqrt(1-e1sq*sin_lat**2)
     return _np.rad2deg(lat), _np.rad2deg(lon), h
 
+def xyz2ell(xyz, ellipsoid = 'GRS80'):
+    """
+    Batch version of cart2ell for an (..., 3) array of positions, returns an (..., 3) array of lat, lon (deg) and h
+    """
+    xyz = _np.asarray(xyz, dtype=float)
+    return _np.stack(cart2ell(xyz[..., 0], xyz[..., 1], xyz[..., 2], ellipsoid), axis=-1)
+
 def cart2ell_direct(x, y, z, ellipsoid = 'GRS80'):
     """
     This function converts 3D cartesian coordinates to geodetic coordinates
@@ -85,6 +107,48 @@ def ell2topo(lat, lon, h):
                         [_np.sin(lat)]])
     return (east, north, up)
 
+def enu_matrix(lat, lon):
+    """
+    Rotation matrices from ECEF to the local east/north/up frame of N sites at once
+    lat, lon: scalars or arrays in degrees, returns an (..., 3, 3) array whose rows are the east, north and up axes
+    """
+    lat, lon = _np.deg2rad(_np.asarray(lat, dtype=float)), _np.deg2rad(_np.asarray(lon, dtype=float))
+    sin_lat, cos_lat, sin_lon, cos_lon = _np.sin(lat), _np.cos(lat), _np.sin(lon), _np.cos(lon)
+    rot = _np.empty(lat.shape + (3, 3))
+    rot[..., 0, :] = _np.stack([-sin_lon, cos_lon, _np.zeros_like(lon)], axis=-1)
+    rot[..., 1, :] = _np.stack([-cos_lon*sin_lat, -sin_lon*sin_lat, cos_lat], axis=-1)
+    rot[..., 2, :] = _np.stack([cos_lon*cos_lat, sin_lon*cos_lat, sin_lat], axis=-1)
+    return rot
+
+def xyz2enu(dxyz, lat, lon):
+    """
+    Rotate ECEF coordinate differences into east/north/up
+    dxyz: (epoch, 3) for one site (scalar lat, lon) or (site, epoch, 3) with lat, lon arrays of the sites
+    """
+    rot = enu_matrix(lat, lon)
+    dxyz = _np.asarray(dxyz, dtype=float)
+    if rot.ndim == 2:
+        return _np.einsum('ij,...j->...i', rot, dxyz)
+    return _np.einsum('sij,sej->sei', rot, dxyz)
+
+def rtn_matrix(pos, vel):
+    """
+    Rotation matrices from ECEF (or inertial) to the radial/along-track/cross-track frame of an orbit
+    pos, vel: (..., 3) arrays, returns an (..., 3, 3) array whose rows are the radial, along and cross axes
+    """
+    pos, vel = _np.asarray(pos, dtype=float), _np.asarray(vel, dtype=float)
+    radial = pos / _np.linalg.norm(pos, axis=-1, keepdims=True)
+    cross = _np.cross(pos, vel)
+    cross /= _np.linalg.norm(cross, axis=-1, keepdims=True)
+    along = _np.cross(cross, radial)
+    return _np.stack([radial, along, cross], axis=-2)
+
+def xyz2rtn(dxyz, pos, vel):
+    """
+    Rotate orbit differences dxyz (..., 3) into radial/along/cross, with the reference orbit pos, vel of the same shape
+    """
+    return _np.einsum('...ij,...j->...i', rtn_matrix(pos, vel), _np.asarray(dxyz, dtype=float))
+
 def geocentric_latitude(geodetic_latitude, ellipsoid = 'GRS80'):
     """ Converts geodetic latitude to geocentric latitude """
     ell = _ellipsoid(ellipsoid)
@@ -0,0 +1,343 @@
+import os
+import json
+import logging
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from functools import wraps
+from collections import OrderedDict
+
+__all__ = ['cached_reader', 'set_file_cache', 'clear_file_cache', 'cache_dir', 'load_file_index', 'save_file_index',
+           'save_frame', 'load_frame', 'save_arrays']
+
+# bump when the on-disk layout changes, all old entries are then ignored
+_CACHE_FORMAT = 1
+
+_cache_opt = {
+    'enabled': os.environ.get('GNSS_CACHE', '1').lower() not in ('0', 'no', 'off', 'false'),
+    'memory': 16,
+    'disk': True,
+    'dir': os.environ.get('GNSS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'gnss_scripts')),
+    'max_size': float(os.environ.get('GNSS_CACHE_SIZE', 2048)) * 1024 * 1024
+}
+_mem_cache = OrderedDict()
+
+
+def set_file_cache(enabled=None, memory=None, disk=None, path=None, max_size=None):
+    """
+    Configure the parsed-file cache
+    enabled: False to bypass the cache entirely; memory: number of tables kept in memory (0 to disable)
+    disk: use the on-disk tier; path: cache directory; max_size: on-disk size limit in MB
+    """
+    if enabled is not None:
+        _cache_opt['enabled'] = bool(enabled)
+    if memory is not None:
+        _cache_opt['memory'] = int(memory)
+        while len(_mem_cache) > _cache_opt['memory']:
+            _mem_cache.popitem(last=False)
+    if disk is not None:
+        _cache_opt['disk'] = bool(disk)
+    if path is not None:
+        _cache_opt['dir'] = path
+    if max_size is not None:
+        _cache_opt['max_size'] = float(max_size) * 1024 * 1024
+
+
+def cache_dir(sub=''):
+    """ return (and create) the cache directory, or a sub directory of it """
+    path = os.path.join(_cache_opt['dir'], sub) if sub else _cache_opt['dir']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def clear_file_cache(disk=True):
+    """ drop all cached tables from memory and optionally from disk """
+    _mem_cache.clear()
+    if not disk or not os.path.isdir(_cache_opt['dir']):
+        return
+    for name in os.listdir(_cache_opt['dir']):
+        if name.endswith('.npz'):
+            try:
+                os.remove(os.path.join(_cache_opt['dir'], name))
+            except OSError:
+                pass
+
+
+def _file_identity(files):
+    """ (path, size, mtime) of the input file(s), None if any is missing """
+    if isinstance(files, (str, os.PathLike)):
+        files = [files]
+    ident = []
+    for file in files:
+        try:
+            st = os.stat(file)
+        except (OSError, TypeError):
+            return None
+        ident.append([os.path.abspath(file), st.st_size, st.st_mtime_ns])
+    return ident
+
+
+def _arg_repr(arg):
+    """ stable text of a reader argument, None if it has no stable representation """
+    if hasattr(arg, 'mjd') and hasattr(arg, 'sod'):
+        return f'{type(arg).__name__}({arg.mjd!r}, {arg.sod!r})'
+    if isinstance(arg, (list, tuple, set)):
+        items = [_arg_repr(x) for x in (sorted(arg, key=repr) if isinstance(arg, set) else arg)]
+        return None if None in items else f"[{', '.join(items)}]"
+    if isinstance(arg, (pd.Series, pd.Index)):
+        arg = arg.to_numpy()
+    if isinstance(arg, np.ndarray):
+        # the repr of large arrays is abbreviated, hash the data instead
+        if arg.dtype.hasobject:
+            return None
+        digest = hashlib.sha1(np.ascontiguousarray(arg).tobytes()).hexdigest()
+        return f'ndarray({arg.dtype.str}, {arg.shape}, {digest})'
+    text = repr(arg)
+    return None if ' at 0x' in text or '...' in text else text
+
+
+def _cache_key(name, version, ident, args, kwargs):
+    """ hash of reader, version, file identity and arguments, None if an argument cannot be hashed """
+    text = [_arg_repr(x) for x in args] + [_arg_repr(kwargs[k]) for k in sorted(kwargs)]
+    if None in text:
+        return None
+    text = json.dumps([_CACHE_FORMAT, name, version, ident, text, sorted(kwargs)])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _df2arrays(data):
+    """ split a DataFrame into plain numpy arrays, None if a column cannot be stored without pickle """
+    arrays = {}
+    meta = {'columns': [], 'index': False}
+    for i, col in enumerate(data.columns):
+        if not isinstance(col, str):
+            return None
+        ser = data[col]
+        if isinstance(ser.dtype, pd.CategoricalDtype):
+            cats = ser.cat.categories
+            if cats.dtype.kind not in 'OU' and not pd.api.types.is_string_dtype(cats.dtype):
+                return None
+            arrays[f'c{i}'] = ser.cat.codes.to_numpy()
+            arrays[f'k{i}'] = np.asarray(cats.astype(str), dtype=str)
+            meta['columns'].append([col, 'category', str(cats.dtype)])
+        elif pd.api.types.is_string_dtype(ser.dtype):
+            if ser.isna().any() or not all(isinstance(x, str) for x in ser):
+                return None
+            arrays[f'c{i}'] = ser.to_numpy(dtype=str)
+            meta['columns'].append([col, 'str', str(ser.dtype)])
+        elif isinstance(ser.dtype, np.dtype) and ser.dtype.kind in 'biufcmM':
+            arrays[f'c{i}'] = ser.to_numpy()
+            meta['columns'].append([col, 'num', str(ser.dtype)])
+        else:
+            return None
+    if not isinstance(data.index, pd.RangeIndex) or data.index.start != 0 or data.index.step != 1:
+        if data.index.dtype.kind not in 'iu':
+            return None
+        arrays['index'] = data.index.to_numpy()
+        meta['index'] = True
+    arrays['meta'] = np.array(json.dumps(meta))
+    return arrays
+
+
+def _arrays2df(arrays):
+    meta = json.loads(str(arrays['meta']))
+    data = {}
+    for i, (col, kind, dtype) in enumerate(meta['columns']):
+        val = arrays[f'c{i}']
+        if kind == 'category':
+            data[col] = pd.Categorical.from_codes(val, pd.Index(arrays[f'k{i}'].astype(object), dtype=dtype))
+        elif kind == 'str':
+            data[col] = pd.Series(val.astype(object), dtype=dtype)
+        else:
+            data[col] = val
+    data = pd.DataFrame(data)
+    if meta['index']:
+        data.index = arrays['index']
+    return data
+
+
+def _disk_load(key):
+    f_npz = os.path.join(_cache_opt['dir'], f'{key}.npz')
+    if not os.path.isfile(f_npz):
+        return None
+    try:
+        with np.load(f_npz, allow_pickle=False) as arrays:
+            data = _arrays2df(arrays)
+        os.utime(f_npz)
+        return data
+    except Exception as e:
+        logging.warning(f"drop broken cache file {f_npz}: {e}")
+        try:
+            os.remove(f_npz)
+        except OSError:
+            pass
+        return None
+
+
+def _write_npz(path, name, arrays):
+    """ write arrays to path/name atomically, return False on failure """
+    f_tmp = ''
+    try:
+        os.makedirs(path, exist_ok=True)
+        fd, f_tmp = tempfile.mkstemp(suffix='.tmp', dir=path)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(f_tmp, os.path.join(path, name))
+    except OSError as e:
+        logging.warning(f"cannot write cache file in {path}: {e}")
+        if f_tmp and os.path.isfile(f_tmp):
+            os.remove(f_tmp)
+        return False
+    return True
+
+
+def _disk_save(key, data):
+    arrays = _df2arrays(data)
+    if arrays is None:
+        return
+    if _write_npz(_cache_opt['dir'], f'{key}.npz', arrays):
+        _disk_evict()
+
+
+def _disk_evict():
+    """ remove the least recently used entries until the cache fits into max_size """
+    entries = []
+    total = 0
+    with os.scandir(_cache_opt['dir']) as it:
+        for entry in it:
+            if not entry.name.endswith('.npz'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= _cache_opt['max_size']:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= _cache_opt['max_size']:
+            break
+
+
+def _index_file(kind, f_name):
+    name = hashlib.sha1(os.path.abspath(f_name).encode()).hexdigest()
+    return os.path.join(_cache_opt['dir'], kind, f'{name}.npz')
+
+
+def load_file_index(kind, f_name):
+    """
+    Load the sidecar index of a file saved by save_file_index
+    return a dict of arrays, None if there is no index, the file has changed (size/mtime) or the cache is disabled
+    """
+    if not _cache_opt['enabled'] or not _cache_opt['disk']:
+        return None
+    f_idx = _index_file(kind, f_name)
+    try:
+        st = os.stat(f_name)
+        with np.load(f_idx, allow_pickle=False) as arrays:
+            if int(arrays['_size']) != st.st_size or int(arrays['_mtime']) != st.st_mtime_ns:
+                return None
+            return {key: arrays[key] for key in arrays.files if not key.startswith('_')}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_file_index(kind, f_name, **arrays):
+    """ save a sidecar index (numpy arrays) of a file in the cache directory, stamped with its size and mtime """
+    if not _cache_opt['enabled'] or not _cache_opt['disk']:
+        return
+    try:
+        st = os.stat(f_name)
+    except OSError:
+        return
+    f_idx = _index_file(kind, f_name)
+    _write_npz(os.path.dirname(f_idx), os.path.basename(f_idx),
+               dict(arrays, _size=np.array(st.st_size), _mtime=np.array(st.st_mtime_ns)))
+
+
+def save_frame(f_name, data):
+    """ save a DataFrame of numbers and strings to a compact .npz file (no pickle), return False on failure """
+    arrays = _df2arrays(data)
+    if arrays is None:
+        logging.warning(f"cannot save table to {f_name}: unsupported columns")
+        return False
+    path, name = os.path.split(os.path.abspath(f_name))
+    if not _write_npz(path, name, arrays):
+        return False
+    # temporary files are private, the table is meant to be shared like the data next to it
+    os.chmod(f_name, 0o644)
+    return True
+
+
+def save_arrays(f_name, **arrays):
+    """ save numpy arrays to a compressed .npz file (no pickle), return False on failure """
+    path, name = os.path.split(os.path.abspath(f_name))
+    if not _write_npz(path, name, arrays):
+        return False
+    os.chmod(f_name, 0o644)
+    return True
+
+
+def load_frame(f_name):
+    """ load a DataFrame saved by save_frame, None if the file is missing or broken """
+    try:
+        with np.load(f_name, allow_pickle=False) as arrays:
+            return _arrays2df(arrays)
+    except FileNotFoundError:
+        return None
+    except (OSError, KeyError, ValueError) as e:
+        logging.warning(f"cannot read table {f_name}: {e}")
+        return None
+
+
+def _mem_put(key, data):
+    if _cache_opt['memory'] <= 0:
+        return
+    _mem_cache[key] = data
+    _mem_cache.move_to_end(key)
+    while len(_mem_cache) > _cache_opt['memory']:
+        _mem_cache.popitem(last=False)
+
+
+def cached_reader(version=1):
+    """
+    Decorator for file readers whose first argument is a file name (or a list of file names)
+    DataFrame results are cached in memory and on disk, keyed by path, size, mtime, reader version and arguments
+    bump version whenever the output of the reader changes
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(files, *args, **kwargs):
+            if not _cache_opt['enabled']:
+                return func(files, *args, **kwargs)
+            ident = _file_identity(files)
+            if ident is None:
+                return func(files, *args, **kwargs)
+            key = _cache_key(f'{func.__module__}.{func.__qualname__}', version, ident, args, kwargs)
+            if key is None:
+                return func(files, *args, **kwargs)
+            if key in _mem_cache:
+                _mem_cache.move_to_end(key)
+                return _mem_cache[key].copy()
+            if _cache_opt['disk']:
+                data = _disk_load(key)
+                if data is not None:
+                    _mem_put(key, data)
+                    return data.copy()
+            data = func(files, *args, **kwargs)
+            if not isinstance(data, pd.DataFrame):
+                return data
+            _mem_put(key, data.copy())
+            if _cache_opt['disk']:
+                _disk_save(key, data)
+            return data
+        return wrapper
+    return decorator
@@ -0,0 +1,387 @@
+import io
+import os
+import re
+import gzip
+import shutil
+import logging
+import tempfile
+
+__all__ = ['open_gnss_file', 'is_compressed', 'copy_gnss_file']
+
+_MAGIC_GZIP = b'\x1f\x8b'
+_MAGIC_LZW = b'\x1f\x9d'
+_CHUNK_SIZE = 1 << 16
+# suffixes of files that are kept compressed when staged
+_COMPRESSED_NAME = re.compile(r'(\.gz|\.Z|\.crx|\.\d\dd)$', re.IGNORECASE)
+
+
+class _ChunkReader(io.RawIOBase):
+    """ raw binary stream over an iterator of bytes chunks """
+
+    def __init__(self, chunks, close_fn=None):
+        self._chunks = iter(chunks)
+        self._buf = b''
+        self._close_fn = close_fn
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            self._buf = next(self._chunks, None)
+            if self._buf is None:
+                self._buf = b''
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed and self._close_fn is not None:
+            self._close_fn()
+        super().close()
+
+
+def _unlzw(data):
+    """
+    Decode the data of a unix compress (.Z) file, yield the output in chunks
+    (LZW with 9 to maxbits bit codes, codes are read in groups of 8 which are skipped when the code size changes)
+    """
+    if len(data) < 3 or data[0:2] != _MAGIC_LZW:
+        raise ValueError('not in unix compress (.Z) format')
+    maxbits = data[2] & 0x1f
+    block_mode = data[2] & 0x80
+    if maxbits < 9 or maxbits > 16:
+        raise ValueError(f'invalid maximum code size {maxbits} of .Z data')
+    maxmaxcode = 1 << maxbits
+    data = bytes(data) + b'\x00\x00\x00'
+    total = (len(data) - 3) * 8
+
+    table = [bytes([i]) for i in range(256)] + [b''] * (maxmaxcode - 256)
+    n_bits = 9
+    maxcode = (1 << n_bits) - 1
+    mask = maxcode
+    free_ent = 257 if block_mode else 256
+    origin = pos = 24
+    prev = b''
+    out = []
+    nout = 0
+    while pos + n_bits <= total:
+        if free_ent > maxcode and n_bits < maxbits:
+            # skip the rest of the group of 8 codes and increase the code size
+            group = n_bits * 8
+            pos = origin + -(-(pos - origin) // group) * group
+            origin = pos
+            n_bits += 1
+            maxcode = maxmaxcode if n_bits == maxbits else (1 << n_bits) - 1
+            mask = (1 << n_bits) - 1
+            continue
+        i = pos >> 3
+        code = (int.from_bytes(data[i:i + 3], 'little') >> (pos & 7)) & mask
+        pos += n_bits
+        if not prev:
+            if code >= 256:
+                raise ValueError('corrupted .Z data')
+            prev = table[code]
+            out.append(prev)
+            continue
+        if code == 256 and block_mode:
+            group = n_bits * 8
+            pos = origin + -(-(pos - origin) // group) * group
+            origin = pos
+            n_bits = 9
+            maxcode = mask = (1 << n_bits) - 1
+            free_ent = 256
+            continue
+        if code < free_ent:
+            entry = table[code]
+        elif code == free_ent:
+            entry = prev + prev[:1]
+        else:
+            raise ValueError('corrupted .Z data')
+        out.append(entry)
+        nout += len(entry)
+        if free_ent < maxmaxcode:
+            table[free_ent] = prev + entry[:1]
+            free_ent += 1
+        prev = entry
+        if nout > _CHUNK_SIZE:
+            yield b''.join(out)
+            out = []
+            nout = 0
+    if out:
+        yield b''.join(out)
+
+
+def _crx_repair(old, new):
+    """ recover a text line from its difference to the previous one (' ': unchanged, '&': blank) """
+    if len(new) < len(old):
+        chars = list(old)
+        for i, c in enumerate(new):
+            if c != ' ':
+                chars[i] = ' ' if c == '&' else c
+        return ''.join(chars)
+    chars = list(new.replace('&', ' '))
+    for i, c in enumerate(new[:len(old)]):
+        if c == ' ':
+            chars[i] = old[i]
+    return ''.join(chars)
+
+
+def _crx_format(val, ndec, width):
+    """ format an integer value scaled by 10**ndec in the way of CRX2RNX (no leading zero: -.123) """
+    scale = 10 ** ndec
+    num = abs(val)
+    text = f"{'-' if val < 0 else ''}{num // scale if num >= scale else ''}.{num % scale:0{ndec}d}"
+    return f'{text:>{width}s}'
+
+
+def _crx_update(state, dval):
+    """
+    update the difference state [order, arc_order, y0, y1, ...] of an arc with a new difference value in place,
+    y0 is the highest order difference and y[order] the value, return the recovered value
+    """
+    order = state[0]
+    if order < state[1]:
+        # the arc is still growing to its maximum difference order
+        state[0] = order = order + 1
+        state.append(0)
+        old = state[2]
+        state[2] = dval
+        for k in range(3, order + 3):
+            old, state[k] = state[k], state[k - 1] + old
+    else:
+        state[2] = dval
+        for k in range(3, order + 3):
+            state[k] += state[k - 1]
+    return state[-1]
+
+
+def _crx_lines(lines):
+    """ decode Compact RINEX (Hatanaka, CRINEX 1.0/3.0) text lines to RINEX lines """
+    lines = (line.rstrip('\r\n') for line in lines)
+    nline = 0
+
+    def next_line():
+        nonlocal nline
+        nline += 1
+        line = next(lines, None)
+        if line is None:
+            raise EOFError
+        return line
+
+    line = next_line()
+    if line[60:80] != 'CRINEX VERS   / TYPE' or line[0:3] not in ('1.0', '3.0'):
+        raise ValueError('not in Compact RINEX format')
+    crx_ver = int(line[0])
+    next_line()
+
+    ntype = 0
+    ntype_gnss = {}
+
+    def header_line(text):
+        nonlocal ntype
+        label = text[60:80]
+        if label.startswith('# / TYPES OF OBSERV') and text[5] != ' ':
+            ntype = int(text[0:6])
+        elif label.startswith('SYS / # / OBS TYPES') and text[0] != ' ':
+            ntype_gnss[text[0]] = int(text[3:6])
+        return text.rstrip() + '\n'
+
+    line = next_line()
+    rnx_ver = int(line[5])
+    yield header_line(line)
+    while line[60:73] != 'END OF HEADER':
+        line = next_line()
+        yield header_line(line)
+
+    if rnx_ver == 2:
+        ep_from, ep_to, i_event, i_nsat, i_sat, ndec_clk, w_clk = '&', ' ', 28, 29, 32, 9, 12
+    else:
+        ep_from, ep_to, i_event, i_nsat, i_sat, ndec_clk, w_clk = '>', '>', 31, 32, 41, 12, 15
+
+    epo_line = ''
+    clk = [-1, -1]
+    sats_old = {}
+    try:
+        while True:
+            dline = next_line()
+            while crx_ver == 3 and dline.startswith('&'):
+                dline = next_line()
+            if dline.startswith('\032'):
+                break
+            if dline.startswith(ep_from):
+                dline = ep_to + dline[1:]
+                # special event records are copied
+                while dline[i_event:i_event + 1] not in ('0', '1'):
+                    yield dline.rstrip() + '\n'
+                    nrec = int(dline[i_event + 1:i_event + 4] or 0) if len(dline) > 29 else 0
+                    for _ in range(nrec):
+                        yield header_line(next_line())
+                    dline = next_line()
+                    while crx_ver == 3 and dline.startswith('&'):
+                        dline = next_line()
+                    if not dline.startswith(ep_from):
+                        raise ValueError(f'epoch not initialized after an event at line {nline}')
+                    dline = ep_to + dline[1:]
+                epo_line = ''
+                sats_old = {}
+            epo_line = _crx_repair(epo_line, dline).rstrip()
+            if not epo_line.startswith(ep_to) or len(epo_line) < i_sat - 6:
+                raise ValueError(f'invalid epoch line at line {nline}')
+            nsat = int(epo_line[i_nsat:i_nsat + 3])
+            sats = [epo_line[i_sat + 3 * i:i_sat + 3 * i + 3] for i in range(nsat)]
+
+            # receiver clock offset
+            dline = next_line()
+            if dline:
+                if len(dline) > 1 and dline[1] == '&':
+                    clk = [-1, int(dline[0])]
+                    dline = dline[2:]
+                elif clk[1] < 0:
+                    raise ValueError(f'clock offset not initialized at line {nline}')
+                str_clk = _crx_format(_crx_update(clk, int(dline)), ndec_clk, w_clk)
+            else:
+                clk = [-1, clk[1]]
+                str_clk = ''
+
+            out = []
+            if rnx_ver == 2:
+                out.append((f'{epo_line:<68.68s}' + str_clk if str_clk else epo_line[0:68]).rstrip() + '\n')
+                for k in range(68, len(epo_line), 36):
+                    out.append(' ' * 32 + epo_line[k:k + 36] + '\n')
+            else:
+                out.append((f'{epo_line:<41.41s}' + str_clk if str_clk else epo_line[0:41].rstrip()) + '\n')
+
+            sats_new = {}
+            for sat in sats:
+                nt = ntype if rnx_ver == 2 else ntype_gnss.get(sat[0], -1)
+                if nt < 0:
+                    raise ValueError(f'unknown satellite system {sat} at line {nline}')
+                dline = next_line()
+                fields = dline.split(' ', nt)
+                dflag = fields[nt] if len(fields) > nt else ''
+                fields = fields[0:nt] + [''] * (nt - len(fields))
+                old = sats_old.get(sat)
+                if old is None:
+                    states = [None] * nt
+                    flag = '' if rnx_ver >= 3 else f'{dflag:<{nt * 2}s}'
+                else:
+                    states, flag = old
+                    if len(states) < nt:
+                        states = states + [None] * (nt - len(states))
+                flag = _crx_repair(flag, dflag)
+                flag = f'{flag:<{nt * 2}s}'
+                new_states = []
+                text = sat if rnx_ver >= 3 else ''
+                for j, field in enumerate(fields):
+                    if not field:
+                        new_states.append(None)
+                        if crx_ver == 1:
+                            flag = flag[0:j * 2] + '  ' + flag[j * 2 + 2:]
+                            text += ' ' * 16
+                        else:
+                            text += ' ' * 14 + flag[j * 2:j * 2 + 2]
+                    else:
+                        if len(field) > 1 and field[1] == '&':
+                            state = [0, int(field[0]), int(field[2:])]
+                            val = state[2]
+                        else:
+                            state = states[j]
+                            if state is None:
+                                raise ValueError(f'data arc of {sat} not initialized at line {nline}')
+                            val = _crx_update(state, int(field))
+                        new_states.append(state)
+                        if -1000 < val < 1000:
+                            text += _crx_format(val, 3, 14) + flag[j * 2:j * 2 + 2]
+                        else:
+                            text += f'{val / 1000:14.3f}' + flag[j * 2:j * 2 + 2]
+                    if j + 1 == nt or (rnx_ver == 2 and (j + 1) % 5 == 0):
+                        out.append(text.rstrip() + '\n')
+                        text = ''
+                sats_new[sat] = (new_states, flag)
+            sats_old = sats_new
+            yield ''.join(out)
+    except EOFError:
+        return
+
+
+def _line_chunks(lines):
+    """ group text lines into encoded chunks """
+    buf = []
+    size = 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size > _CHUNK_SIZE:
+            yield ''.join(buf).encode()
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf).encode()
+
+
+def _is_crx(stream):
+    return b'CRINEX VERS' in stream.peek(80)[0:80].split(b'\n')[0]
+
+
+def open_gnss_file(f_name, mode='r'):
+    """
+    Open a GNSS file for reading, gzip (.gz), unix compress (.Z) and Hatanaka (Compact RINEX) files are
+    detected by their content and decoded while streaming
+    mode: 'r' (text) or 'rb' (binary)
+    """
+    f = open(f_name, 'rb')
+    try:
+        magic = f.peek(2)[0:2]
+        if magic == _MAGIC_GZIP:
+            f.close()
+            stream = gzip.open(f_name, 'rb')
+        elif magic == _MAGIC_LZW:
+            data = f.read()
+            f.close()
+            stream = io.BufferedReader(_ChunkReader(_unlzw(data)), _CHUNK_SIZE)
+        else:
+            stream = f
+        if _is_crx(stream):
+            text = io.TextIOWrapper(stream, encoding='ascii', errors='replace')
+            stream = io.BufferedReader(_ChunkReader(_line_chunks(_crx_lines(text)), text.close), _CHUNK_SIZE)
+    except Exception:
+        f.close()
+        raise
+    if mode == 'rb':
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+def is_compressed(f_name):
+    """ True if the file is gzip, unix compress or Hatanaka compressed """
+    with open(f_name, 'rb') as f:
+        head = f.peek(80)[0:80]
+    return head[0:2] in (_MAGIC_GZIP, _MAGIC_LZW) or b'CRINEX VERS' in head.split(b'\n')[0]
+
+
+def copy_gnss_file(f_src, f_dst):
+    """
+    Copy a GNSS file, compressed sources are decoded on the fly unless the target name is a compressed one
+    the target is written to a temporary file first and renamed when complete
+    """
+    if os.path.abspath(f_src) == os.path.abspath(f_dst):
+        raise shutil.SameFileError(f'{f_src} and {f_dst} are the same file')
+    if _COMPRESSED_NAME.search(f_dst) or not is_compressed(f_src):
+        shutil.copy(f_src, f_dst)
+        return
+    path = os.path.dirname(os.path.abspath(f_dst))
+    fd, f_tmp = tempfile.mkstemp(suffix='.tmp', dir=path)
+    try:
+        with open_gnss_file(f_src, 'rb') as fin, os.fdopen(fd, 'wb') as fout:
+            shutil.copyfileobj(fin, fout, _CHUNK_SIZE)
+        # mkstemp creates a private file, keep the permissions of the source like shutil.copy
+        shutil.copymode(f_src, f_tmp)
+        os.replace(f_tmp, f_dst)
+    except Exception:
+        if os.path.isfile(f_tmp):
+            os.remove(f_tmp)
+        raise
+    logging.debug(f"decompressed {f_src} to {f_dst}")
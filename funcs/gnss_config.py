@@ -3,15 +3,17 @@ import configparser
 import shutil
 import logging
 import math
+import zlib
 import platform
 import xml.etree.ElementTree as ET
 from typing import List
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
 from . import gnss_files as gf
 from . import gnss_tools as gt
 from .gnss_time import GnssTime
-from .constants import gns_name, gns_id, gns_sat, gns_band, gns_sig, leo_df, site_namelong
+from .constants import gns_name, gns_id, gns_sat, gns_band, gns_sig, leo_df, site_namelong, MAX_THREAD
+from .gnss_compress import copy_gnss_file
 
 default_process = {
     'apply_carrier_range': 'false',
@@ -34,6 +36,24 @@ default_ambiguity = {
 }
 
 
+def _stage_file(f_src, f_dst):
+    """ copy (and decode) one source file to the process directory, return the source name if done """
+    try:
+        copy_gnss_file(f_src, f_dst)
+    except FileNotFoundError:
+        logging.warning(f'copy failed! file not found {f_src}')
+        return
+    except shutil.SameFileError:
+        logging.warning(f'copy failed! files are same {f_src}')
+        return
+    except (OSError, ValueError, IndexError, EOFError, zlib.error) as e:
+        # truncated gzip data raises EOFError, corrupted deflate data zlib.error, the .Z and Hatanaka decoders
+        # ValueError (IndexError for a malformed Hatanaka header)
+        logging.warning(f'copy failed! cannot decode {f_src}: {e}')
+        return
+    return os.path.basename(f_src)
+
+
 class GnssConfig:
 
     def __init__(self, conf):
@@ -810,7 +830,7 @@ class GnssConfig:
 
     def copy_sys_data(self):
         """ copy source_files to process_files """
-        f_rst = []
+        jobs = []
         for f_type in self.config.options('source_files'):
             if self.upd_mode == 'OSB' and f_type.startswith('upd'):
                 continue
@@ -837,17 +857,11 @@ class GnssConfig:
             if len(fs_src) != len(fs_src):
                 logging.warning(f"Number of source files ({f_type}, {len(fs_src)}) is not equal to target "
                                 f"files ({len(fs_dst)})")
+            jobs.extend(zip(fs_src, fs_dst))
 
-            for f1, f2 in zip(fs_src, fs_dst):
-                try:
-                    shutil.copy(f1, f2)
-                except FileNotFoundError:
-                    logging.warning(f'copy failed! file not found {f1}')
-                    continue
-                except shutil.SameFileError:
-                    logging.warning(f'copy failed! files are same {f1}')
-                    continue
-                f_rst.append(os.path.basename(f1))
+        # compressed sources (gzip, .Z, Hatanaka) are decoded while copying
+        with ThreadPoolExecutor(max_workers=MAX_THREAD) as executor:
+            f_rst = [f for f in executor.map(lambda job: _stage_file(*job), jobs) if f]
         if f_rst:
             if len(f_rst) > 6:
                 logging.info(f"files copied to work directory: {', '.join(f_rst[0:6])} ...")
@@ -1055,39 +1069,28 @@ class GnssConfig:
 
     def get_xml_receiver(self, use_res_crd=False) -> ET.Element:
         receiver = ET.Element('receiver')
-        # get coordinates from IGS snx file
-        crd_data = gt.get_crd_snx(self.get_xml_file_str('sinex', check=True), self.site_list)
-        # get coordinates from GREAT residuals file
+        # get coordinates from IGS snx file (indexed once per file)
+        f_snx = self.get_xml_file_str('sinex', check=True).split()
+        info = gt.snx_receiver_info(self.site_list, f_snx)
+        # get coordinates from GREAT residuals file for the sites missing in snx
         if use_res_crd:
             f_res = self.get_xml_file('recover', check=True)
             if f_res:
                 crd_res = gt.get_crd_res(f_res[0], self.site_list)
-                # crd_data = crd_data.append(crd_res)
-                crd_data = pd.concat([crd_data, crd_res])
-        if crd_data.empty:
-            return receiver
+                if not crd_res.empty:
+                    crd_res = crd_res.drop_duplicates(['site', 'type']).pivot(index='site', columns='type', values='val')
+                    crd_res = crd_res.reindex(columns=['crd_x', 'crd_y', 'crd_z']).dropna()
+                    snx = (gf.snx_site_index(f_snx[0]) if f_snx else None) or {}
+                    for site, xyz in zip(crd_res.index, crd_res.to_numpy()):
+                        if site in info:
+                            continue
+                        rec = snx.get(site, {})
+                        info[site] = gt.receiver_attrib(site, xyz, [0.001] * 3, 'RES',
+                                                        rec=rec.get('rec', ''), ant=rec.get('ant', ''))
         # get receiver elements
         for site in self.site_list:
-            df = crd_data[crd_data.site == site]
-            df_x = df[df.type == 'crd_x'].sort_values(by=['obj'], ascending=False)
-            df_y = df[df.type == 'crd_y'].sort_values(by=['obj'], ascending=False)
-            df_z = df[df.type == 'crd_z'].sort_values(by=['obj'], ascending=False)
-            if df_x.empty or df_y.empty or df_z.empty:
-                continue
-            info = {
-                'X': f'{df_x.val.values[0]:20.8f}',
-                'Y': f'{df_y.val.values[0]:20.8f}',
-                'Z': f'{df_z.val.values[0]:20.8f}',
-                'dX': f'{df_x.sig.values[0]:8.4f}',
-                'dY': f'{df_y.sig.values[0]:8.4f}',
-                'dZ': f'{df_z.sig.values[0]:8.4f}',
-                'id': site.upper(), 'obj': df_x.obj.values[0]
-            }
-            if not df[df.type == 'rec'].empty:
-                info['rec'] = df[df.type == 'rec']['val'].values[0]
-            if not df[df.type == 'ant'].empty:
-                info['ant'] = df[df.type == 'ant']['val'].values[0]
-            ET.SubElement(receiver, 'rec', attrib=info)
+            if site in info:
+                ET.SubElement(receiver, 'rec', attrib=info[site])
 
         return receiver
 
@@ -4,9 +4,18 @@ import pandas as pd
 import os
 import logging
 import math
-import datetime
-from .gnss_time import GnssTime, hms2sod, sod2hms
-from .constants import gns_name, leo_df
+import glob
+import mmap
+import re
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from .gnss_time import GnssTime, GnssTimeArray, hms2sod, ymd2mjd, mjd2ydoy
+from .constants import gns_name, leo_df, MAX_THREAD
+from .gnss_cache import cached_reader, load_file_index, save_file_index, load_frame, save_frame, save_arrays
+from .gnss_compress import open_gnss_file, is_compressed
 
 
 def read_site_list(f_list):
@@ -20,48 +29,133 @@ def read_site_list(f_list):
         return
 
 
-def read_sp3_file(f_sp3):
+def _read_buffer(f_name):
+    """ read the whole file as one uint8 buffer, compressed files are decoded """
+    with open_gnss_file(f_name, 'rb') as f:
+        return np.frombuffer(f.read(), dtype=np.uint8)
+
+
+def _line_index(buf):
+    """ return the start and end (without line break) positions of all lines in a buffer """
+    nl = np.flatnonzero(buf == 10)
+    starts = np.concatenate(([0], nl + 1))
+    ends = np.concatenate((nl, [len(buf)]))
+    if starts[-1] == len(buf):
+        starts, ends = starts[:-1], ends[:-1]
+    if len(buf) > 0:
+        ends = ends - ((ends > starts) & (buf[np.maximum(ends - 1, 0)] == 13))
+    return starts, ends
+
+
+def _startswith(buf, starts, ends, prefix):
+    """ mask of the lines beginning with prefix (bytes) """
+    mask = (ends - starts) >= len(prefix)
+    for k, c in enumerate(prefix):
+        idx = np.minimum(starts + k, len(buf) - 1)
+        mask &= buf[idx] == c
+    return mask
+
+
+def _fixed_field(buf, starts, ends, beg, end):
+    """ columns [beg, end) of the selected lines as a fixed-width bytes array, padded with blanks """
+    width = end - beg
+    out = np.full((len(starts), width), 32, dtype=np.uint8)
+    if len(buf) == 0 or len(starts) == 0:
+        return out.view(f'S{width}').ravel()
+    # rows are copied from a sliding window view of the buffer, the few ones reaching its end are copied one by one
+    pos = starts + beg
+    inner = pos + width <= len(buf)
+    if len(buf) >= width:
+        out[inner] = sliding_window_view(buf, width)[pos[inner]]
+    for i in np.flatnonzero(~inner):
+        seg = buf[pos[i]:]
+        out[i, :len(seg)] = seg
+    # blank the characters after the end of short lines
+    nchar = ends - pos
+    if (nchar < width).any():
+        out[np.arange(width) >= nchar[:, None]] = 32
+    return out.view(f'S{width}').ravel()
+
+
+def _blank_field(field):
+    """ mask of the fixed-width fields containing only blanks """
+    chars = field.view(np.uint8).reshape(len(field), field.dtype.itemsize)
+    return np.all((chars == 32) | (chars == 0), axis=1)
+
+
+def _to_float(field):
+    """ convert a fixed-width bytes array to float, blank fields are NaN """
+    blank = _blank_field(field)
+    if blank.any():
+        field = field.copy()
+        field[blank] = b'nan'
+    return field.astype(np.float64)
+
+
+def _to_int(field, fill=0):
+    """ convert a fixed-width bytes array to int, blank fields are set to fill """
+    blank = _blank_field(field)
+    if blank.any():
+        field = field.copy()
+        field[blank] = str(fill).encode()
+    return field.astype(np.int64)
+
+
+@cached_reader()
+def read_sp3_file(f_sp3, clk=False):
+    """
+    read the positions (and clocks) of a SP3 file
+    the file is read as one buffer and the fixed-width columns are decoded with NumPy
+    """
     start = time.time()
     try:
-        with open(f_sp3) as f:
-            lines = f.readlines()
+        buf = _read_buffer(f_sp3)
     except FileNotFoundError:
         logging.warning(f"file not found {f_sp3}")
         return
 
-    if len(lines) < 100:
-        logging.warning(f"sp3 file too short ({len(lines)}")
+    starts, ends = _line_index(buf)
+    if len(starts) < 100:
+        logging.warning(f"sp3 file too short ({len(starts)}")
         return
 
     try:
-        nsat = int(lines[2][1:6])
+        nsat = int(bytes(buf[starts[2] + 1:starts[2] + 6]))
     except ValueError:
-        logging.warning(f"cannot get nsat in sp3: {lines[2]}")
+        logging.warning(f"cannot get nsat in sp3: {bytes(buf[starts[2]:ends[2]]).decode(errors='replace')}")
         return
 
-    # delete Velocities
-    lines = [ln for ln in lines if ln[0] != 'V']
-    # sp3 = [j.replace('P  ', 'PG0') for j in sp3]
-    # sp3 = [j.replace('P ', 'PG') for j in sp3]
-
-    data = []
-    # header = ['time', 'sod', 'sat', 'px', 'py', 'pz']
-    epoch = GnssTime(58849, 0)
-    for line in lines:
-        if not line or line.startswith('EOF'):
-            break
-        if line.startswith('*'):
-            year, month, day, hh, mm, ss = line[1:].split()
-            epoch = GnssTime.from_ymd(int(year), int(month), int(day),
-                                      hms2sod(int(hh), int(mm), float(ss)))
-            continue
-        if not line.startswith('P'):
-            continue
-        sat, px, py, pz, *_ = line[1:].split()
-        data.append({
-            'epoch': epoch.fmjd, 'mjd': epoch.mjd, 'sod': epoch.sod, 'sat': sat,
-            'px': float(px) * 1000, 'py': float(py) * 1000, 'pz': float(pz) * 1000
-        })
+    # only the records before EOF are used
+    eof = np.flatnonzero(_startswith(buf, starts, ends, b'EOF'))
+    if len(eof) > 0:
+        starts, ends = starts[:eof[0]], ends[:eof[0]]
+
+    is_epo = _startswith(buf, starts, ends, b'*')
+    is_pos = _startswith(buf, starts, ends, b'P')
+    # index of the epoch for each position record, records before the first epoch are skipped
+    iepo = np.cumsum(is_epo)[is_pos] - 1
+    pos_starts, pos_ends = starts[is_pos][iepo >= 0], ends[is_pos][iepo >= 0]
+    iepo = iepo[iepo >= 0]
+
+    epo_starts, epo_ends = starts[is_epo], ends[is_epo]
+    year = _to_int(_fixed_field(buf, epo_starts, epo_ends, 3, 7))
+    mon = _to_int(_fixed_field(buf, epo_starts, epo_ends, 8, 10))
+    day = _to_int(_fixed_field(buf, epo_starts, epo_ends, 11, 13))
+    sod = _to_int(_fixed_field(buf, epo_starts, epo_ends, 14, 16)) * 3600 + \
+        _to_int(_fixed_field(buf, epo_starts, epo_ends, 17, 19)) * 60 + \
+        _to_float(_fixed_field(buf, epo_starts, epo_ends, 20, 31))
+    tt = GnssTimeArray.from_ymd(year, mon, day, sod)
+
+    sat_names, sat_idx = np.unique(_fixed_field(buf, pos_starts, pos_ends, 1, 4), return_inverse=True)
+    sat_names = np.array([s.decode().replace(' ', '0') for s in sat_names])
+    data = {
+        'epoch': tt.fmjd[iepo], 'mjd': tt.mjd.astype(np.float64)[iepo], 'sod': tt.sod[iepo], 'sat': sat_names[sat_idx],
+        'px': _to_float(_fixed_field(buf, pos_starts, pos_ends, 4, 18)) * 1000,
+        'py': _to_float(_fixed_field(buf, pos_starts, pos_ends, 18, 32)) * 1000,
+        'pz': _to_float(_fixed_field(buf, pos_starts, pos_ends, 32, 46)) * 1000
+    }
+    if clk:
+        data['clk'] = _to_float(_fixed_field(buf, pos_starts, pos_ends, 46, 60))
 
     # ------------------------------------------------------------------
     end = time.time()
@@ -70,130 +164,323 @@ def read_sp3_file(f_sp3):
     return pd.DataFrame(data)
 
 
-def read_rnxc_file(f_name, mode="AS"):
-    if not os.path.isfile(f_name):
+def _read_rnxc_records(f_name, modes, names=None, beg_time=None, end_time=None):
+    """ parse the clock records of one RINEX clock file, return None if the file is not found """
+    try:
+        buf = _read_buffer(f_name)
+    except FileNotFoundError:
         logging.error(f"file not found {f_name}")
         return
 
+    starts, ends = _line_index(buf)
+    # reject lines by record type and length before decoding anything
+    keep = np.zeros(len(starts), dtype=bool)
+    for mode in modes:
+        keep |= _startswith(buf, starts, ends, f'{mode} '.encode())
+    keep &= (ends - starts >= 58)
+    starts, ends = starts[keep], ends[keep]
+    if names is not None:
+        keep = np.isin(_fixed_field(buf, starts, ends, 3, 7), [f'{n:<4s}'.encode() for n in names])
+        starts, ends = starts[keep], ends[keep]
+
+    tt = GnssTimeArray.from_ymd(
+        _to_int(_fixed_field(buf, starts, ends, 8, 12)), _to_int(_fixed_field(buf, starts, ends, 13, 15)),
+        _to_int(_fixed_field(buf, starts, ends, 16, 18)),
+        _to_int(_fixed_field(buf, starts, ends, 19, 21)) * 3600 + _to_int(_fixed_field(buf, starts, ends, 22, 24)) * 60
+        + _to_float(_fixed_field(buf, starts, ends, 25, 34)))
+    keep = np.ones(len(starts), dtype=bool)
+    if beg_time is not None:
+        keep &= tt >= beg_time
+    if end_time is not None:
+        keep &= tt <= end_time
+    starts, ends, tt = starts[keep], ends[keep], tt[keep]
+
+    data = {
+        'epoch': tt.fmjd, 'sod': tt.sod,
+        'name': np.char.strip(np.char.decode(_fixed_field(buf, starts, ends, 3, 7), 'ascii')),
+        'clk': _to_float(_fixed_field(buf, starts, ends, 37, 59))
+    }
+    if len(modes) > 1:
+        data['type'] = np.char.decode(_fixed_field(buf, starts, ends, 0, 2), 'ascii')
+    return pd.DataFrame(data)
+
+
+@cached_reader(version=2)
+def read_rnxc_file(f_name, mode="AS", names=None, beg_time=None, end_time=None):
+    """
+    Read the clock records of RINEX clock files
+    f_name: a file name or a list of files (e.g. GnssConfig.get_xml_file('rinexc'))
+    mode: record type 'AS', 'AR' or both (e.g. ['AS', 'AR']), a column 'type' is added for more than one type
+    names: satellites or stations to keep; beg_time, end_time: GnssTime window (inclusive)
+    return one table sorted by time
+    """
+    f_list = [f_name] if isinstance(f_name, str) else list(f_name)
+    modes = [mode] if isinstance(mode, str) else list(mode)
     data = []
-    mode = mode + ' '
-    with open(f_name) as f:
-        for line in f:
-            if line[0:3] != mode:
+    for file in f_list:
+        dd = _read_rnxc_records(file, modes, names, beg_time, end_time)
+        if dd is not None:
+            data.append(dd)
+    if not data:
+        return
+    data = pd.concat(data, ignore_index=True) if len(data) > 1 else data[0]
+    return data.sort_values('epoch', kind='stable', ignore_index=True)
+
+
+def _read_rnxo_header(f):
+    """ read the RINEX 3 observation header from an opened file, return the observation types of each system """
+    obs_type = {}
+    gsys = ''
+    version = 0.0
+    for line in f:
+        label = line[60:].rstrip()
+        if label == 'END OF HEADER':
+            break
+        if label == 'RINEX VERSION / TYPE':
+            version = float(line[0:9])
+        elif label == 'SYS / # / OBS TYPES':
+            if line[0] != ' ':
+                gsys = line[0]
+                obs_type[gsys] = line[7:60].split()
+            elif gsys:
+                obs_type[gsys].extend(line[7:60].split())
+    if version < 3:
+        logging.error(f"only RINEX 3 observation files are supported: version {version}")
+        return {}
+    return obs_type
+
+
+def read_rnxo_header(f_name):
+    """ return the observation types of each system in a RINEX 3 observation file """
+    if not os.path.isfile(f_name):
+        logging.error(f"NO RINEXO file {f_name}")
+        return {}
+    with open_gnss_file(f_name) as f:
+        return _read_rnxo_header(f)
+
+
+_RNXO_EVENT = {2: 'start moving antenna', 3: 'new site occupation', 4: 'header information',
+               5: 'external event', 6: 'cycle slip records'}
+
+
+def _iter_rnxo_blocks(f, beg_time=None, end_time=None, sats=None, gsys=None):
+    """ yield the epoch blocks of the RINEX 3 observation records in an opened file (after the header) """
+    date_mjd = {}
+    for line in f:
+        if not line.startswith('>'):
+            # records out of any epoch block, e.g. COMMENT
+            continue
+        try:
+            flag = int(line[31:32])
+            nrec = int(line[32:35])
+        except ValueError:
+            logging.warning(f"Unexpected epoch line format detected: {line.rstrip()}")
+            continue
+        if flag > 1:
+            # special records follow the event flag
+            for _ in range(nrec):
+                rec = next(f, '')
+                if flag in (3, 4) and 'REC # / TYPE / VERS' in rec:
+                    logging.warning(f"Receiver type is changed: {rec[0:60].rstrip()}")
+            logging.debug(f"skip {nrec} records of event flag {flag} ({_RNXO_EVENT.get(flag, 'unknown')})")
+            continue
+
+        date = line[2:12]
+        if date not in date_mjd:
+            date_mjd[date] = ymd2mjd(int(line[2:6]), int(line[7:9]), int(line[10:12]))
+        epoch = GnssTime(date_mjd[date], hms2sod(line[13:15], line[16:18], line[18:29]))
+        if end_time is not None and epoch > end_time:
+            break
+        if beg_time is not None and epoch < beg_time:
+            for _ in range(nrec):
+                next(f, '')
+            continue
+
+        lines = []
+        for _ in range(nrec):
+            rec = next(f, '')
+            if gsys is not None and rec[0:1] not in gsys:
                 continue
-            if len(line) < 59:
+            if sats is not None and rec[0:3] not in sats:
                 continue
-            name = line[3:7].strip()
-            year = int(line[8:12])
-            mon = int(line[13:15])
-            dd = int(line[16:18])
-            sod = int(line[19:21]) * 3600 + int(line[22:24]) * 60 + float(line[25:34])
-            epoch = GnssTime.from_ymd(year, mon, dd, sod)
-            value = float(line[37:59])
-            sat_dict = {'epoch': epoch.mjd + epoch.sod / 86400.0, 'sod': sod, 'name': name, 'clk': value}
-            data.append(sat_dict)
+            lines.append(rec)
+        yield epoch, lines
+
+
+def _build_rnxo_index(f_name):
+    """ byte offsets of the observation epoch lines (event flag 0/1) of a RINEX 3 observation file """
+    size = os.path.getsize(f_name)
+    with open(f_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        starts = []
+        step = 1 << 26
+        for beg in range(0, size, step):
+            pos = np.flatnonzero(buf[beg:beg + step] == ord('>')) + beg
+            starts.append(pos[(pos == 0) | (buf[np.maximum(pos - 1, 0)] == 10)])
+        starts = np.concatenate(starts) if starts else np.array([], dtype=np.int64)
+        ends = np.minimum(starts + 35, size)
+        flag = _to_int(_fixed_field(buf, starts, ends, 31, 32), fill=-1)
+        year = _to_int(_fixed_field(buf, starts, ends, 2, 6))
+        tt = GnssTimeArray.from_ymd(
+            year, _to_int(_fixed_field(buf, starts, ends, 7, 9)), _to_int(_fixed_field(buf, starts, ends, 10, 12)),
+            _to_int(_fixed_field(buf, starts, ends, 13, 15)) * 3600 + _to_int(_fixed_field(buf, starts, ends, 16, 18)) * 60
+            + _to_float(_fixed_field(buf, starts, ends, 18, 29)))
+        del buf
+    valid = ((flag == 0) | (flag == 1)) & (year > 0) & ~np.isnan(tt.sod)
+    return {'mjd': tt.mjd[valid], 'sod': tt.sod[valid], 'offset': starts[valid].astype(np.int64)}
+
+
+def rnxo_epoch_index(f_name):
+    """
+    Epoch index of a RINEX 3 observation file: dict of arrays mjd, sod and byte offset of each epoch line
+    the index is built once and kept as a sidecar in the cache directory, it is rebuilt if the file changes
+    """
+    index = load_file_index('rnxo_index', f_name)
+    if index is None:
+        index = _build_rnxo_index(f_name)
+        save_file_index('rnxo_index', f_name, **index)
+    return index
 
-    return pd.DataFrame(data)
+
+def _rnxo_seek_offset(f_name, beg_time):
+    """ byte offset of the last epoch line before beg_time, None if the index cannot be used """
+    try:
+        index = rnxo_epoch_index(f_name)
+    except (OSError, ValueError) as e:
+        logging.warning(f"cannot index {f_name}: {e}")
+        return None
+    if len(index['offset']) == 0:
+        return None
+    dt = (index['mjd'] - beg_time.mjd) * 86400.0 + index['sod'] - beg_time.sod
+    i = int(np.argmax(dt >= 0)) if np.any(dt >= 0) else len(dt)
+    return int(index['offset'][max(i - 1, 0)])
 
 
-def read_rnxo_file(f_name):
+def _mmap_lines(mm):
+    """ iterate over the lines of a memory-mapped text file like a file object in text mode """
+    for line in iter(mm.readline, b''):
+        yield line.rstrip(b'\r\n').decode() + '\n'
+
+
+def iter_rnxo_epochs(f_name, beg_time=None, end_time=None, sats=None, gsys=None):
+    """
+    Read a RINEX 3 observation file one epoch block at a time
+    yield (epoch, lines) for each observation epoch in [beg_time, end_time], lines are the satellite records
+    of the epoch, only satellites in sats and systems in gsys (e.g. 'GEC') are kept
+    Records of event flags 2-6 are skipped
+    With beg_time, the reading starts directly at the window through the epoch index (see rnxo_epoch_index)
+    Compressed files (gzip, .Z, Hatanaka) are decoded while reading
+    """
+    if not os.path.isfile(f_name):
+        logging.error(f"NO RINEXO file {f_name}")
+        return
+    with open_gnss_file(f_name) as f:
+        if not _read_rnxo_header(f):
+            return
+        offset = None
+        if beg_time is not None and not is_compressed(f_name):
+            offset = _rnxo_seek_offset(f_name, beg_time)
+        if offset is None:
+            yield from _iter_rnxo_blocks(f, beg_time, end_time, sats, gsys)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            mm.seek(offset)
+            yield from _iter_rnxo_blocks(_mmap_lines(mm), beg_time, end_time, sats, gsys)
+
+
+def _rnxo_cube_chunk(lines, ot_cols, nots, dtype):
+    """ decode the C/L observations of a chunk of satellite records to a (record, obs_type) array """
+    text = ''.join([ln if ln.endswith('\n') else ln + '\n' for ln in lines])
+    buf = np.frombuffer(text.encode(), dtype=np.uint8)
+    starts, ends = _line_index(buf)
+    gsys = _fixed_field(buf, starts, ends, 0, 1)
+    vals = np.full((len(starts), nots), np.nan, dtype=dtype)
+    for gs, cols in ot_cols.items():
+        idx = np.flatnonzero(gsys == gs.encode())
+        if len(idx) == 0:
+            continue
+        for i, k in cols:
+            vals[idx, k] = _to_float(_fixed_field(buf, starts[idx], ends[idx], 3 + 16 * i, 17 + 16 * i))
+    return vals
+
+
+def _read_rnxo_cube(f_name, obs_type, beg_time=None, end_time=None, sats=None, gsys=None, dtype=np.float64,
+                    chunk=2048):
+    """ read the C/L observations of a RINEX 3 observation file into a dense (epoch, satellite, obs_type) array """
+    obs_types = []
+    for ots in obs_type.values():
+        obs_types.extend([ot for ot in ots if (ot[0] == 'C' or ot[0] == 'L') and ot not in obs_types])
+    ot_idx = {ot: k for k, ot in enumerate(obs_types)}
+    # (column in the record, index in the cube) of the C/L observations of each system
+    ot_cols = {gs: [(i, ot_idx[ot]) for i, ot in enumerate(ots) if ot in ot_idx] for gs, ots in obs_type.items()}
+
+    epochs = []
+    sat_idx = {}
+    rec_epo, rec_sat, rec_vals = [], [], []
+    lines_chunk = []
+    for epoch, lines in iter_rnxo_epochs(f_name, beg_time, end_time, sats, gsys):
+        lines = [line for line in lines if line[0] in ot_cols]
+        rec_epo.extend([len(epochs)] * len(lines))
+        rec_sat.extend([sat_idx.setdefault(line[0:3], len(sat_idx)) for line in lines])
+        lines_chunk.extend(lines)
+        epochs.append(epoch.fmjd)
+        if len(epochs) % chunk == 0:
+            rec_vals.append(_rnxo_cube_chunk(lines_chunk, ot_cols, len(obs_types), dtype))
+            lines_chunk = []
+    if lines_chunk:
+        rec_vals.append(_rnxo_cube_chunk(lines_chunk, ot_cols, len(obs_types), dtype))
+
+    sat_list = sorted(sat_idx)
+    # satellites are sorted in the cube
+    sat_order = np.empty(len(sat_idx), dtype=np.int64)
+    sat_order[[sat_idx[s] for s in sat_list]] = np.arange(len(sat_list))
+    data = np.full((len(epochs), len(sat_list), len(obs_types)), np.nan, dtype=dtype)
+    if rec_vals:
+        data[np.array(rec_epo), sat_order[np.array(rec_sat)]] = np.concatenate(rec_vals)
+
+    return {
+        'epoch': np.array(epochs, dtype=np.float64), 'sat': sat_list, 'obs_type': obs_types,
+        'sat_idx': {s: i for i, s in enumerate(sat_list)}, 'ot_idx': ot_idx,
+        'sys_ot': {gs: [obs_types[k] for _, k in cols] for gs, cols in ot_cols.items()}, 'data': data
+    }
+
+
+@cached_reader()
+def read_rnxo_file(f_name, beg_time=None, end_time=None, sats=None, gsys=None, dense=False, dtype=np.float64):
+    """
+    Read the code and phase observations of a RINEX 3 observation file
+    dense=False: a DataFrame with one row per epoch and satellite, one column per observation type
+    dense=True:  a dict with a (epoch, satellite, obs_type) array of dtype in 'data' (NaN if missing),
+                 'epoch' (fmjd), 'sat', 'obs_type' axes and the index maps 'sat_idx', 'ot_idx',
+                 'sys_ot' (observation types of each system)
+    """
     start = time.time()
     if not os.path.isfile(f_name):
         logging.error(f"NO RINEXO file {f_name}")
         return
 
-    obs_type = {}
-    with open(f_name) as file_object:
-        lines = file_object.readlines()
-
-    # read rnxo header
-    nline = 0
-    for line in lines:
-        if line.find("END OF HEADER") == 60:
-            nline += 1
-            break
-        elif line.find("SYS / # / OBS TYPES") == 60:
-            ot = line[0:60].split()
-            ot_num = int(ot[1])
-            ot_one = ot[2:]
-            nline += 1
-            if ot_num > 13:
-                for _ in range(int(math.ceil(ot_num / 13)) - 1):
-                    ot_one.extend(lines[nline][0:60].split())
-                    nline += 1
-            obs_type[line[0]] = ot_one
-        else:
-            nline += 1
-    del lines[0:nline]
+    obs_type = read_rnxo_header(f_name)
+    if dense:
+        data = _read_rnxo_cube(f_name, obs_type, beg_time, end_time, sats, gsys, dtype)
+        end = time.time()
+        logging.info(f"{f_name} file is read in {end - start:.2f} seconds")
+        return data
 
-    # read rnxo data
+    # index of code and phase observations of each system
+    obs_idx = {gs: [(i, ot) for i, ot in enumerate(ots) if ot[0] == 'C' or ot[0] == 'L']
+               for gs, ots in obs_type.items()}
     data = []
-    nline = 0
-    while True:
-        # =============================================================================
-        while True:
-            if 'COMMENT' in lines[0]:
-                del lines[0]
-                nline += 1
-            elif 'APPROX POSITION XYZ' in lines[0]:
-                del lines[0]
-                nline += 1
-            elif 'REC # / TYPE / VERS' in lines[0]:
-                raise Warning("Receiver type is changed! | Exiting...")
-            else:
-                break
-        # =============================================================================
-        if lines[0][0] == ">":
-            epochLine = lines[0][1:].split()
-            if len(epochLine) == 8:
-                epoch_year, epoch_month, epoch_day, epoch_hour, epoch_minute, epoch_second, epoch_flag, epoch_sat_num = \
-                    lines[0][1:].split()
-                #receiver_clock = 0
-            elif len(epochLine) == 9:
-                epoch_year, epoch_month, epoch_day, epoch_hour, epoch_minute, epoch_second, epoch_flag, epoch_sat_num, _ = \
-                    lines[0][1:].split()
-            else:
-                raise Warning("Unexpected epoch line format detected! | Program stopped!")
-        else:
-            raise Warning("Unexpected format detected! | Program stopped!")
-        # =========================================================================
-        if epoch_flag in {"1", "3", "5", "6"}:
-            raise Warning("Deal with this later!")
-        elif epoch_flag == "4":
-            del lines[0]
-            while True:
-                if 'COMMENT' in lines[0]:
-                    print(lines[0])
-                    del lines[0]
-                    nline += 1
-                elif 'SYS / PHASE SHIFT' in lines[0]:
-                    del lines[0]
-                    # line += 1
-                else:
-                    break
-        else:
-            # =========================================================================
-            sod = int(epoch_hour) * 3600 + int(epoch_minute) * 60 + float(epoch_second)
-            epoch = GnssTime.from_ymd(int(epoch_year), int(epoch_month), int(epoch_day), sod)
-            del lines[0]  # delete epoch header line
-            # =============================================================================
-            epoch_sat_num = int(epoch_sat_num)
-            for svLine in range(epoch_sat_num):
-                sat = lines[svLine][0:3]
-                sys_ot = obs_type[sat[0]]
-                ot_num = len(sys_ot)
-                epoch_obs = {'epoch': epoch.fmjd, 'sat': sat}
-                for i in range(ot_num):
-                    if sys_ot[i][0] != 'C' and sys_ot[i][0] != 'L':
-                        continue
-                    if isfloat(lines[svLine][3 + 16 * i:16 * i + 17]):
-                        epoch_obs[sys_ot[i]] = float(lines[svLine][3 + 16 * i:16 * i + 17])
-                data.append(epoch_obs)
-
-            # =============================================================================
-            del lines[0:epoch_sat_num]  # number of rows in epoch equals number of visible satellites in RINEX 3
-        if len(lines) == 0:
-            break
+    for epoch, lines in iter_rnxo_epochs(f_name, beg_time, end_time, sats, gsys):
+        fmjd = epoch.fmjd
+        for line in lines:
+            sat = line[0:3]
+            epoch_obs = {'epoch': fmjd, 'sat': sat}
+            for i, ot in obs_idx.get(sat[0], []):
+                try:
+                    epoch_obs[ot] = float(line[3 + 16 * i:16 * i + 17])
+                except ValueError:
+                    continue
+            data.append(epoch_obs)
 
     end = time.time()
     msg = f"{f_name} file is read in {end - start:.2f} seconds"
@@ -201,18 +488,184 @@ def read_rnxo_file(f_name):
     return pd.DataFrame(data)
 
 
+# RINEX observation file names: site+doy+session.yyo/.yyd (RINEX 2 style) or long RINEX 3 names
+_RNXO_NAME = re.compile(r'^(\w{4})\d{3}.\.\d\d[od](\.gz|\.Z)?$|^(\w{4})\w{5}_\w_\d{11}_\w+_\w+_\wO\.(rnx|crx)(\.gz)?$')
+_RNXO_EPOCH2 = re.compile(r'^ [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d\.\d{7}  [01]')
+_RNXO_CATALOG_COLUMNS = {
+    'doy': 0, 'site': '', 'file': '', 'size': 0, 'mtime': 0, 'version': 0.0, 'gsys': '', 'rec': '', 'ant': '',
+    'x': np.nan, 'y': np.nan, 'z': np.nan, 'interval': np.nan, 'obs_type': '',
+    'mjd0': 0, 'sod0': np.nan, 'mjd1': 0, 'sod1': np.nan
+}
+
+
+def _rnxo_header_time(text):
+    """ mjd and sod of a 'yyyy mm dd hh mm ss' header/epoch field """
+    val = text.split()
+    year = int(val[0])
+    if year < 100:
+        year += 2000 if year < 80 else 1900
+    return int(ymd2mjd(year, int(val[1]), int(val[2]))), hms2sod(val[3], val[4], val[5])
+
+
+def _rnxo_last_epoch(f_name, version, size=1 << 16):
+    """ mjd and sod of the last epoch found in the tail of an uncompressed observation file, None if not found """
+    with open(f_name, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - size))
+        lines = f.read().decode(errors='replace').splitlines()
+    for line in reversed(lines):
+        if version >= 3:
+            if line.startswith('>') and len(line) >= 32 and line[31] in '01':
+                return _rnxo_header_time(line[1:29])
+        elif _RNXO_EPOCH2.match(line):
+            return _rnxo_header_time(line[1:26])
+    return None
+
+
+def read_rnxo_summary(f_name):
+    """
+    Read only the header of a RINEX 2/3 observation file (compressed files are decoded)
+    return a dict of site, version, gsys, rec, ant, x/y/z, interval, obs_type and first/last epoch (mjd0/sod0,
+    mjd1/sod1), the last epoch is taken from the file tail if the header has none; None if the file cannot be read
+    """
+    info = dict(_RNXO_CATALOG_COLUMNS, file=os.path.basename(f_name))
+    del info['doy']
+    obs_type = {}
+    gsys = ''
+    try:
+        st = os.stat(f_name)
+        info['size'], info['mtime'] = st.st_size, st.st_mtime_ns
+        with open_gnss_file(f_name) as f:
+            for line in f:
+                label = line[60:].rstrip()
+                if label == 'END OF HEADER':
+                    break
+                if label == 'RINEX VERSION / TYPE':
+                    info['version'] = float(line[0:9])
+                    info['gsys'] = line[40:41].strip() or 'G'
+                elif label == 'MARKER NAME':
+                    info['site'] = line[0:4].lower()
+                elif label == 'REC # / TYPE / VERS':
+                    info['rec'] = line[20:40].strip()
+                elif label == 'ANT # / TYPE':
+                    info['ant'] = line[20:40].strip()
+                elif label == 'APPROX POSITION XYZ':
+                    info['x'], info['y'], info['z'] = (float(line[14 * i:14 * i + 14]) for i in range(3))
+                elif label == 'INTERVAL':
+                    info['interval'] = float(line[0:10])
+                elif label == 'TIME OF FIRST OBS':
+                    info['mjd0'], info['sod0'] = _rnxo_header_time(line[0:43])
+                elif label == 'TIME OF LAST OBS':
+                    info['mjd1'], info['sod1'] = _rnxo_header_time(line[0:43])
+                elif label == 'SYS / # / OBS TYPES':
+                    if line[0] != ' ':
+                        gsys = line[0]
+                        obs_type[gsys] = line[7:60].split()
+                    elif gsys:
+                        obs_type[gsys].extend(line[7:60].split())
+                elif label == '# / TYPES OF OBSERV':
+                    obs_type.setdefault(info['gsys'], []).extend(line[6:60].split())
+        if info['mjd1'] == 0 and not is_compressed(f_name):
+            last = _rnxo_last_epoch(f_name, info['version'])
+            if last:
+                info['mjd1'], info['sod1'] = last
+    except (OSError, ValueError, IndexError, EOFError) as e:
+        logging.warning(f"cannot read RINEX header of {f_name}: {e}")
+        return None
+    if info['version'] >= 3:
+        info['gsys'] = ''.join(obs_type)
+        info['obs_type'] = ';'.join(f"{gs}:{' '.join(ots)}" for gs, ots in obs_type.items())
+    else:
+        info['obs_type'] = ' '.join(obs_type.get(info['gsys'], []))
+    if not info['site']:
+        info['site'] = info['file'][0:4].lower()
+    return info
+
+
+def _scan_rnxo_dir(obs_dir, doy, known):
+    """ header summaries of the observation files of one day directory, entries of unchanged files are reused """
+    data = []
+    for name in sorted(os.listdir(obs_dir)):
+        if not _RNXO_NAME.match(name):
+            continue
+        f_name = os.path.join(obs_dir, name)
+        try:
+            st = os.stat(f_name)
+        except OSError:
+            continue
+        info = known.get(name)
+        if info is None or info['size'] != st.st_size or info['mtime'] != st.st_mtime_ns:
+            info = read_rnxo_summary(f_name)
+        if info is not None:
+            data.append(dict(info, doy=doy))
+    return data
+
+
+def _rnxo_catalog_file(obs_dir, year):
+    return os.path.join(obs_dir, f'{year:0>4d}', 'rnxo_catalog.npz')
+
+
+def read_rnxo_catalog(obs_dir, year):
+    """ read the station catalog of one year of an obs_dir/yyyy/ddd tree (see build_rnxo_catalog), None if missing """
+    return load_frame(_rnxo_catalog_file(obs_dir, year))
+
+
+def build_rnxo_catalog(obs_dir, year, nproc=MAX_THREAD):
+    """
+    Scan the headers of all RINEX observation files in obs_dir/yyyy/ddd with a pool of processes and save them
+    as a per-year catalog obs_dir/yyyy/rnxo_catalog.npz, files already in the catalog with unchanged size and
+    mtime are not opened again
+    return the catalog: one row per file with the columns of read_rnxo_summary and doy
+    """
+    year_dir = os.path.join(obs_dir, f'{year:0>4d}')
+    if not os.path.isdir(year_dir):
+        logging.error(f"observation directory not found {year_dir}")
+        return
+    old = read_rnxo_catalog(obs_dir, year)
+    known = {}
+    if old is not None and set(old.columns) == set(_RNXO_CATALOG_COLUMNS):
+        for rec in old.to_dict('records'):
+            known.setdefault(rec['doy'], {})[rec['file']] = rec
+    jobs = []
+    for name in sorted(os.listdir(year_dir)):
+        if len(name) == 3 and name.isdigit() and os.path.isdir(os.path.join(year_dir, name)):
+            doy = int(name)
+            jobs.append((os.path.join(year_dir, name), doy, known.get(doy, {})))
+
+    data = [rec for recs in read_files_parallel(_scan_rnxo_dir, jobs, nproc) for rec in recs]
+    data = pd.DataFrame(data, columns=list(_RNXO_CATALOG_COLUMNS))
+    data = data.astype({key: type(val) if isinstance(val, str) else np.asarray(val).dtype
+                        for key, val in _RNXO_CATALOG_COLUMNS.items()})
+    save_frame(_rnxo_catalog_file(obs_dir, year), data)
+    return data
+
+
+def _categorical(field, strip=False):
+    """ convert a fixed-width bytes array to a pandas Categorical """
+    uniq, codes = np.unique(field, return_inverse=True)
+    names = [s.decode().strip() if strip else s.decode() for s in uniq]
+    cats, idx = np.unique(names, return_inverse=True)
+    return pd.Categorical.from_codes(idx[codes], cats.tolist())
+
+
+@cached_reader()
 def read_res_file(f_res):
+    """
+    Read the residuals of a GREAT recover file
+    each distinct epoch string is converted only once and site/sat/ot are returned as categoricals
+    """
     try:
-        with open(f_res) as file_object:
-            lines = file_object.readlines()
+        buf = _read_buffer(f_res)
     except FileNotFoundError:
         logging.warning(f"file not found {f_res}")
         return
 
+    starts, ends = _line_index(buf)
     lfound = False
     line = ''
-    for line in lines:
-        if not line[0:2].startswith('##'):
+    for i in range(len(starts)):
+        line = bytes(buf[starts[i]:ends[i]]).decode(errors='replace')
+        if not line.startswith('##'):
             break
         if line.startswith('##Time&Interval'):
             lfound = True
@@ -225,20 +678,125 @@ def read_res_file(f_res):
     tbeg = GnssTime.from_str(line[28:47])
     intv = int(line[47:62])
 
-    data = []
-    for line in lines:
-        if line.find("RES") != 0:
-            continue
-        tt = GnssTime.from_str(line[11:30])
-        epo = int(tt.diff(tbeg) / intv) + 1
-        data.append({
-            'epo': epo, 'mjd': tt.fmjd, 'sod': tt.sod,
-            'site': line[39:43], 'sat': line[48:51], 'ot': line[51:59].strip(),
-            'res': float(line[74:89]), 'wgt': float(line[60:74])
-        })
-    return pd.DataFrame(data)
+    is_res = _startswith(buf, starts, ends, b'RES')
+    starts, ends = starts[is_res], ends[is_res]
+    str_epo, iepo = np.unique(_fixed_field(buf, starts, ends, 11, 30), return_inverse=True)
+    tt = GnssTimeArray.from_str(str_epo)
+    epo = np.trunc((tt - tbeg) / intv).astype(np.int64) + 1
+
+    return pd.DataFrame({
+        'epo': epo[iepo], 'mjd': tt.fmjd[iepo], 'sod': tt.sod[iepo],
+        'site': _categorical(_fixed_field(buf, starts, ends, 39, 43)),
+        'sat': _categorical(_fixed_field(buf, starts, ends, 48, 51)),
+        'ot': _categorical(_fixed_field(buf, starts, ends, 51, 59), strip=True),
+        'res': _to_float(_fixed_field(buf, starts, ends, 74, 89)),
+        'wgt': _to_float(_fixed_field(buf, starts, ends, 60, 74))
+    })
+
+
+_DIGIT = np.zeros(256, dtype=np.int32)
+_DIGIT[48:58] = np.arange(10)
+
 
+def _right_int(chars):
+    """ decode right-aligned integers from a uint8 array of characters (last axis), blanks give 0 """
+    width = chars.shape[-1]
+    val = np.zeros(chars.shape[:-1], dtype=np.int32)
+    for k in range(width):
+        val += _DIGIT[chars[..., k]] * 10 ** (width - 1 - k)
+    return np.where(np.any(chars == 45, axis=-1), -val, val)
 
+
+def _find_bytes(buf, key, beg=0):
+    """ position of the first occurrence of key in buf after beg, -1 if not found; searched in growing windows """
+    size = 1 << 16
+    while beg < len(buf):
+        pos = buf[beg:beg + size + len(key)].tobytes().find(key)
+        if pos >= 0:
+            return beg + pos
+        beg += size
+        size *= 2
+    return -1
+
+
+def read_panda_sum(f_name, sats=None, sites=None, intv=300):
+    """
+    Read the phase residuals of every satellite for each station from a PANDA summary file
+    the station blocks are located once and all of them are decoded together with fixed-width views
+    return a dict of 'site', 'sat', 'sec' (seconds since the first epoch) and 'res': an int16 masked array
+    (site, epoch, satellite) masked where the residual is blank or flagged with '*'; None on failure
+    """
+    try:
+        buf = _read_buffer(f_name)
+    except FileNotFoundError:
+        logging.error(f"file not found {f_name}")
+        return
+
+    starts, ends = _line_index(buf)
+
+    def text(i):
+        return bytes(buf[starts[i]:ends[i]]).decode(errors='replace')
+
+    # the satellites and sites are listed between the first two NAME lines
+    iname = np.flatnonzero(_startswith(buf, starts, ends, b' NAME'))
+    if len(iname) == 0:
+        logging.error(f"No satellite in file {f_name}")
+        return
+    all_sats = text(iname[0])[15:].split()
+    iend = iname[1] if len(iname) > 1 else len(starts)
+    all_sites = [text(i)[1:5] for i in range(iname[0] + 1, iend) if text(i)[1:5] != 'SUMM']
+    if not all_sats or not all_sites:
+        logging.error(f"No satellite or station in file {f_name}")
+        return
+    # the number of epochs is the last line of the EPOCH section
+    iepoch = np.flatnonzero(_startswith(buf, starts, ends, b' EPOCH'))
+    nepo = 0
+    if len(iepoch) > 1 and iepoch[1] > iepoch[0] + 1:
+        nepo = int(text(iepoch[1] - 1)[0:9])
+    if nepo <= 0:
+        logging.error(f"No epochs in file {f_name}")
+        return
+    pos = _find_bytes(buf, b'Residual of every satellite for each station', starts[iepoch[1]])
+    if pos < 0:
+        logging.error(f"Cannot find Residual of every satellite for each station in {f_name}")
+        return
+    ipt0 = int(np.searchsorted(starts, pos, side='right'))
+    starts, ends = starts[ipt0:], ends[ipt0:]
+
+    # block boundaries: a line with the station name in [4:8] (not an epoch line) followed by one line per epoch
+    name = _fixed_field(buf, starts, ends, 4, 8)
+    is_epo = _fixed_field(buf, starts, ends, 0, 8)
+    chars = is_epo.view(np.uint8).reshape(len(is_epo), 8)
+    is_epo = np.all((chars == 32) | ((chars >= 48) & (chars <= 57)), axis=1) & ~_blank_field(is_epo)
+    keep = sites if sites else all_sites
+    heads = np.flatnonzero(np.isin(name, [s.encode() for s in all_sites if s in keep]) & ~is_epo)
+    site_used = [name[i].decode() for i in heads]
+    body = (heads[:, None] + 1 + np.arange(nepo)).ravel()
+    isite = np.repeat(np.arange(len(heads)), nepo)
+    ok = body < len(starts)
+    body, isite = body[ok], isite[ok]
+    ok = is_epo[body]
+    body, isite = body[ok], isite[ok]
+    isats = np.array([k for k, sat in enumerate(all_sats) if sats is None or sat in sats], dtype=np.int64)
+    width = int(8 * isats.max() + 13) if len(isats) else 8
+    chars = _fixed_field(buf, starts[body], ends[body], 0, width).view(np.uint8).reshape(len(body), width)
+    iepo = _right_int(chars[:, 0:8]) - 1
+    ok = (iepo >= 0) & (iepo < nepo)
+    chars, iepo, isite = chars[ok], iepo[ok], isite[ok]
+
+    # the residual of satellite k is in columns [8k+8, 8k+13)
+    field = chars[:, (8 * isats + 8)[:, None] + np.arange(5)]
+    mask = np.all(field == 32, axis=2) | np.any(field == 42, axis=2)
+    val = _right_int(field)
+    if np.any(np.abs(val[~mask]) > 32767):
+        logging.warning(f"residuals out of int16 range are clipped in {f_name}")
+    res = np.ma.masked_all((len(heads), nepo, len(isats)), dtype=np.int16)
+    res[isite, iepo] = np.ma.array(np.clip(val, -32768, 32767).astype(np.int16), mask=mask)
+
+    return {'site': site_used, 'sat': [all_sats[k] for k in isats.tolist()], 'sec': np.arange(nepo) * intv, 'res': res}
+
+
+@cached_reader()
 def read_clkdif_sum(f_name, mjd, ref_sat=""):
     try:
         with open(f_name) as f:
@@ -276,242 +834,919 @@ def read_clkdif_sum(f_name, mjd, ref_sat=""):
 
 
 def read_time_info_new(file):
+    """ read the 'Time for Processing epoch' lines of a GREAT log: processing time, nrec and nobs of each epoch """
     try:
-        with open(file) as file_object:
-            lines = file_object.readlines()
+        buf = _read_buffer(file)
     except FileNotFoundError:
         logging.warning(f"file not found {file}")
         return
 
-    data = []
-    for line in lines:
-        if not line.startswith('Time for Processing epoch'):
+    starts, ends = _line_index(buf)
+    keep = _startswith(buf, starts, ends, b'Time for Processing epoch')
+    starts, ends = starts[keep], ends[keep]
+    tt = GnssTimeArray.from_ymd(
+        _to_int(_fixed_field(buf, starts, ends, 27, 31)), _to_int(_fixed_field(buf, starts, ends, 32, 34)),
+        _to_int(_fixed_field(buf, starts, ends, 35, 37)),
+        _to_int(_fixed_field(buf, starts, ends, 38, 40)) * 3600 + _to_int(_fixed_field(buf, starts, ends, 41, 43)) * 60
+        + _to_int(_fixed_field(buf, starts, ends, 44, 46)))
+    return pd.DataFrame({
+        'mjd': tt.fmjd, 'sod': tt.sod, 'date': tt.datetime64(),
+        'time': _to_float(_fixed_field(buf, starts, ends, 55, 65)),
+        'nrec': _to_int(_fixed_field(buf, starts, ends, 92, 95)),
+        'nobs': _to_int(_fixed_field(buf, starts, ends, 115, 123))
+    })
+
+
+_GRT_LOG_PART = re.compile(r'(.*\D)(\d\d)$')
+
+
+def _grt_num_threads(f_xml):
+    """ num_threads of the process section of a GREAT xml, 0 if unknown """
+    try:
+        elem = ET.parse(f_xml).getroot().find('process')
+        return int(elem.get('num_threads', 0)) if elem is not None else 0
+    except (OSError, ET.ParseError, ValueError):
+        return 0
+
+
+def read_run_timing(run_dir='.', nproc=MAX_THREAD):
+    """
+    Read the epoch processing times of all GREAT logs (tmp/*.log) of a processing directory
+    the split parts of a command (label01.log, label02.log...) are labeled with the same cmd, threads is the
+    num_threads of the xml of each log and nmp the number of parts run together
+    """
+    f_logs = sorted(glob.glob(os.path.join(run_dir, 'tmp', '*.log')))
+    if not f_logs:
+        logging.warning(f"no GREAT log in {os.path.join(run_dir, 'tmp')}")
+        return
+    labels = [os.path.basename(f)[:-4] for f in f_logs]
+    cmds = []
+    for label in labels:
+        mm = _GRT_LOG_PART.match(label)
+        cmds.append(mm.group(1) if mm and f'{mm.group(1)}01' in labels else label)
+    nmp = {cmd: cmds.count(cmd) for cmd in cmds}
+
+    frames = []
+    for label, cmd, dd in zip(labels, cmds, read_files_parallel(read_time_info_new, f_logs, nproc)):
+        if dd is None or dd.empty:
             continue
-        tt = GnssTime.from_str(line[27:46])
-        hh, mm, ss = sod2hms(tt.sod)
-        mss = int((tt.sod - int(tt.sod)) * 1000)
-        crt_date = datetime.datetime(tt.year, tt.month, tt.day, hh, mm, ss, mss)
-        data.append({
-            'mjd': tt.fmjd, 'sod': tt.sod, 'date': crt_date, 'time': float(line[55:65]), 'nrec': int(line[92:95]),
-            'nobs': int(line[115:123])
-        })
+        dd['log'] = label
+        dd['cmd'] = cmd
+        dd['threads'] = _grt_num_threads(os.path.join(run_dir, 'xml', f'{label}.xml'))
+        dd['nmp'] = nmp[cmd]
+        frames.append(dd)
+    if not frames:
+        logging.warning(f"no epoch timing found in the GREAT logs of {run_dir}")
+        return
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_files_parallel(reader, jobs, nproc=MAX_THREAD):
+    """
+    Call a file reader for each job in a pool of processes, return the results in the order of jobs
+    reader: a module-level function; jobs: list of argument tuples (or file names)
+    """
+    jobs = [job if isinstance(job, tuple) else (job,) for job in jobs]
+    nproc = min(nproc, len(jobs))
+    if nproc <= 1:
+        return [reader(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=nproc) as executor:
+        futures = [executor.submit(reader, *job) for job in jobs]
+        return [future.result() for future in futures]
 
-    return pd.DataFrame(data)
 
-def sum_clkdif(f_list, mjds, mode=None):
+def _concat_valid(frames):
+    """ concat the non-empty DataFrames of a list, None if there is none """
+    frames = [dd for dd in frames if dd is not None and not dd.empty]
+    return pd.concat(frames) if frames else None
+
+
+def sum_clkdif(f_list, mjds, mode=None, nproc=MAX_THREAD):
     if not f_list:
         logging.error(f"input clkdif file list is empty")
         return
     if len(f_list) != len(mjds):
         logging.error(f"mjd is required for summarizing clkdif")
         return
-    data = pd.DataFrame()
-    for i in range(len(f_list)):
-        data_tmp = read_clkdif_sum(f_list[i], mjds[i])
-        if data_tmp is None:
-            continue
-        else:
-            if data_tmp.empty:
-                continue
-        data = data.append(data_tmp)
+    data = _concat_valid(read_files_parallel(read_clkdif_sum, list(zip(f_list, mjds)), nproc))
+    if data is None:
+        logging.warning(f"no valid clkdif file")
+        return pd.DataFrame()
 
-    sats = list(set(data.sat))
-    sats.sort()
     ndays = len(mjds)
     if mode == 'sat':
-        data_new = []
-        for sat in sats:
-            dd = data[data.sat == sat]
-            if len(dd) < ndays * 0.6:
-                continue
-            data_new.append({
-                'sat': sat, 'gsys': gns_name(sat[0]), 'val': dd['val'].mean()
-            })
-        return pd.DataFrame(data_new)
+        dd = data.groupby('sat', sort=True)['val'].agg(['size', 'mean'])
+        dd = dd[dd['size'] >= ndays * 0.6]
+        return pd.DataFrame({'sat': dd.index.to_numpy(), 'gsys': [gns_name(sat[0]) for sat in dd.index],
+                             'val': dd['mean'].to_numpy()})
     elif mode == 'mjd':
-        data_new = []
-        gsys = list(set(data.gsys))
-        gsys.sort()
-        for mjd in mjds:
-            for gs in gsys:
-                dd = data[(data.mjd == mjd) & (data.gsys == gs)]
-                data_new.append({
-                    'mjd': mjd, 'gsys': gs, 'val': dd['val'].mean()
-                })
-        return pd.DataFrame(data_new)
+        gsys = sorted(set(data.gsys))
+        idx = pd.MultiIndex.from_product([list(mjds), gsys], names=['mjd', 'gsys'])
+        dd = data.groupby(['mjd', 'gsys'])['val'].mean().reindex(idx)
+        return dd.reset_index()
     else:
         return data
 
 
-def read_orbdif_sum(f_name, max=30):
+_ORBDIF_TYPES = ['along', 'cross', 'radial', '3d']
+
+
+def _orbdif_header(buf, starts, ends, f_name):
+    """ satellites of an orbdif file and the index of the first line after the SAT line """
+    isat = np.flatnonzero(_startswith(buf, starts, ends, b'                SAT'))
+    if len(isat) == 0:
+        logging.error(f"not satellite in {f_name}")
+        return [], 0
+    line = bytes(buf[starts[isat[0]]:ends[isat[0]]]).decode()
+    sats = line[27:].rstrip().split('               ')
+    return sats, isat[0] + 1
+
+
+def _orbdif_blocks(buf, starts, ends, nsats):
+    """ decode the 18-char along/cross/radial blocks after column 19 into a (line, satellite, 4) array in cm """
+    chars = _fixed_field(buf, starts, ends, 19, 19 + 18 * nsats).view(np.uint8).reshape(len(starts), nsats, 18)
+    val = np.empty((len(starts), nsats, 4))
+    for k, (beg, end) in enumerate([(0, 6), (7, 12), (13, 18)]):
+        field = np.ascontiguousarray(chars[:, :, beg:end]).view(f'S{end - beg}').ravel()
+        val[:, :, k] = _to_float(field).reshape(len(starts), nsats) / 10
+    val[:, :, 3] = np.sqrt(np.sum(val[:, :, 0:3] ** 2, axis=2))
+    return val
+
+
+def _orbdif_table(cols, sats, val, max_3d, wide):
+    """
+    orbdif table of the (epoch, satellite, 4) values, satellites with 3d > max_3d are removed
+    wide: one row per epoch and satellite with a column per component; otherwise one row per component
+    """
+    iepo, isat = np.nonzero(~(val[:, :, 3] > max_3d))
+    val = val[iepo, isat]
+    sat = np.array(sats, dtype=object)[isat]
+    if wide:
+        data = {key: v[iepo] for key, v in cols.items()}
+        data['sat'] = sat
+        data.update({tp: val[:, k] for k, tp in enumerate(_ORBDIF_TYPES)})
+        return pd.DataFrame(data)
+    data = {key: np.repeat(v[iepo], 4) for key, v in cols.items()}
+    data.update({'sat': np.repeat(sat, 4), 'val': val.ravel(), 'type': np.tile(_ORBDIF_TYPES, len(sat))})
+    return pd.DataFrame(data)
+
+
+@cached_reader(version=2)
+def read_orbdif_sum(f_name, max=30, wide=False):
+    """
+    Read the FITRMS of an orbdif file (cm), satellites with 3d RMS larger than max are removed
+    wide: columns along, cross, radial and 3d instead of one row per component
+    """
     try:
-        with open(f_name) as f:
-            lines = f.readlines()
+        buf = _read_buffer(f_name)
     except FileNotFoundError:
         logging.error(f"file not found {f_name}")
         return
 
-    sats = []
-    i = 0
-    for line in lines:
-        i += 1
-        if line[0:19] == '                SAT':
-            sats = line[27:].replace('\n', '').rstrip().split('               ')
-            break
-
+    starts, ends = _line_index(buf)
+    sats, ibeg = _orbdif_header(buf, starts, ends, f_name)
     if not sats:
-        logging.error(f"not satellite in {f_name}")
         return
+    starts, ends = starts[ibeg:], ends[ibeg:]
 
-    del lines[0:i]
-    nsats = len(sats)
-
-    data = []
-    mjd0 = 0
-    sod0 = 0
-    for line in lines:
-        if line[0:3] == 'ACR':
-            mjd0 = float(line[4:9])
-            sod0 = float(line[10:19])
-            break
-
+    iacr = np.flatnonzero(_startswith(buf, starts, ends, b'ACR'))
+    if len(iacr) == 0:
+        return
+    mjd0 = _to_float(_fixed_field(buf, starts[iacr[:1]], ends[iacr[:1]], 4, 9))[0]
+    sod0 = _to_float(_fixed_field(buf, starts[iacr[:1]], ends[iacr[:1]], 10, 19))[0]
     if mjd0 == 0:
         return
-    mjd = mjd0 + sod0/86400
-    str_rms = ''
-    for line in lines:
-        if line[0:6] == 'FITRMS':
-            str_rms = line[19:].replace('\n', '')
-            break
 
-    if not str_rms:
+    irms = np.flatnonzero(_startswith(buf, starts, ends, b'FITRMS'))
+    if len(irms) == 0:
         return
 
-    for i in range(nsats):
-        str_a = str_rms[i * 18:i * 18 + 6].strip()
-        str_c = str_rms[i * 18 + 7:i * 18 + 12].strip()
-        str_r = str_rms[i * 18 + 13:i * 18 + 18].strip()
-        val_a = int(str_a) / 10  # unit: cm
-        val_c = int(str_c) / 10
-        val_r = int(str_r) / 10
-        val_3d = math.sqrt(val_a ** 2 + val_c ** 2 + val_r ** 2)
-        if val_3d > max:
-            continue
-        data.append({'mjd': mjd, 'sat': sats[i], 'val': val_a, 'type': 'along'})
-        data.append({'mjd': mjd, 'sat': sats[i], 'val': val_c, 'type': 'cross'})
-        data.append({'mjd': mjd, 'sat': sats[i], 'val': val_r, 'type': 'radial'})
-        data.append({'mjd': mjd, 'sat': sats[i], 'val': val_3d, 'type': '3d'})
-    return pd.DataFrame(data)
+    val = _orbdif_blocks(buf, starts[irms[:1]], ends[irms[:1]], len(sats))
+    return _orbdif_table({'mjd': np.array([mjd0 + sod0 / 86400])}, sats, val, max, wide)
 
 
-def read_orbdif_file(f_name):
+@cached_reader(version=2)
+def read_orbdif_file(f_name, wide=False):
+    """
+    Read the epoch-wise orbit differences (ACR lines, cm) of an orbdif file, epochs with 3d > 200 cm are removed
+    wide: one row per epoch and satellite with columns along, cross, radial and 3d;
+    otherwise (long view) one row per component with columns val and type
+    """
     try:
-        with open(f_name) as f:
-            lines = f.readlines()
+        buf = _read_buffer(f_name)
     except FileNotFoundError:
         logging.error(f"file not found {f_name}")
         return pd.DataFrame()
 
-    sats = []
-    i = 0
-    for line in lines:
-        i += 1
-        if line[0:19] == '                SAT':
-            sats = line[27:].replace('\n', '').rstrip().split('               ')
-            break
-
+    starts, ends = _line_index(buf)
+    sats, ibeg = _orbdif_header(buf, starts, ends, f_name)
     if not sats:
-        logging.error(f"not satellite in {f_name}")
         return
+    starts, ends = starts[ibeg:], ends[ibeg:]
 
-    del lines[0:i]
-    nsats = len(sats)
+    is_acr = _startswith(buf, starts, ends, b'ACR')
+    starts, ends = starts[is_acr], ends[is_acr]
+    mjd = _to_float(_fixed_field(buf, starts, ends, 4, 9))
+    sod = _to_float(_fixed_field(buf, starts, ends, 10, 19))
+    sec = (mjd - mjd[0]) * 86400 + sod - sod[0] if len(mjd) > 0 else mjd
+    val = _orbdif_blocks(buf, starts, ends, len(sats))
+    return _orbdif_table({'mjd': mjd + sod / 86400, 'sec': sec}, sats, val, 200, wide)
 
-    data = []
-    mjd0 = 0
-    sod0 = 0
-    for line in lines:
-        if line[0:3] == 'ACR':
-            mjd = float(line[4:9])
-            sod = float(line[10:19])
-            if mjd0 == 0 and sod0 == 0:
-                mjd0 = mjd
-                sod0 = sod
-            sec = (mjd - mjd0)*86400 + sod - sod0
-            fmjd = mjd + sod/86400
-            str_rms = line[19:]
-            for i in range(nsats):
-                str_a = str_rms[i * 18:i * 18 + 6].strip()
-                str_c = str_rms[i * 18 + 7:i * 18 + 12].strip()
-                str_r = str_rms[i * 18 + 13:i * 18 + 18].strip()
-                val_a = int(str_a) / 10  # unit: cm
-                val_c = int(str_c) / 10
-                val_r = int(str_r) / 10
-                val_3d = math.sqrt(val_a ** 2 + val_c ** 2 + val_r ** 2)
-                if val_3d > 200:
-                    continue
-                data.append({'mjd': fmjd, 'sec': sec, 'sat': sats[i], 'val': val_a, 'type': 'along'})
-                data.append({'mjd': fmjd, 'sec': sec, 'sat': sats[i], 'val': val_c, 'type': 'cross'})
-                data.append({'mjd': fmjd, 'sec': sec, 'sat': sats[i], 'val': val_r, 'type': 'radial'})
-                data.append({'mjd': fmjd, 'sec': sec, 'sat': sats[i], 'val': val_3d, 'type': '3d'})
 
-    return pd.DataFrame(data)
+def sum_orbdif(f_list, mode=None, max=30, nproc=MAX_THREAD):
+    if not f_list:
+        return pd.DataFrame()
+    frames = read_files_parallel(read_orbdif_sum, [(file, max) for file in f_list], nproc)
+    for i, dd in enumerate(frames):
+        if dd is not None and not dd.empty:
+            frames[i] = dd.assign(ifile=i, mjd=int(dd.mjd.iloc[0]))
+    data = _concat_valid(frames)
+    if data is None:
+        return pd.DataFrame()
+
+    types = ['along', 'cross', 'radial', '3d']
+    data['type'] = pd.Categorical(data['type'], categories=types)
+    grp = data.assign(val2=data['val'] ** 2).groupby(['ifile', 'mjd', 'sat', 'type'], observed=True)['val2']
+    dd = grp.agg(['size', 'mean']).reset_index()
+    # satellites with too few epochs are skipped (only single-epoch sum files are always kept)
+    nobs = dd[dd['type'] == 'along'].set_index(['ifile', 'sat'])['size']
+    nobs = nobs[(nobs >= 200) | (nobs == 1)]
+    dd = dd[pd.MultiIndex.from_frame(dd[['ifile', 'sat']]).isin(nobs.index)]
+    data_pd = pd.DataFrame({
+        'mjd': dd['mjd'].to_numpy(), 'sat': dd['sat'].to_numpy(), 'gsys': [gns_name(sat[0]) for sat in dd['sat']],
+        'rms': np.sqrt(dd['mean'].to_numpy()), 'type': dd['type'].astype(str).to_numpy()
+    })
+    ndays = len(set(data_pd.mjd))
+    if mode == 'sat':
+        nobs = data_pd.groupby('sat').size()
+        sats = nobs[nobs >= ndays * 0.6 * 4].index
+        dd = data_pd[data_pd.sat.isin(sats)].groupby(['sat', 'type'])['rms'].mean()
+        dd = dd.reindex(pd.MultiIndex.from_product([sats, types], names=['sat', 'type'])).reset_index()
+        return pd.DataFrame({'sat': dd['sat'].to_numpy(), 'gsys': [gns_name(sat[0]) for sat in dd['sat']],
+                             'rms': dd['rms'].to_numpy(), 'type': dd['type'].to_numpy()})
+    elif mode == 'mjd':
+        mjds = sorted(set(data_pd.mjd))
+        gsys = sorted(set(data_pd.gsys))
+        idx = pd.MultiIndex.from_product([mjds, gsys, types], names=['mjd', 'gsys', 'type'])
+        dd = data_pd.groupby(['mjd', 'gsys', 'type'])['rms'].mean().reindex(idx)
+        return dd.reset_index()[['mjd', 'gsys', 'rms', 'type']]
+    else:
+        return data_pd
 
 
-def sum_orbdif(f_list, mode=None, max=30):
-    if not f_list:
+def _field_index(buf):
+    """ start, end and line number of the whitespace separated fields of a buffer """
+    sep = (buf == 32) | (buf == 9) | (buf == 10) | (buf == 13)
+    beg = np.flatnonzero(~sep & np.concatenate(([True], sep[:-1])))
+    end = np.flatnonzero(~sep & np.concatenate((sep[1:], [True]))) + 1
+    return beg, end, np.searchsorted(np.flatnonzero(buf == 10), beg)
+
+
+def _split_fields(buf, ncol):
+    """ whitespace separated fields of the lines having exactly ncol of them, as an (n, ncol) bytes array """
+    beg, end, line = _field_index(buf)
+    _, first, count = np.unique(line, return_index=True, return_counts=True)
+    idx = (first[count == ncol][:, None] + np.arange(ncol)).ravel()
+    width = int(np.max(end[idx] - beg[idx])) if len(idx) else 1
+    return _fixed_field(buf, beg[idx], end[idx], 0, width).reshape(-1, ncol)
+
+
+_NUMBER_CHARS = np.zeros(256, dtype=bool)
+_NUMBER_CHARS[np.frombuffer(b'0123456789.+-eE ', dtype=np.uint8)] = True
+
+
+def _is_number(fields):
+    """ mask of the rows of a bytes array whose fields all look like numbers """
+    chars = fields.view(np.uint8).reshape(fields.shape[0], int(np.prod(fields.shape[1:])) * fields.dtype.itemsize)
+    return np.all(_NUMBER_CHARS[chars], axis=1) & np.any((chars >= 48) & (chars <= 57), axis=1)
+
+
+@cached_reader()
+def read_enu_file(f_enu):
+    """ read the 'sod de dn du' epochs of a PPP enu file (up to the RMS line), empty DataFrame if not found """
+    try:
+        buf = _read_buffer(f_enu)
+    except FileNotFoundError:
+        logging.error(f"file not found {f_enu}")
         return pd.DataFrame()
-    data_sum = []
-    for file in f_list:
-        data_tmp = read_orbdif_sum(file, max)
-        if data_tmp is None:
-            continue
+    fields = _split_fields(buf, 4)
+    irms = np.flatnonzero(np.char.strip(fields[:, 0]) == b'RMS')
+    if len(irms) > 0:
+        fields = fields[0:irms[0]]
+    val = fields[_is_number(fields)].astype(np.float64)
+    if len(val) == 0:
+        return pd.DataFrame()
+    return pd.DataFrame({'sod': val[:, 0], 'de': val[:, 1], 'dn': val[:, 2], 'du': val[:, 3]})
+
+
+@cached_reader()
+def read_flt_file(f_flt):
+    """
+    read the epochs of a PPP flt file: mjd, sod, x, y, z and the ambiguity status of the last column
+    fixed is 1 for 'Fixed' epochs, 0 for 'Float' ones and -1 if the file has no status
+    """
+    try:
+        buf = _read_buffer(f_flt)
+    except FileNotFoundError:
+        logging.error(f"file not found {f_flt}")
+        return
+    fields = _split_fields(buf, 7)
+    fields = fields[_is_number(fields[:, 1:6])]
+    val = fields[:, 1:6].astype(np.float64)
+    status = np.char.upper(np.char.strip(fields[:, 6]))
+    fixed = np.where(np.char.startswith(status, b'FIX'), 1, np.where(np.char.startswith(status, b'FL'), 0, -1))
+    return pd.DataFrame({'mjd': val[:, 0], 'sod': val[:, 1], 'x': val[:, 2], 'y': val[:, 3], 'z': val[:, 4],
+                         'fixed': fixed.astype(np.int8)})
+
+
+def _ppp_site(f_name):
+    """ station name of a PPP result file: the first 4 characters of its name """
+    return os.path.basename(f_name)[0:4].lower()
+
+
+def read_ppp_enu(f_enus, intv=30, nproc=MAX_THREAD):
+    """
+    Load the enu files of many stations with a pool of processes
+    return a dict of site list, sod (epochs of the common grid spaced by intv) and enu: (site, epoch, component)
+    float32 array in meters, NaN where a station has no solution; None if no file can be read
+    """
+    frames = read_files_parallel(read_enu_file, f_enus, nproc)
+    sites = [_ppp_site(f) for f, dd in zip(f_enus, frames) if dd is not None and not dd.empty]
+    frames = [dd for dd in frames if dd is not None and not dd.empty]
+    if not frames:
+        logging.warning(f"no PPP solution in the {len(f_enus)} enu files")
+        return
+    sod0 = min(dd['sod'].iloc[0] for dd in frames)
+    nepo = int(round((max(dd['sod'].iloc[-1] for dd in frames) - sod0) / intv)) + 1
+    enu = np.full((len(frames), nepo, 3), np.nan, dtype=np.float32)
+    for i, dd in enumerate(frames):
+        iepo = np.round((dd['sod'].to_numpy() - sod0) / intv).astype(np.int64)
+        ok = (iepo >= 0) & (iepo < nepo)
+        enu[i, iepo[ok]] = dd[['de', 'dn', 'du']].to_numpy()[ok]
+    return {'site': sites, 'sod': sod0 + np.arange(nepo) * intv, 'enu': enu}
+
+
+def ppp_convergence(enu, sod, hor=0.1, ver=0.2):
+    """
+    Vectorized convergence statistics of PPP solutions, enu: (site, epoch, 3) errors, sod: (epoch,) seconds
+    a solution is converged from the epoch after which the horizontal and vertical errors stay below hor and ver
+    return a DataFrame (one row per site) of the number of epochs, convergence time (s from the first solution,
+    NaN if never converged) and the E/N/U/3D RMS after convergence
+    """
+    enu = np.asarray(enu, dtype=np.float64)
+    valid = np.all(np.isfinite(enu), axis=2)
+    bad = valid & ((np.hypot(enu[:, :, 0], enu[:, :, 1]) > hor) | (np.abs(enu[:, :, 2]) > ver))
+    nepo = enu.shape[1]
+    # last epoch outside the thresholds, the solution converges at the next valid one
+    last_bad = np.where(bad.any(axis=1), nepo - 1 - np.argmax(bad[:, ::-1], axis=1), -1)
+    after = (np.arange(nepo)[None, :] > last_bad[:, None]) & valid
+    has = after.any(axis=1)
+    iconv = np.argmax(after, axis=1)
+    ifirst = np.argmax(valid, axis=1)
+    conv = np.where(has, sod[iconv] - sod[ifirst], np.nan)
+
+    err = np.where(after[:, :, None], enu, 0.0)
+    nconv = after.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms = np.sqrt(np.sum(err ** 2, axis=1) / nconv[:, None])
+    return pd.DataFrame({'nepo': valid.sum(axis=1), 'conv_time': conv, 'rms_e': rms[:, 0], 'rms_n': rms[:, 1],
+                         'rms_u': rms[:, 2], 'rms_3d': np.sqrt(np.sum(rms ** 2, axis=1))})
+
+
+def _ppp_site_stats(f_enu, f_flt, intv, hor, ver):
+    """ convergence statistics and fix rate of one station file (worker of sum_ppp_results) """
+    data = read_ppp_enu([f_enu], intv, nproc=1)
+    if data is None:
+        return
+    dd = ppp_convergence(data['enu'], data['sod'], hor, ver)
+    dd.insert(0, 'site', data['site'][0])
+    dd.insert(1, 'file', os.path.basename(f_enu))
+    dd['fix_rate'] = np.nan
+    if f_flt:
+        flt = read_flt_file(f_flt)
+        if flt is not None and not flt.empty and (flt['fixed'] >= 0).any():
+            dd['fix_rate'] = np.mean(flt['fixed'].to_numpy()[flt['fixed'].to_numpy() >= 0] == 1)
+    return dd
+
+
+def sum_ppp_results(f_enus, f_flts=None, intv=30, hor=0.1, ver=0.2, nproc=MAX_THREAD):
+    """
+    Network-wide PPP assessment of the enu (and flt) files of many stations and days, one process per file
+    return a DataFrame of site, file, nepo, conv_time, rms_e/n/u/3d after convergence and fix_rate (flt status)
+    """
+    if not f_enus:
+        return pd.DataFrame()
+    if f_flts is None:
+        f_flts = [''] * len(f_enus)
+    jobs = [(f_enu, f_flt, intv, hor, ver) for f_enu, f_flt in zip(f_enus, f_flts)]
+    data = _concat_valid(read_files_parallel(_ppp_site_stats, jobs, nproc))
+    return pd.DataFrame() if data is None else data.reset_index(drop=True)
+
+
+# reference satellites of the UPD of each system, the first available one is used
+UPD_REF_SATS = {
+    "G": ["G05", "G08", "G06", "G01", "G30"],
+    "R": ["R18", "R02", "R03", "R04", "R05"],
+    "E": ["E01", "E02", "E03", "E04", "E07"],
+    "C": ["C21", "C22", "C23", "C24", "C25"],
+    "C2": ["C09", "C08", "C11", "C13", "C16"]
+}
+# days of the blocks of a yearly UPD store, blocks are loaded separately
+_UPD_BLOCK_DAYS = 32
+
+
+def _upd_group(sat):
+    """ UPD datum group of a satellite: BDS-2 and BDS-3 are referenced separately """
+    return 'C2' if sat[0] == 'C' and sat < 'C17' else sat[0]
+
+
+def read_upd_file(f_upd, mjd=-1):
+    """
+    read the satellite records of a UPD file (daily WL/EWL or epoch-wise NL)
+    return a DataFrame of mjd, sod, sat, val, sig and nobs; records before any EPOCH-TIME line get mjd and sod 0
+    """
+    try:
+        buf = _read_buffer(f_upd)
+    except FileNotFoundError:
+        logging.warning(f"file not found {f_upd}")
+        return
+
+    starts, ends = _line_index(buf)
+    beg, end, line = _field_index(buf)
+    _, first, count = np.unique(line, return_index=True, return_counts=True)
+    line = line[first]
+    head = _fixed_field(buf, beg[first], end[first], 0, 11)
+    is_epo = (head == b'EPOCH-TIME ') & (count >= 3)
+    is_rec = ~is_epo & (count >= 4) & (buf[starts[line]] == 32)
+    iepo = np.cumsum(is_epo) - 1
+
+    epo, rec = first[is_epo], first[is_rec]
+    epo_mjd = _to_int(_fixed_field(buf, beg[epo + 1], end[epo + 1], 0, 8))
+    epo_sod = _to_float(_fixed_field(buf, beg[epo + 2], end[epo + 2], 0, 12))
+    iepo = iepo[is_rec]
+    fields = np.column_stack([_fixed_field(buf, beg[rec + k], end[rec + k], 0, 20) for k in range(1, 4)])
+    ok = _is_number(fields) & ((iepo >= 0) | (len(epo) == 0))
+    fields, iepo, rec = fields[ok], iepo[ok], rec[ok]
+    return pd.DataFrame({
+        'mjd': epo_mjd[iepo] if len(epo) else np.full(len(rec), mjd, dtype=np.int64),
+        'sod': epo_sod[iepo] if len(epo) else np.zeros(len(rec)),
+        'sat': _fixed_field(buf, beg[rec], end[rec], 0, 3).astype('U3'),
+        'val': fields[:, 0].astype(np.float64), 'sig': fields[:, 1].astype(np.float64),
+        'nobs': fields[:, 2].astype(np.float64).astype(np.int64)
+    })
+
+
+def _upd_arrays(data):
+    """
+    satellite x epoch arrays of UPD records (mjd, sod, sat, val, sig, nobs), the last record of a cell wins
+    row is the first record of each cell, to give the records back in input order
+    """
+    sec = data['mjd'].to_numpy(np.int64) * 86400 + np.round(data['sod'].to_numpy() * 1000).astype(np.int64) / 1000
+    sats, isat = np.unique(data['sat'].to_numpy().astype('U3'), return_inverse=True)
+    secs, iepo = np.unique(sec, return_inverse=True)
+    val = np.full((len(sats), len(secs)), np.nan)
+    sig = np.full((len(sats), len(secs)), np.nan)
+    nobs = np.full((len(sats), len(secs)), -1, dtype=np.int32)
+    val[isat, iepo] = data['val'].to_numpy()
+    sig[isat, iepo] = data['sig'].to_numpy()
+    nobs[isat, iepo] = data['nobs'].to_numpy()
+    row = np.full((len(sats), len(secs)), len(data), dtype=np.int64)
+    row[isat[::-1], iepo[::-1]] = np.arange(len(data))[::-1]
+    mjd = np.floor(secs / 86400).astype(np.int32)
+    return {'sat': sats, 'mjd': mjd, 'sod': secs - mjd * 86400.0, 'val': val, 'sig': sig, 'nobs': nobs, 'row': row}
+
+
+def upd_reference(val, sats, ref_sats=None, row=None):
+    """
+    Subtract at each epoch the UPD of the reference satellite of its group (BDS-2/BDS-3 apart)
+    val: (sat, epoch) array; the reference is the first satellite of ref_sats (UPD_REF_SATS) present at that epoch;
+    if none is present or its UPD is 0, the first satellite of the group present at that epoch is used instead,
+    in input order given by row (see _upd_arrays), else in the order of sats
+    """
+    if ref_sats is None:
+        ref_sats = UPD_REF_SATS
+    sats = list(sats)
+    groups = np.array([_upd_group(sat) for sat in sats])
+    if row is None:
+        row = np.broadcast_to(np.arange(len(sats))[:, None], np.shape(val))
+    out = np.array(val, dtype=np.float64)
+    for gs in np.unique(groups):
+        members = np.flatnonzero(groups == gs)
+        ref = np.zeros(out.shape[1])
+        found = np.zeros(out.shape[1], dtype=bool)
+        for i in [sats.index(sat) for sat in ref_sats.get(gs, []) if sat in sats]:
+            take = ~found & np.isfinite(out[i])
+            ref[take] = out[i, take]
+            found |= take
+        fallback = ref == 0
+        if fallback.any():
+            sub = out[members][:, fallback]
+            order = np.where(np.isfinite(sub), row[members][:, fallback], np.iinfo(np.int64).max)
+            first = sub[np.argmin(order, axis=0), np.arange(sub.shape[1])]
+            ref[fallback] = np.where(np.isfinite(first), first, 0)
+        out[members] -= ref
+    return out
+
+
+def upd_unwrap(val):
+    """
+    Shift the UPDs of each satellite (rows) by one cycle to stay within 0.5 cycle of its first value,
+    the first value itself is brought into (-0.5, 0.5]
+    """
+    val = np.asarray(val, dtype=np.float64)
+    valid = np.isfinite(val)
+    rows = np.flatnonzero(valid.any(axis=1))
+    ifirst = np.argmax(valid, axis=1)[rows]
+    first = val[rows, ifirst]
+    first = first - (first > 0.5) + (first <= -0.5)
+    ref = np.full(val.shape[0], np.nan)
+    ref[rows] = first
+    with np.errstate(invalid='ignore'):
+        out = val - (val > ref[:, None] + 0.5) + (val < ref[:, None] - 0.5)
+    out[rows, ifirst] = first
+    return out
+
+
+def _upd_frame(arrays, rows=None):
+    """
+    long DataFrame (date, mjd, sod, sat, upd, sig, nobs, sys) of UPD arrays, upd replaced by rows if given
+    sorted by epoch, then by input order (row of _upd_arrays) or by satellite for arrays of a store
+    """
+    upd = arrays['val'] if rows is None else rows
+    isat, iepo = np.nonzero(np.isfinite(upd))
+    order = np.lexsort((arrays['row'][isat, iepo] if 'row' in arrays else isat, iepo))
+    isat, iepo = isat[order], iepo[order]
+    mjd, sod = arrays['mjd'][iepo], arrays['sod'][iepo]
+    sats = arrays['sat'][isat]
+    return pd.DataFrame({
+        'date': GnssTimeArray(mjd, np.floor(sod)).datetime64(), 'mjd': mjd.astype(np.float64), 'sod': sod.astype(np.float64),
+        'sat': sats.astype(object), 'upd': upd[isat, iepo], 'sig': arrays['sig'][isat, iepo],
+        'nobs': arrays['nobs'][isat, iepo].astype(np.int64), 'sys': [gns_name(sat[0]) for sat in sats]
+    })
+
+
+def upd_store_file(store_dir, kind, year):
+    """ yearly columnar UPD store of one kind (wl, ewl, nl...) """
+    return os.path.join(store_dir, f'upd_{kind}_{year:04d}.npz')
+
+
+def _load_upd_store(f_store, mjd0=None, mjd1=None):
+    """ sources and (the blocks overlapping [mjd0, mjd1] of) a UPD store, None if there is no store """
+    try:
+        with np.load(f_store, allow_pickle=False) as npz:
+            store = {key: npz[key] for key in ['sat', 'src', 'src_mjd', 'src_size', 'src_mtime', 'year']}
+            blocks = []
+            for key in sorted(k for k in npz.files if k.startswith('mjd_')):
+                k = key[4:]
+                mjd = npz[key]
+                if len(mjd) == 0 or (mjd1 is not None and mjd[0] > mjd1):
+                    continue
+                sod = npz[f'sod_{k}']
+                # mjd holds whole days, the last epoch of a block may lie after a fractional mjd0 of the same day
+                if mjd0 is not None and mjd[-1] + sod[-1] / 86400 < mjd0:
+                    continue
+                blocks.append({'mjd': mjd, 'sod': sod, 'isrc': npz[f'isrc_{k}'], 'val': npz[f'val_{k}'],
+                               'sig': npz[f'sig_{k}'], 'nobs': npz[f'nobs_{k}']})
+    except FileNotFoundError:
+        return
+    except (OSError, KeyError, ValueError) as e:
+        logging.warning(f"cannot read UPD store {f_store}: {e}")
+        return
+    store['blocks'] = blocks
+    return store
+
+
+def _upd_store_records(store):
+    """ long DataFrame of the records of a fully loaded store, with the source file of each record """
+    frames = []
+    for blk in store['blocks']:
+        isat, iepo = np.nonzero(np.isfinite(blk['val']))
+        frames.append(pd.DataFrame({
+            'mjd': blk['mjd'][iepo], 'sod': blk['sod'][iepo], 'sat': store['sat'][isat], 'val': blk['val'][isat, iepo],
+            'sig': blk['sig'][isat, iepo], 'nobs': blk['nobs'][isat, iepo], 'src': store['src'][blk['isrc'][iepo]]
+        }))
+    return _concat_valid(frames)
+
+
+def _save_upd_store(f_store, year, data, sources):
+    """ write UPD records (with src) and their sources (DataFrame src, src_mjd, src_size, src_mtime) to a store """
+    arrays = _upd_arrays(data)
+    src = sources['src'].to_numpy().astype(str)
+    sec = data['mjd'].to_numpy(np.int64) * 86400 + np.round(data['sod'].to_numpy() * 1000).astype(np.int64) / 1000
+    # source of the last record of each epoch, like the values in _upd_arrays
+    _, idx = np.unique(sec[::-1], return_index=True)
+    isrc = np.searchsorted(src, data['src'].to_numpy().astype(str)[len(sec) - 1 - idx]).astype(np.int32)
+    out = {'year': np.array(year), 'sat': arrays['sat'], 'src': src, 'src_mjd': sources['src_mjd'].to_numpy(np.int64),
+           'src_size': sources['src_size'].to_numpy(np.int64), 'src_mtime': sources['src_mtime'].to_numpy(np.int64)}
+    block = (arrays['mjd'] - int(ymd2mjd(year, 1, 1))) // _UPD_BLOCK_DAYS
+    for k in np.unique(block):
+        sel = block == k
+        out.update({f'mjd_{k:02d}': arrays['mjd'][sel], f'sod_{k:02d}': arrays['sod'][sel],
+                    f'isrc_{k:02d}': isrc[sel], f'val_{k:02d}': arrays['val'][:, sel],
+                    f'sig_{k:02d}': arrays['sig'][:, sel], f'nobs_{k:02d}': arrays['nobs'][:, sel]})
+    return save_arrays(f_store, **out)
+
+
+def update_upd_store(files, store_dir, kind, nproc=MAX_THREAD):
+    """
+    Ingest UPD files {mjd: file} into the yearly columnar stores of a kind (wl, ewl, nl...) in store_dir
+    only new or changed files (size/mtime) are read; a new file for a day replaces the former one
+    return the list of store files
+    """
+    years = {}
+    for mjd, file in files.items():
+        years.setdefault(mjd2ydoy(int(mjd))[1], {})[int(mjd)] = os.path.abspath(file)
+    f_stores = []
+    for year, day_files in sorted(years.items()):
+        f_store = upd_store_file(store_dir, kind, year)
+        store = _load_upd_store(f_store)
+        if store is not None:
+            sources = pd.DataFrame({key: store[key] for key in ['src', 'src_mjd', 'src_size', 'src_mtime']})
+            data = _upd_store_records(store)
         else:
-            if data_tmp.empty:
+            sources, data = pd.DataFrame(columns=['src', 'src_mjd', 'src_size', 'src_mtime']), None
+
+        jobs, stats = [], []
+        for mjd, file in sorted(day_files.items()):
+            try:
+                st = os.stat(file)
+            except OSError:
+                logging.warning(f"file not found {file}")
                 continue
-        mjd = int(data_tmp.mjd[0])
-        sats = list(set(data_tmp.sat))
-        sats.sort()
-        for sat in sats:
-            data_a = data_tmp[(data_tmp.sat == sat) & (data_tmp['type'] == 'along')]
-            if len(data_a) < 200 and len(data_a) != 1:
+            old = sources[(sources['src_mjd'] == mjd) & (sources['src'] == file)]
+            if len(old) and old['src_size'].iloc[0] == st.st_size and old['src_mtime'].iloc[0] == st.st_mtime_ns:
                 continue
-            for tp in ['along', 'cross', 'radial', '3d']:
-                data = data_tmp[(data_tmp.sat == sat) & (data_tmp['type'] == tp)]
-                data_sum.append({
-                    'mjd': mjd, 'sat': sat, 'gsys': gns_name(sat[0]), 'rms': rms_val(data['val']), 'type': tp
-                })
-    data_pd = pd.DataFrame(data_sum)
-    sats = list(set(data_pd.sat))
-    sats.sort()
-    mjds = list(set(data_pd.mjd))
-    ndays = len(mjds)
-    if mode == 'sat':
-        data_new = []
-        for sat in sats:
-            dd = data_pd[data_pd.sat == sat]
-            if len(dd) < ndays * 0.6 * 4:
-                continue
-            for tp in ['along', 'cross', 'radial', '3d']:
-                dd = data_pd[(data_pd.sat == sat) & (data_pd.type == tp)]
-                data_new.append({
-                    'sat': sat, 'gsys': gns_name(sat[0]), 'rms': dd.rms.mean(), 'type': tp
-                })
-        return pd.DataFrame(data_new)
-    elif mode == 'mjd':
-        data_new = []
-        gsys = list(set(data_pd.gsys))
-        gsys.sort()
-        for mjd in mjds:
-            for gs in gsys:
-                for tp in ['along', 'cross', 'radial', '3d']:
-                    dd = data_pd[(data_pd.mjd == mjd) & (data_pd.gsys == gs) & (data_pd['type'] == tp)]
-                    data_new.append({
-                        'mjd': mjd, 'gsys': gs, 'rms': dd.rms.mean(), 'type': tp
-                    })
-        return pd.DataFrame(data_new)
+            jobs.append((file, mjd))
+            stats.append({'src': file, 'src_mjd': mjd, 'src_size': st.st_size, 'src_mtime': st.st_mtime_ns})
+        f_stores.append(f_store)
+        if not jobs:
+            continue
+
+        frames = read_files_parallel(read_upd_file, jobs, nproc)
+        frames = [dd.assign(src=job[0]) for dd, job in zip(frames, jobs) if dd is not None and not dd.empty]
+        stats = pd.DataFrame(stats)
+        old_src = sources[sources['src_mjd'].isin(stats['src_mjd']) | sources['src'].isin(stats['src'])]['src']
+        if data is not None:
+            data = data[~data['src'].isin(set(old_src))]
+        sources = pd.concat([sources[~sources['src'].isin(set(old_src))], stats], ignore_index=True)
+        data = _concat_valid([data] + frames)
+        if data is None:
+            continue
+        sources = sources[sources['src'].isin(set(data['src']))].sort_values('src')
+        _save_upd_store(f_store, year, data, sources)
+        logging.info(f"{len(jobs)} UPD files ingested into {f_store}")
+    return f_stores
+
+
+def query_upd(store_dir, kind, beg=None, end=None, gsys=None, sats=None, days=None, ref_sats=None, unwrap=True):
+    """
+    Query the UPD stores of a kind between beg and end (GnssTime, or mjd), for systems gsys and/or satellites sats
+    (and only the days of the list days if given)
+    the UPDs are re-referenced (ref_sats, see upd_reference; False to keep the raw values) and unwrapped at once
+    return a DataFrame of date, mjd, sod, sat, upd, sig, nobs and sys
+    """
+    mjd0 = None if beg is None else (beg.mjd + beg.sod / 86400 if hasattr(beg, 'mjd') else beg)
+    mjd1 = None if end is None else (end.mjd + end.sod / 86400 if hasattr(end, 'mjd') else end)
+    if mjd0 is not None and mjd1 is not None:
+        years = range(mjd2ydoy(int(mjd0))[1], mjd2ydoy(int(mjd1))[1] + 1)
     else:
-        return data_pd
+        pattern = re.compile(rf'upd_{re.escape(kind)}_(\d{{4}})\.npz$')
+        years = sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(store_dir)) if m) \
+            if os.path.isdir(store_dir) else []
+    frames = []
+    for year in years:
+        store = _load_upd_store(upd_store_file(store_dir, kind, year), mjd0, mjd1)
+        if store is None:
+            continue
+        for blk in store['blocks']:
+            isat, iepo = np.nonzero(np.isfinite(blk['val']))
+            frames.append(pd.DataFrame({'mjd': blk['mjd'][iepo], 'sod': blk['sod'][iepo], 'sat': store['sat'][isat],
+                                        'val': blk['val'][isat, iepo], 'sig': blk['sig'][isat, iepo],
+                                        'nobs': blk['nobs'][isat, iepo]}))
+    data = _concat_valid(frames)
+    if data is None:
+        logging.warning(f"no {kind} UPD found in {store_dir}")
+        return pd.DataFrame()
+    epoch = data['mjd'] + data['sod'] / 86400
+    keep = np.ones(len(data), dtype=bool)
+    if mjd0 is not None:
+        keep &= epoch >= mjd0
+    if mjd1 is not None:
+        keep &= epoch <= mjd1
+    if gsys:
+        keep &= data['sat'].str[0].isin(list(gsys))
+    if sats is not None:
+        keep &= data['sat'].isin(set(sats))
+    if days is not None:
+        keep &= data['mjd'].isin([int(mjd) for mjd in days])
+    return upd_table(data[keep], ref_sats, unwrap)
+
+
+def upd_table(data, ref_sats=None, unwrap=True):
+    """ UPD records (mjd, sod, sat, val, sig, nobs) as a re-referenced and unwrapped table, see query_upd """
+    arrays = _upd_arrays(data)
+    val = arrays['val']
+    if ref_sats is not False:
+        val = upd_reference(val, arrays['sat'], ref_sats, arrays['row'])
+    if unwrap:
+        val = upd_unwrap(val)
+    return _upd_frame(arrays, val)
+
+
+_file_indexes = {}
+
+
+def _shared_index(kind, f_name, build, convert):
+    """
+    Index of a file built once per process: build(f_name) returns a dict of arrays which is kept as a sidecar
+    in the cache directory, convert(arrays) the object kept in memory; both are rebuilt if the file changes
+    """
+    st = os.stat(f_name)
+    key = (kind, os.path.abspath(f_name))
+    stamp = (st.st_size, st.st_mtime_ns)
+    if key in _file_indexes and _file_indexes[key][0] == stamp:
+        return _file_indexes[key][1]
+    arrays = load_file_index(kind, f_name)
+    if arrays is None:
+        arrays = build(f_name)
+        save_file_index(kind, f_name, **arrays)
+    index = convert(arrays)
+    _file_indexes[key] = (stamp, index)
+    return index
+
+
+def _build_snx_index(f_snx):
+    """ scan the SITE/RECEIVER, SITE/ANTENNA and SOLUTION/ESTIMATE blocks of a SINEX file, first entry per site wins """
+    sites = {}
+
+    def record(site):
+        if site not in sites:
+            sites[site] = {'xyz': [np.nan] * 3, 'sig': [np.nan] * 3, 'rec': '', 'ant': ''}
+        return sites[site]
+
+    crd = {'STAX': 0, 'STAY': 1, 'STAZ': 2}
+    with open_gnss_file(f_snx) as f:
+        block = ''
+        for line in f:
+            if line.startswith('-SOLUTION/ESTIMATE'):
+                break
+            if line.startswith('+'):
+                block = line[1:].rstrip()
+                continue
+            if line.startswith('-'):
+                block = ''
+                continue
+            if line[0] != ' ':
+                continue
+            if block == 'SITE/RECEIVER' or block == 'SITE/ANTENNA':
+                rec = record(line[1:5].lower())
+                key = 'rec' if block == 'SITE/RECEIVER' else 'ant'
+                if not rec[key]:
+                    rec[key] = line[42:62]
+            elif block == 'SOLUTION/ESTIMATE':
+                i = crd.get(line[7:11])
+                if i is None:
+                    continue
+                rec = record(line[14:18].lower())
+                if np.isnan(rec['xyz'][i]):
+                    rec['xyz'][i] = float(line[47:68])
+                    rec['sig'][i] = float(line[69:80])
+
+    names = list(sites)
+    return {'site': np.array(names, dtype='U4'),
+            'xyz': np.array([sites[s]['xyz'] for s in names], dtype=np.float64).reshape(-1, 3),
+            'sig': np.array([sites[s]['sig'] for s in names], dtype=np.float64).reshape(-1, 3),
+            'rec': np.array([sites[s]['rec'] for s in names], dtype='U20'),
+            'ant': np.array([sites[s]['ant'] for s in names], dtype='U20')}
+
+
+def _snx_records(index):
+    sites = {}
+    for i, site in enumerate(index['site'].tolist()):
+        sites[site] = {'xyz': index['xyz'][i], 'sig': index['sig'][i],
+                       'rec': str(index['rec'][i]), 'ant': str(index['ant'][i])}
+    return sites
+
+
+def snx_site_index(f_snx):
+    """
+    Station records of a SINEX file: dict of site -> {'xyz', 'sig', 'rec', 'ant'}
+    xyz/sig are NaN and rec/ant empty when the file has no such entry for the site
+    the index is built once per file (kept in memory and as a sidecar in the cache directory) and
+    rebuilt if the file changes, return None if the file does not exist
+    """
+    try:
+        return _shared_index('snx_index', f_snx, _build_snx_index, _snx_records)
+    except (OSError, TypeError):
+        logging.warning(f'file not found {f_snx}')
+        return None
+
+
+def _build_atx_index(f_atx):
+    """ antenna name, serial and byte range [beg, end) of each antenna block of an ANTEX file """
+    buf = _read_buffer(f_atx)
+    starts, ends = _line_index(buf)
+    label = _fixed_field(buf, starts, ends, 60, 80)
+    beg = np.flatnonzero(label == b'START OF ANTENNA    ')
+    end = np.flatnonzero(label == b'END OF ANTENNA      ')
+    typ = np.flatnonzero(label == b'TYPE / SERIAL NO    ')
+    # pair each block start with the following end and type lines
+    iend = np.searchsorted(end, beg)
+    ityp = np.searchsorted(typ, beg)
+    ok = (iend < len(end)) & (ityp < len(typ))
+    beg, iend, ityp = beg[ok], iend[ok], ityp[ok]
+    end, typ = end[iend], typ[ityp]
+    ok = typ < end
+    beg, end, typ = beg[ok], end[ok], typ[ok]
+    return {'name': _fixed_field(buf, starts[typ], ends[typ], 0, 20).astype('U20'),
+            'serial': _fixed_field(buf, starts[typ], ends[typ], 20, 40).astype('U20'),
+            'beg': starts[beg].astype(np.int64),
+            'end': np.minimum(ends[end] + 1, len(buf)).astype(np.int64)}
+
+
+def _atx_lookup(index):
+    return {'name': index['name'].tolist(), 'serial': index['serial'].tolist(),
+            'beg': index['beg'], 'end': index['end'], 'keys': {}, 'parsed': {}}
+
+
+def atx_index(f_atx):
+    """
+    Antenna index of an ANTEX file: dict of 'name' (antenna + radome, 20 chars), 'serial', byte range 'beg'/'end'
+    of each antenna block; built once per process and kept as a sidecar in the cache directory
+    return None if the file does not exist
+    """
+    try:
+        return _shared_index('atx_index', f_atx, _build_atx_index, _atx_lookup)
+    except (OSError, TypeError):
+        logging.warning(f"atx file not found {f_atx}")
+        return None
+
+
+def find_atx_antenna(f_atx, name, width=20):
+    """ number of the first antenna block whose name[0:width] is name (blanks ignored), None if not found """
+    index = atx_index(f_atx)
+    if index is None:
+        return None
+    if width not in index['keys']:
+        keys = {}
+        for i, ant in enumerate(index['name']):
+            keys.setdefault(ant[0:width].strip(), i)
+        index['keys'][width] = keys
+    return index['keys'][width].get(name.strip())
+
+
+def _parse_atx_block(text):
+    """ PCO and PCV of an antenna block, the PCV rows of each frequency are decoded with NumPy """
+    ant = {'dazi': 0.0, 'zen1': 0.0, 'zen2': 0.0, 'dzen': 0.0, 'freq': {}}
+    freq = None
+    for line in text.splitlines():
+        label = line[60:].rstrip()
+        if label == 'TYPE / SERIAL NO':
+            ant['name'], ant['serial'] = line[0:20], line[20:40]
+        elif label == 'DAZI':
+            ant['dazi'] = float(line[0:8])
+        elif label == 'ZEN1 / ZEN2 / DZEN':
+            ant['zen1'], ant['zen2'], ant['dzen'] = float(line[0:8]), float(line[8:14]), float(line[14:20])
+        elif label == 'START OF FREQUENCY':
+            freq = {'pco': np.zeros(3), 'noazi': None, 'rows': []}
+            ant['freq'][line[3:6]] = freq
+        elif label == 'END OF FREQUENCY':
+            freq = None
+        elif freq is None or label == 'COMMENT':
+            continue
+        elif label == 'NORTH / EAST / UP':
+            freq['pco'] = np.array(line[0:30].split(), dtype=np.float64)
+        elif line[3:8] == 'NOAZI':
+            freq['noazi'] = np.array(line[8:].split(), dtype=np.float64)
+        elif line.strip():
+            freq['rows'].append(line)
+    for freq in ant['freq'].values():
+        rows = freq.pop('rows')
+        # first column is the azimuth, one column per zenith angle after it
+        freq['pcv'] = np.array(' '.join(rows).split(), dtype=np.float64).reshape(len(rows), -1) if rows else \
+            np.zeros((0, 0))
+    return ant
+
+
+def read_atx_antenna(f_atx, name, width=20):
+    """
+    PCO/PCV of an antenna of an ANTEX file, found with find_atx_antenna and parsed once per process
+    return a dict of name, serial, dazi, zen1, zen2, dzen and 'freq': {frequency: {'pco', 'noazi', 'pcv'}},
+    pcv rows are [azimuth, values...]; None if not found
+    """
+    i = find_atx_antenna(f_atx, name, width)
+    if i is None:
+        return None
+    index = atx_index(f_atx)
+    if i not in index['parsed']:
+        with open_gnss_file(f_atx, 'rb') as f:
+            if is_compressed(f_atx):
+                f.read(index['beg'][i])
+            else:
+                f.seek(index['beg'][i])
+            text = f.read(index['end'][i] - index['beg'][i]).decode(errors='replace')
+        index['parsed'][i] = _parse_atx_block(text)
+    return index['parsed'][i]
 
 
 def rms_val(x):
@@ -674,15 +1909,11 @@ def check_rnxo_ant(f_rnxo, f_atx, change=True):
         logging.warning(f"cannot find ANT # in RINEXO file {f_rnxo}")
         return False
 
-    atx_ant = ""
-    with open(f_atx) as f:
-        for line in f:
-            if line[0:16] == rnxo_ant[0:16]:
-                atx_ant = line[0:20]
-                break
-    if not atx_ant:
+    i = find_atx_antenna(f_atx, rnxo_ant[0:16], 16)
+    if i is None:
         logging.warning(f"cannot find {rnxo_ant[0:16].rstrip()} in {f_atx}")
         return False
+    atx_ant = atx_index(f_atx)['name'][i]
 
     if rnxo_ant != atx_ant:
         if not change:
@@ -694,48 +1925,86 @@ def check_rnxo_ant(f_rnxo, f_atx, change=True):
     return True
 
 
-def check_att_file(f_att):
-    """ modify the attitude file header """
+def _att_epoch(line):
+    val = line.split()
+    return GnssTime(int(val[0]), float(val[1]))
+
+
+def _att_last_line(f, size=4096):
+    """ last non-blank line of an opened binary file, read from its tail """
+    f.seek(0, os.SEEK_END)
+    fsize = f.tell()
+    while True:
+        f.seek(max(0, fsize - size))
+        lines = [line for line in f.read().decode(errors='replace').splitlines() if line.strip()]
+        if len(lines) > 1 or size >= fsize:
+            return lines[-1] if lines else ''
+        size *= 4
+
+
+def check_att_file(f_att, nrec=100):
+    """
+    modify the attitude file header
+    only the header, the first nrec records and the tail of the file are read; the file is rewritten
+    (streamed to a temporary file) only if its header differs from the expected one
+    """
     sat = os.path.basename(f_att).split('_')[-1]
     if not sat.lower() in list(leo_df.svn):
         logging.warning(f"Unknown LEO satellite {sat} in att file name")
         return False
-    if os.path.isfile(f_att):
-        with open(f_att) as file_object:
-            lines = file_object.readlines()
-        pos = 0
-        for i in range(len(lines)):
-            if lines[i][0] == '%':
-                continue
-            pos = i
-            break
-        del lines[0:pos]
-        if len(lines) < 100:
-            logging.warning(f"records in attitude file too few: {len(lines)}")
-            return False
-        first = GnssTime(int(lines[0].split()[0]), float(lines[0].split()[1]))
-        second = GnssTime(int(lines[1].split()[0]), float(lines[1].split()[1]))
-        third = GnssTime(int(lines[2].split()[0]), float(lines[2].split()[1]))
-        last = GnssTime(int(lines[-1].split()[0]), float(lines[-1].split()[1]))
-        dt1 = second.diff(first)
-        dt2 = third.diff(second)
-        if dt1 - dt2 < 0.001:
-            interval = int((dt1 + dt2)/2)
-        else:
-            logging.warning(f"cannot get the interval of att file: {dt1} != {dt2}")
+    if not os.path.isfile(f_att):
+        logging.warning(f"attitude file not found: {f_att}")
+        return False
+
+    with open(f_att, 'rb') as f:
+        header = []
+        line = f.readline()
+        while line.startswith(b'%'):
+            header.append(line.decode(errors='replace'))
+            line = f.readline()
+        pos = f.tell() - len(line)
+        records = []
+        while line and len(records) < nrec:
+            records.append(line.decode(errors='replace'))
+            line = f.readline()
+        if len(records) < nrec:
+            logging.warning(f"records in attitude file too few: {len(records)}")
             return False
-        with open(f_att, "w") as file_object:
-            file_object.write("%% Header of attitude data for LEO satellite\n")
-            file_object.write(f"% Satellite     {sat.upper()}\n")
-            file_object.write(f"% Start time   {int(first.mjd):>5d}   {first.sod:>12.5f}\n")
-            file_object.write(f"% End time     {int(last.mjd):>5d}   {last.sod:>12.5f}\n")
-            file_object.write(f"% Time interval {interval:>5.1f}\n")
-            file_object.write("%% End of Header\n")
-            file_object.writelines(lines)
-        return True
+        last = _att_epoch(_att_last_line(f))
+
+    first, second, third = (_att_epoch(rec) for rec in records[0:3])
+    dt1 = second.diff(first)
+    dt2 = third.diff(second)
+    if dt1 - dt2 < 0.001:
+        interval = int((dt1 + dt2)/2)
     else:
-        logging.warning(f"attitude file not found: {f_att}")
+        logging.warning(f"cannot get the interval of att file: {dt1} != {dt2}")
         return False
+    new_header = [
+        "%% Header of attitude data for LEO satellite\n",
+        f"% Satellite     {sat.upper()}\n",
+        f"% Start time   {int(first.mjd):>5d}   {first.sod:>12.5f}\n",
+        f"% End time     {int(last.mjd):>5d}   {last.sod:>12.5f}\n",
+        f"% Time interval {interval:>5.1f}\n",
+        "%% End of Header\n"
+    ]
+    if [line.rstrip('\r\n') for line in header] == [line.rstrip('\n') for line in new_header]:
+        return True
+
+    fd, f_tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(f_att)))
+    try:
+        with open(f_att, 'rb') as fin, os.fdopen(fd, 'wb') as fout:
+            fout.write(''.join(new_header).encode())
+            fin.seek(pos)
+            shutil.copyfileobj(fin, fout, 1 << 20)
+        shutil.copymode(f_att, f_tmp)
+        os.replace(f_tmp, f_att)
+    except OSError as e:
+        logging.warning(f"cannot rewrite attitude file {f_att}: {e}")
+        if os.path.isfile(f_tmp):
+            os.remove(f_tmp)
+        return False
+    return True
 
 
 def alter_file(file, old_str, new_str, count=0):
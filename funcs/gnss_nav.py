@@ -0,0 +1,284 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+from .gnss_files import _read_buffer, _line_index, _fixed_field, _to_float, _to_int, read_sp3_file
+from .gnss_cache import cached_reader
+from .gnss_time import GnssTimeArray
+
+__all__ = ['read_rnxn_file', 'brd_orbit', 'screen_brd_sats']
+
+# broadcast orbit fields of the RINEX 3 navigation records (names of the GPS message, the other systems use the
+# same positions: GAL week/SISA/BGD, BDS SatH1/TGD1/AODC...), 'toe' is the seconds of week of the system time
+_KEPLER_FIELDS = ['af0', 'af1', 'af2',
+                  'iode', 'crs', 'dn', 'm0', 'cuc', 'e', 'cus', 'sqrta', 'toe', 'cic', 'omega0', 'cis',
+                  'i0', 'crc', 'omega', 'omegadot', 'idot', 'codes', 'week', 'l2p', 'accuracy', 'health', 'tgd', 'iodc',
+                  'ttm', 'fit']
+# GLONASS: -TauN, GammaN, message frame time, then position (km), velocity (km/s) and lunisolar acceleration (km/s2)
+_GLONASS_FIELDS = ['taun', 'gamman', 'tk',
+                   'x', 'vx', 'ax', 'health', 'y', 'vy', 'ay', 'freq', 'z', 'vz', 'az', 'age']
+_KEPLER_SYS = 'GECJI'
+
+# seconds between the GPS time origin (MJD 44244) and the BDT origin, BDT = GPST - 14 s
+_BDT_WEEK0 = 1356
+_BDT_GPST = 14.0
+# UTC - GPST leap seconds (MJD from which they apply), used when the navigation header has none
+_LEAP_SECONDS = [(57754, 18), (57204, 17), (56109, 16), (54832, 15), (53736, 14), (0, 13)]
+
+# gravitational constant and earth rotation rate of each system
+_GM = {'G': 3.986005e14, 'J': 3.986005e14, 'I': 3.986005e14, 'E': 3.986004418e14, 'C': 3.986004418e14}
+_OMGE = {'G': 7.2921151467e-5, 'J': 7.2921151467e-5, 'I': 7.2921151467e-5, 'E': 7.2921151467e-5, 'C': 7.292115e-5}
+# PZ-90 constants of the GLONASS equations of motion
+_GLO_GM = 3.9860044e14
+_GLO_AE = 6378136.0
+_GLO_J2 = 1.0826257e-3
+_GLO_OMGE = 7.292115e-5
+# maximum distance (s) between an epoch and the reference time of the message used for it
+_MAX_AGE = {'G': 7200.0, 'J': 7200.0, 'I': 7200.0, 'E': 7200.0, 'C': 3600.0, 'R': 1800.0}
+
+
+def _gps_seconds(mjd, sod):
+    """ seconds since the GPS time origin """
+    return (np.asarray(mjd, dtype=np.float64) - 44244.0) * 86400.0 + np.asarray(sod, dtype=np.float64)
+
+
+def _leap_seconds(mjd):
+    for mjd0, leap in _LEAP_SECONDS:
+        if mjd >= mjd0:
+            return leap
+    return 0
+
+
+@cached_reader()
+def read_rnxn_file(f_name, gsys=None):
+    """
+    Read the GPS, Galileo, BDS, QZSS, IRNSS and GLONASS records of a RINEX 3 navigation file
+    return a DataFrame with one row per message: sat, mjd/sod of the clock epoch (in the system time), t (GPST
+    seconds since MJD 44244 of the clock epoch), tref (GPST seconds of toe, of the clock epoch for GLONASS)
+    and the Keplerian (_KEPLER_FIELDS) or GLONASS state vector (_GLONASS_FIELDS) parameters, NaN if not applicable
+    """
+    start = time.time()
+    try:
+        buf = _read_buffer(f_name)
+    except FileNotFoundError:
+        logging.warning(f"file not found {f_name}")
+        return
+
+    starts, ends = _line_index(buf)
+    label = _fixed_field(buf, starts, ends, 60, 80)
+    iend = np.flatnonzero(label == b'END OF HEADER       ')
+    if len(iend) == 0:
+        logging.warning(f"END OF HEADER not found in {f_name}")
+        return
+    head = np.flatnonzero(label[0:iend[0]] == b'RINEX VERSION / TYPE')
+    version = float(bytes(buf[starts[head[0]]:starts[head[0]] + 9])) if len(head) else 0.0
+    if version < 3:
+        logging.warning(f"only RINEX 3 navigation files are supported: {f_name} version {version}")
+        return
+    ileap = np.flatnonzero(label[0:iend[0]] == b'LEAP SECONDS        ')
+    leap = int(bytes(buf[starts[ileap[0]]:starts[ileap[0]] + 6])) if len(ileap) else None
+    starts, ends = starts[iend[0] + 1:], ends[iend[0] + 1:]
+    # Fortran D exponents
+    buf = buf.copy()
+    buf[(buf == 68) | (buf == 100)] = 69
+
+    # a record begins with the satellite, the number of lines is taken up to the next record
+    first = _fixed_field(buf, starts, ends, 0, 3)
+    chars = first.view(np.uint8).reshape(len(first), 3)
+    is_rec = np.isin(chars[:, 0], np.frombuffer(b'GECJIR', dtype=np.uint8)) & \
+        (((chars[:, 1] >= 48) & (chars[:, 1] <= 57)) | (chars[:, 1] == 32)) & (chars[:, 2] >= 48) & (chars[:, 2] <= 57)
+    irec = np.flatnonzero(is_rec)
+    nline = np.diff(np.append(irec, len(starts)))
+    sys_rec = chars[irec, 0].tobytes().decode()
+
+    data = []
+    for sys_group, fields in [(_KEPLER_SYS, _KEPLER_FIELDS), ('R', _GLONASS_FIELDS)]:
+        norbit = 7 if sys_group != 'R' else 3
+        sel = np.array([gs in sys_group and (gsys is None or gs in gsys) for gs in sys_rec], dtype=bool)
+        sel &= nline > norbit
+        rec = irec[sel]
+        if len(rec) == 0:
+            continue
+        st, en = starts[rec], ends[rec]
+        tt = GnssTimeArray.from_ymd(
+            _to_int(_fixed_field(buf, st, en, 4, 8)), _to_int(_fixed_field(buf, st, en, 9, 11)),
+            _to_int(_fixed_field(buf, st, en, 12, 14)),
+            _to_int(_fixed_field(buf, st, en, 15, 17)) * 3600 + _to_int(_fixed_field(buf, st, en, 18, 20)) * 60
+            + _to_int(_fixed_field(buf, st, en, 21, 23)))
+        dd = {'sat': np.char.replace(first[rec].astype('U3'), ' ', '0'), 'mjd': tt.mjd.astype(np.int64), 'sod': tt.sod}
+        for k, name in enumerate(fields):
+            line, col = (k + 1) // 4, 4 + 19 * ((k + 1) % 4)
+            dd[name] = _to_float(_fixed_field(buf, starts[rec + line], ends[rec + line], col, col + 19))
+        data.append(pd.DataFrame(dd))
+    if not data:
+        logging.warning(f"no navigation record in {f_name}")
+        return
+    data = pd.concat(data, ignore_index=True)
+
+    # clock epochs and the reference time of the ephemeris in GPST
+    gs = data['sat'].str[0].to_numpy()
+    t = _gps_seconds(data['mjd'], data['sod'])
+    t[gs == 'C'] += _BDT_GPST
+    is_glo = gs == 'R'
+    if is_glo.any():
+        t[is_glo] += leap if leap is not None else _leap_seconds(int(data['mjd'][is_glo].min()))
+    week = data['week'].to_numpy() + np.where(gs == 'C', _BDT_WEEK0, 0)
+    tref = week * 604800.0 + data['toe'].to_numpy() + np.where(gs == 'C', _BDT_GPST, 0.0)
+    # week number and toe refer to the same week as the clock epoch in a regular record
+    tref += np.round((t - tref) / 604800.0) * 604800.0
+    data['t'] = t
+    data['tref'] = np.where(is_glo, t, tref)
+    data = data[np.isfinite(data['tref'])].sort_values(['sat', 'tref'], kind='stable').reset_index(drop=True)
+
+    end = time.time()
+    logging.info(f"{f_name} file is read in {end - start:.2f} seconds")
+    return data
+
+
+def _kepler_orbit(eph, dt):
+    """ ECEF positions (n, 3) of Keplerian broadcast ephemerides (dict of arrays) at dt seconds from toe """
+    gs = eph['sys']
+    gm = np.array([_GM.get(s, _GM['G']) for s in gs])
+    omge = np.array([_OMGE.get(s, _OMGE['G']) for s in gs])
+    a = eph['sqrta'] ** 2
+    e = eph['e']
+    n = np.sqrt(gm / a ** 3) + eph['dn']
+    m = eph['m0'] + n * dt
+    ea = m.copy()
+    for _ in range(8):
+        ea -= (ea - e * np.sin(ea) - m) / (1.0 - e * np.cos(ea))
+    v = np.arctan2(np.sqrt(1.0 - e * e) * np.sin(ea), np.cos(ea) - e)
+    phi = v + eph['omega']
+    sin2, cos2 = np.sin(2 * phi), np.cos(2 * phi)
+    u = phi + eph['cus'] * sin2 + eph['cuc'] * cos2
+    r = a * (1.0 - e * np.cos(ea)) + eph['crs'] * sin2 + eph['crc'] * cos2
+    inc = eph['i0'] + eph['idot'] * dt + eph['cis'] * sin2 + eph['cic'] * cos2
+    xp, yp = r * np.cos(u), r * np.sin(u)
+
+    # BDS GEO satellites: the elements refer to an inertial frame tilted by -5 degrees
+    prn = np.array([int(s[1:3]) for s in eph['sat']])
+    geo = (gs == 'C') & ((prn <= 5) | (prn >= 59))
+    node = eph['omega0'] + (eph['omegadot'] - np.where(geo, 0.0, omge)) * dt - omge * eph['toe']
+    cn, sn, ci, si = np.cos(node), np.sin(node), np.cos(inc), np.sin(inc)
+    x = xp * cn - yp * ci * sn
+    y = xp * sn + yp * ci * cn
+    z = yp * si
+    if geo.any():
+        f = np.deg2rad(-5.0)
+        rot = omge[geo] * dt[geo]
+        xg, yg, zg = x[geo], y[geo] * np.cos(f) + z[geo] * np.sin(f), -y[geo] * np.sin(f) + z[geo] * np.cos(f)
+        x[geo] = xg * np.cos(rot) + yg * np.sin(rot)
+        y[geo] = -xg * np.sin(rot) + yg * np.cos(rot)
+        z[geo] = zg
+    return np.column_stack((x, y, z))
+
+
+def _glonass_deriv(state, acc):
+    """ time derivative of GLONASS state vectors (n, 6) in PZ-90, acc: lunisolar accelerations (n, 3) """
+    pos, vel = state[:, 0:3], state[:, 3:6]
+    r2 = np.sum(pos * pos, axis=1)
+    r = np.sqrt(r2)
+    k1 = -_GLO_GM / (r2 * r)
+    k2 = -1.5 * _GLO_J2 * _GLO_GM * _GLO_AE ** 2 / (r2 * r2 * r)
+    z2 = 5.0 * pos[:, 2] ** 2 / r2
+    w2 = _GLO_OMGE ** 2
+    out = np.empty_like(state)
+    out[:, 0:3] = vel
+    out[:, 3] = (k1 + k2 * (1.0 - z2) + w2) * pos[:, 0] + 2.0 * _GLO_OMGE * vel[:, 1] + acc[:, 0]
+    out[:, 4] = (k1 + k2 * (1.0 - z2) + w2) * pos[:, 1] - 2.0 * _GLO_OMGE * vel[:, 0] + acc[:, 1]
+    out[:, 5] = (k1 + k2 * (3.0 - z2)) * pos[:, 2] + acc[:, 2]
+    return out
+
+
+def _glonass_orbit(eph, dt, step=60.0):
+    """ ECEF positions (n, 3) of GLONASS broadcast state vectors integrated over dt seconds (RK4, all together) """
+    state = np.column_stack([eph[k] for k in ['x', 'y', 'z', 'vx', 'vy', 'vz']]) * 1000.0
+    acc = np.column_stack([eph[k] for k in ['ax', 'ay', 'az']]) * 1000.0
+    nstep = max(1, int(np.ceil(np.max(np.abs(dt)) / step))) if len(dt) else 0
+    h = (dt / max(nstep, 1))[:, None]
+    for _ in range(nstep):
+        k1 = _glonass_deriv(state, acc)
+        k2 = _glonass_deriv(state + 0.5 * h * k1, acc)
+        k3 = _glonass_deriv(state + 0.5 * h * k2, acc)
+        k4 = _glonass_deriv(state + h * k3, acc)
+        state = state + h / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+    return state[:, 0:3]
+
+
+def brd_orbit(nav, sats, mjd, sod):
+    """
+    ECEF positions (m) of satellites from broadcast ephemerides read by read_rnxn_file
+    sats, mjd, sod: arrays of the same length (GPST), the healthy message closest to each epoch is used
+    return an (n, 3) array, NaN where no usable message is found
+    """
+    sats = np.asarray(sats).astype(str)
+    t = _gps_seconds(np.broadcast_to(mjd, sats.shape), np.broadcast_to(sod, sats.shape))
+    pos = np.full((len(sats), 3), np.nan)
+    nav = nav[nav['health'].fillna(0).to_numpy() == 0]
+    nav_sat = nav['sat'].to_numpy().astype(str)
+    nav_tref = nav['tref'].to_numpy()
+
+    # index of the message used for each epoch, -1 if none
+    imsg = np.full(len(sats), -1, dtype=np.int64)
+    for sat in np.unique(sats):
+        idx = np.flatnonzero(sats == sat)
+        lo, hi = np.searchsorted(nav_sat, sat, 'left'), np.searchsorted(nav_sat, sat, 'right')
+        if lo == hi:
+            continue
+        tref = nav_tref[lo:hi]
+        k = np.clip(np.searchsorted(tref, t[idx]), 1, len(tref)) - 1
+        k1 = np.minimum(k + 1, len(tref) - 1)
+        k = np.where(np.abs(tref[k1] - t[idx]) < np.abs(tref[k] - t[idx]), k1, k)
+        ok = np.abs(tref[k] - t[idx]) <= _MAX_AGE.get(sat[0], 0.0)
+        imsg[idx[ok]] = lo + k[ok]
+
+    for is_glo, fields, orbit in [(False, _KEPLER_FIELDS, _kepler_orbit), (True, _GLONASS_FIELDS, _glonass_orbit)]:
+        idx = np.flatnonzero((imsg >= 0) & ((np.char.find(sats, 'R') == 0) == is_glo))
+        if len(idx) == 0:
+            continue
+        msg = nav.iloc[imsg[idx]]
+        eph = {name: msg[name].to_numpy(dtype=np.float64) for name in fields}
+        eph['sat'] = sats[idx]
+        eph['sys'] = np.array([s[0] for s in sats[idx]])
+        pos[idx] = orbit(eph, t[idx] - msg['tref'].to_numpy())
+    return pos
+
+
+def screen_brd_sats(f_nav, f_sp3, sats=None, max_rms=30.0, step=900):
+    """
+    Compare the broadcast orbits of a RINEX 3 navigation file with reference SP3 orbits every step seconds
+    return the satellites whose 3D RMS exceeds max_rms (m) or which have no healthy message in the SP3 span
+    """
+    nav = read_rnxn_file(f_nav)
+    if nav is None or nav.empty:
+        return []
+    if isinstance(f_sp3, str):
+        f_sp3 = [f_sp3]
+    ref = [read_sp3_file(f) for f in f_sp3]
+    ref = [dd for dd in ref if dd is not None and not dd.empty]
+    if not ref:
+        logging.warning(f"no reference orbit to screen the broadcast ephemeris")
+        return []
+    ref = pd.concat(ref, ignore_index=True)
+    ref = ref[(np.abs(np.remainder(ref['sod'] + 0.5, step) - 0.5) < 1e-3) & ref['px'].notna() & (ref['px'] != 0)]
+    ref = ref[ref['sat'].isin(set(nav['sat']))]
+    if sats is not None:
+        ref = ref[ref['sat'].isin(set(sats))]
+    if ref.empty:
+        return []
+
+    pos = brd_orbit(nav, ref['sat'].to_numpy(), ref['mjd'].to_numpy(), ref['sod'].to_numpy())
+    dd = pd.DataFrame({'sat': ref['sat'].to_numpy(),
+                       'd2': np.sum((pos - ref[['px', 'py', 'pz']].to_numpy()) ** 2, axis=1)})
+    rms = np.sqrt(dd.groupby('sat')['d2'].mean())
+    sat_rm = []
+    for sat, val in rms.items():
+        if np.isnan(val):
+            logging.warning(f"No healthy broadcast ephemeris: {sat}")
+            sat_rm.append(sat)
+        elif val > max_rms:
+            logging.warning(f"Bad satellite BRD: {sat} {val:10.2f} m")
+            sat_rm.append(sat)
+    if sat_rm:
+        logging.warning(f"SATELLITES {' '.join(sat_rm)} are removed")
+    return sat_rm
@@ -1,6 +1,8 @@
 import math
 import time
+import numpy as np
 from datetime import datetime
+from functools import lru_cache
 
 monthdays = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 
@@ -14,61 +16,53 @@ def leapyear(year):
     return 0
 
 
+def _civil2mjd(year, mon, day):
+    """ closed-form proleptic Gregorian calendar to MJD, for scalars or integer arrays """
+    year = year - (mon <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * ((mon + 9) % 12) + 2) // 5 + day - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 678881
+
+
+def _mjd2civil(mjd):
+    """ closed-form MJD to year, month, day, for scalars or integer arrays """
+    days = mjd + 678881
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    mon = mp + 3 - 12 * (mp >= 10)
+    return yoe + era * 400 + (mon <= 2), mon, day
+
+
 def norm_doy(year, doy):
-    while True:
-        if doy <= 0:
-            year -= 1
-            doy += (365 + leapyear(year))
-        elif doy > 365 + leapyear(year):
-            doy -= (365 + leapyear(year))
-            year += 1
-        else:
-            break
+    """ Move a day of year out of [1, 365/366] into the right year """
+    doy, year = mjd2ydoy(_civil2mjd(year, 1, 1) + doy - 1)
     return year, doy
 
 
 def doy2ymd(year: int, doy: int):
     """ Change year,day of year to year,month,day """
-    day = doy
-    mon = 0
-    for i in range(13):
-        monthday = monthdays[i]
-        if i == 2 and leapyear(year) == 1:
-            monthday += 1
-        if day > monthday:
-            day -= monthday
-        else:
-            mon = i
-            break
+    _, mon, day = _mjd2civil(_civil2mjd(year, 1, 1) + doy - 1)
     return mon, day
 
 
 def ymd2doy(year: int, mon: int, day: int):
     """ Change year,month,day to year,day of year """
-    doy = day
-    for i in range(1, mon):
-        doy += monthdays[i]
-    if mon > 2:
-        doy += leapyear(year)
-    return doy
+    return _civil2mjd(year, mon, day) - _civil2mjd(year, 1, 1) + 1
 
 
 def ymd2mjd(year: int, mon: int, day: int):
     """ Change year,month,day to Modified Julian Day """
-    if mon <= 2:
-        mon += 12
-        year -= 1
-    mjd = 365.25 * year - 365.25 * year % 1.0 - 679006.0
-    mjd += math.floor(30.6001 * (mon + 1)) + 2.0 - math.floor(
-        year / 100.0) + math.floor(year / 400) + day
-    return mjd
+    return float(_civil2mjd(year, mon, day))
 
 
 def doy2mjd(year, doy):
     """ Change year, day of year to Modified Julian Day """
-    year, doy = norm_doy(year, doy)
-    mon, day = doy2ymd(year, doy)
-    return ymd2mjd(year, mon, day)
+    return float(_civil2mjd(year, 1, 1) + doy - 1)
 
 
 def ymd2gpsweek(year, mon, day):
@@ -80,22 +74,14 @@ def ymd2gpsweek(year, mon, day):
 
 
 def mjd2ydoy(mjd):
-    """ Change Modified Julian Day to year, day of year """
-    """ The input date must after 1952.0 """
-    year = 1952
-    dd = mjd + 1 - 34012
-    yday = 366
-    while dd > yday:
-        dd -= yday
-        year += 1
-        yday = 365 + leapyear(year)
-    return int(dd), int(year)
+    """ Change Modified Julian Day to day of year, year """
+    mjd = math.floor(mjd)
+    year = _mjd2civil(mjd)[0]
+    return mjd - _civil2mjd(year, 1, 1) + 1, year
 
 
 def mjd2ymd(mjd):
-    doy, year = mjd2ydoy(mjd)
-    mon, day = doy2ymd(year, doy)
-    return year, mon, day
+    return _mjd2civil(math.floor(mjd))
 
 
 def sod2hms(sod):
@@ -112,6 +98,19 @@ def hms2sod(hh, mm=0, ss=0.0):
     return int(hh)*3600 + int(mm)*60 + float(ss)
 
 
+@lru_cache(maxsize=4096)
+def _parse_epoch(str_time):
+    """ mjd and sod of a stripped 'YYYY-MM-DD HH:MM:SS' string, the same epoch repeats for every record of a file """
+    dd = str_time.split()
+    year, mon, day = dd[0].split('-')
+    if len(dd) > 1:
+        hh, mm, ss = dd[1].split(':')
+        sod = int(hh) * 3600 + int(mm) * 60 + int(ss)
+    else:
+        sod = 0
+    return ymd2mjd(int(year), int(mon), int(day)), float(sod)
+
+
 _formats = {
     'ymd': '{d.year:0>4d}-{d.month:0>2d}-{d.day:0>2d}',
     'mdy': '{d.month:0>2d}/{d.day:0>2d}/{d.year:0>4d}',
@@ -127,25 +126,27 @@ class GnssTime:
     def __init__(self, mjd, sod=0.0):
         self._mjd = mjd
         self._sod = sod
-        self.__set_time()
+        # the calendar fields are computed on first access
+        self._year = None
+        if not 0.0 <= sod < 86400.0:
+            self.__norm_sod()
 
     def __norm_sod(self):
-        while True:
-            if self._sod >= 86400.0:
-                self._sod -= 86400.0
-                self._mjd += 1
-            elif self._sod < 0:
-                self._sod += 86400.0
-                self._mjd -= 1
-            else:
-                break
+        """ move sod into [0, 86400) """
+        carry = math.floor(self._sod / 86400.0)
+        self._sod -= carry * 86400.0
+        self._mjd += carry
+        if self._sod >= 86400.0:
+            self._sod -= 86400.0
+            self._mjd += 1
 
     def __set_time(self):
         """ set all time according to mjd and seconds of day """
-        self.__norm_sod()
-        self._doy, self._year = mjd2ydoy(self._mjd)
-        self._month, self._day = doy2ymd(self._year, self._doy)
-        self._gwk, self._gwkd = ymd2gpsweek(self._year, self._month, self._day)
+        mjd = math.floor(self._mjd)
+        self._year, self._month, self._day = _mjd2civil(mjd)
+        self._doy = mjd - _civil2mjd(self._year, 1, 1) + 1
+        self._gwk = int((mjd - 44244) / 7.0)
+        self._gwkd = mjd - 44244 - self._gwk * 7
 
     # only readable as no @XXX.setter
     @property
@@ -158,26 +159,38 @@ class GnssTime:
 
     @property
     def year(self):
+        if self._year is None:
+            self.__set_time()
         return self._year
 
     @property
     def doy(self):
+        if self._year is None:
+            self.__set_time()
         return self._doy
 
     @property
     def month(self):
+        if self._year is None:
+            self.__set_time()
         return self._month
 
     @property
     def day(self):
+        if self._year is None:
+            self.__set_time()
         return self._day
 
     @property
     def gwk(self):
+        if self._year is None:
+            self.__set_time()
         return self._gwk
 
     @property
     def gwkd(self):
+        if self._year is None:
+            self.__set_time()
         return self._gwkd
 
     @property
@@ -217,15 +230,7 @@ class GnssTime:
     @classmethod
     def from_str(cls, str_time):
         """ set GNSSTime from YYYY-MM-DD HH:MM:SS """
-        dd = str_time.strip().split()
-        year, mon, day = dd[0].split('-')
-        if len(dd) > 1:
-            hh, mm, ss = dd[1].split(':')
-            sod = int(hh) * 3600 + int(mm) * 60 + int(ss)
-        else:
-            sod = 0
-        mjd = ymd2mjd(int(year), int(mon), int(day))
-        return cls(mjd, float(sod))
+        return cls(*_parse_epoch(str_time.strip()))
 
     def __str__(self):
         """ format: 2019-07-19 00:00:00 """
@@ -258,41 +263,39 @@ class GnssTime:
             return NotImplemented
         return GnssTime(self.mjd, self.sod - dsec)
 
-    def __iadd__(self, other):
-        try:
-            dsec = float(other)
-        except ValueError:
-            return NotImplemented
-        self._sod += dsec
-        self.__set_time()
-        return self
-
-    def __isub__(self, other):
-        try:
-            dsec = float(other)
-        except ValueError:
-            return NotImplemented
-        self._sod -= dsec
-        self.__set_time()
-        return self
+    # GnssTime is immutable (t += dt binds a new object), so it can key dicts and sets
+    def __hash__(self):
+        return hash((self._mjd, self._sod))
 
     def __eq__(self, other):
-        return (self.mjd == other.mjd) and (self.sod == other.sod)
+        if not isinstance(other, GnssTime):
+            return NotImplemented
+        return (self._mjd, self._sod) == (other._mjd, other._sod)
 
     def __ne__(self, other):
-        return (self.mjd != other.mjd) or (self.sod != other.sod)
+        if not isinstance(other, GnssTime):
+            return NotImplemented
+        return (self._mjd, self._sod) != (other._mjd, other._sod)
 
     def __lt__(self, other):
-        return (self.mjd < other.mjd) or (self.mjd == other.mjd and self.sod < other.sod)
+        if not isinstance(other, GnssTime):
+            return NotImplemented
+        return (self._mjd, self._sod) < (other._mjd, other._sod)
 
     def __le__(self, other):
-        return (self.mjd < other.mjd) or (self.mjd == other.mjd and self.sod <= other.sod)
+        if not isinstance(other, GnssTime):
+            return NotImplemented
+        return (self._mjd, self._sod) <= (other._mjd, other._sod)
 
     def __gt__(self, other):
-        return (self.mjd > other.mjd) or (self.mjd == other.mjd and self.sod > other.sod)
+        if not isinstance(other, GnssTime):
+            return NotImplemented
+        return (self._mjd, self._sod) > (other._mjd, other._sod)
 
     def __ge__(self, other):
-        return (self.mjd > other.mjd) or (self.mjd == other.mjd and self.sod >= other.sod)
+        if not isinstance(other, GnssTime):
+            return NotImplemented
+        return (self._mjd, self._sod) >= (other._mjd, other._sod)
 
     def datetime(self) -> datetime:
         hh, mm, ss = sod2hms(int(self.sod))
@@ -311,4 +314,198 @@ class GnssTime:
                 'gwk': f"{self.gwk:0>4d}", 'gwkd': f"{self:gwkd}"}
 
 
-__all__ = ['doy2mjd', 'doy2ymd', 'ymd2doy', 'ymd2mjd', 'ymd2gpsweek', 'mjd2ydoy', 'mjd2ymd', 'sod2hms', 'hms2sod', 'GnssTime']
\ No newline at end of file
+class GnssTimeArray:
+    """
+    Vectorized epochs: an int32 MJD array and a float64 seconds of day array (normalized into [0, 86400))
+    with the calendar fields of GnssTime as arrays; indexing with an integer returns a GnssTime
+    """
+    __slots__ = ['_mjd', '_sod']
+
+    def __init__(self, mjd, sod=0.0):
+        mjd, sod = np.broadcast_arrays(np.asarray(mjd), np.asarray(sod, dtype=np.float64))
+        if mjd.dtype.kind == 'f':
+            day = np.floor(mjd)
+            sod = sod + (mjd - day) * 86400.0
+            mjd = day
+        # blank (NaN) seconds stay NaN on their own day
+        carry = np.nan_to_num(np.floor(sod / 86400.0))
+        sod = sod - carry * 86400.0
+        mjd = mjd.astype(np.int64) + carry.astype(np.int64)
+        # rounding of tiny negative seconds
+        over = sod >= 86400.0
+        self._sod = np.where(over, sod - 86400.0, sod)
+        self._mjd = (mjd + over).astype(np.int32)
+
+    @property
+    def mjd(self):
+        return self._mjd
+
+    @property
+    def sod(self):
+        return self._sod
+
+    @property
+    def fmjd(self):
+        return self._mjd + self._sod / 86400.0
+
+    @property
+    def ymd(self):
+        """ year, month and day arrays """
+        return _mjd2civil(self._mjd.astype(np.int64))
+
+    @property
+    def year(self):
+        return self.ymd[0]
+
+    @property
+    def month(self):
+        return self.ymd[1]
+
+    @property
+    def day(self):
+        return self.ymd[2]
+
+    @property
+    def doy(self):
+        year = self.year
+        return self._mjd - _civil2mjd(year, 1, 1) + 1
+
+    @property
+    def gwk(self):
+        return (self._mjd.astype(np.int64) - 44244) // 7
+
+    @property
+    def gwkd(self):
+        return (self._mjd.astype(np.int64) - 44244) % 7
+
+    @classmethod
+    def from_ymd(cls, year, mon, day, sod=0.0):
+        """ epochs from year, month, day (and seconds of day) arrays """
+        return cls(_civil2mjd(np.asarray(year, dtype=np.int64), np.asarray(mon, dtype=np.int64),
+                              np.asarray(day, dtype=np.int64)), sod)
+
+    @classmethod
+    def from_ydoy(cls, year, doy, sod=0.0):
+        """ epochs from year, day of year (and seconds of day) arrays, doy may run over the year """
+        return cls(_civil2mjd(np.asarray(year, dtype=np.int64), 1, 1) + np.asarray(doy, dtype=np.int64) - 1, sod)
+
+    @classmethod
+    def from_str(cls, str_time):
+        """ epochs from 'YYYY-MM-DD HH:MM:SS' strings (str or bytes), the time may be omitted """
+        text = np.char.strip(np.asarray(str_time).astype('S'))
+        width = max(text.dtype.itemsize, 19)
+        chars = np.full((text.size, width), 32, dtype=np.uint8)
+        raw = np.frombuffer(text.tobytes(), dtype=np.uint8).reshape(text.size, text.dtype.itemsize)
+        chars[:, 0:raw.shape[1]] = np.where(raw == 0, 32, raw)
+
+        def field(beg, end):
+            val = np.ascontiguousarray(chars[:, beg:end]).view(f'S{end - beg}').ravel()
+            return np.where(np.char.strip(val) == b'', b'0', val)
+
+        sod = field(11, 13).astype(np.int64) * 3600 + field(14, 16).astype(np.int64) * 60 + \
+            field(17, width).astype(np.float64)
+        return cls.from_ymd(field(0, 4).astype(np.int64), field(5, 7).astype(np.int64), field(8, 10).astype(np.int64),
+                            sod)
+
+    @classmethod
+    def from_gnsstime(cls, times):
+        """ epochs from a list of GnssTime """
+        return cls(np.array([t.mjd for t in times], dtype=np.int64), np.array([t.sod for t in times], dtype=np.float64))
+
+    def to_gnsstime(self):
+        """ list of GnssTime """
+        return [GnssTime(int(mjd), float(sod)) for mjd, sod in zip(self._mjd, self._sod)]
+
+    def __len__(self):
+        return self._mjd.size
+
+    def __getitem__(self, idx):
+        if np.ndim(self._mjd[idx]) == 0:
+            return GnssTime(int(self._mjd[idx]), float(self._sod[idx]))
+        return GnssTimeArray(self._mjd[idx], self._sod[idx])
+
+    def __iter__(self):
+        return iter(self.to_gnsstime())
+
+    def __repr__(self):
+        return f"GnssTimeArray({len(self)} epochs)"
+
+    def strings(self, code=None):
+        """ array of 'YYYY-MM-DD HH:MM:SS' strings like str(GnssTime), or of the GnssTime formats (ymd, ydoy...) """
+        year, mon, day = self.ymd
+
+        def pad(val, n):
+            return np.char.zfill(np.asarray(val).astype(str), n)
+
+        if code is None:
+            sod = np.floor(self._sod).astype(np.int64)
+            parts = [pad(year, 4), '-', pad(mon, 2), '-', pad(day, 2), ' ', pad(sod // 3600, 2), ':',
+                     pad(sod % 3600 // 60, 2), ':', pad(sod % 60, 2)]
+        elif code == 'ymd':
+            parts = [pad(year, 4), '-', pad(mon, 2), '-', pad(day, 2)]
+        elif code == 'mdy':
+            parts = [pad(mon, 2), '/', pad(day, 2), '/', pad(year, 4)]
+        elif code == 'dmy':
+            parts = [pad(day, 2), '/', pad(mon, 2), '/', pad(year, 4)]
+        elif code == 'ydoy':
+            parts = [pad(year, 4), pad(self._mjd - _civil2mjd(year, 1, 1) + 1, 3)]
+        elif code == 'gwkd':
+            parts = [pad(self.gwk, 4), pad(self.gwkd, 1)]
+        else:
+            raise KeyError(code)
+        out = parts[0]
+        for part in parts[1:]:
+            out = np.char.add(out, part)
+        return out
+
+    def datetime64(self):
+        """ numpy datetime64[us] array """
+        usec = (self._mjd.astype(np.int64) - 40587) * 86400000000 + np.round(self._sod * 1e6).astype(np.int64)
+        return usec.astype('datetime64[us]')
+
+    def diff(self, other):
+        """ seconds from other (GnssTime or GnssTimeArray) to self """
+        return (self._mjd.astype(np.int64) - np.asarray(other.mjd, dtype=np.int64)) * 86400.0 + self._sod - \
+            np.asarray(other.sod, dtype=np.float64)
+
+    def __add__(self, other):
+        return GnssTimeArray(self._mjd, self._sod + np.asarray(other, dtype=np.float64))
+
+    def __sub__(self, other):
+        """ seconds between epochs for a GnssTime(Array), else epochs shifted back by other seconds """
+        if isinstance(other, (GnssTime, GnssTimeArray)):
+            return self.diff(other)
+        return GnssTimeArray(self._mjd, self._sod - np.asarray(other, dtype=np.float64))
+
+    def _cmp(self, other):
+        if not isinstance(other, (GnssTime, GnssTimeArray)):
+            return None
+        return self.diff(other)
+
+    def __eq__(self, other):
+        d = self._cmp(other)
+        return NotImplemented if d is None else d == 0
+
+    def __ne__(self, other):
+        d = self._cmp(other)
+        return NotImplemented if d is None else d != 0
+
+    def __lt__(self, other):
+        d = self._cmp(other)
+        return NotImplemented if d is None else d < 0
+
+    def __le__(self, other):
+        d = self._cmp(other)
+        return NotImplemented if d is None else d <= 0
+
+    def __gt__(self, other):
+        d = self._cmp(other)
+        return NotImplemented if d is None else d > 0
+
+    def __ge__(self, other):
+        d = self._cmp(other)
+        return NotImplemented if d is None else d >= 0
+
+
+__all__ = ['doy2mjd', 'doy2ymd', 'ymd2doy', 'ymd2mjd', 'ymd2gpsweek', 'mjd2ydoy', 'mjd2ymd', 'sod2hms', 'hms2sod', 'GnssTime',
+           'GnssTimeArray']
\ No newline at end of file
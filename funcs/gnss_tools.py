@@ -2,12 +2,18 @@ import os
 import math
 import logging
 import shutil
+import numpy as np
 import pandas as pd
 import time
+import heapq
 import xml.etree.ElementTree as ET
+from itertools import groupby
+from queue import Queue
+from threading import Thread
 from functools import wraps
 from contextlib import contextmanager
 from . import gnss_files as gf
+from .gnss_cache import load_frame, save_frame
 
 
 def timethis(label):
@@ -222,8 +228,6 @@ def check_pod_residuals_new(config, max_res_L=0.3, max_freq=0.3):
     for i in range(1, len(type_L)):
         idx_L = idx_L | (data.ot == type_L[i])
     
-    sites = list(set(data.site))
-    sites.sort()
     sats = list(set(data.sat))
     sats.sort()
 
@@ -232,26 +236,18 @@ def check_pod_residuals_new(config, max_res_L=0.3, max_freq=0.3):
     sites_rm = []
     ntot = len(data)
     nmin = ntot / len(sats) / 4
+    nums = data.sat.value_counts()
     for sat in config.all_gnssat:
-        num = len(data[data.sat == sat])
+        num = nums.get(sat, 0)
         if num < nmin:
             logging.warning(f"satellite {sat} observation too less: {num}")
             sats_rm0.append(sat)
 
-    tmp = []
-    data_l = data[idx_L]
-    for site in sites:
-        dd_site = data_l[data_l.site == site]
-        for sat in sats:
-            if sat in sats_rm0:
-                continue
-            dd = dd_site[dd_site.sat == sat]
-            val = dd.res.values
-            if len(val) > 0:
-                rms = math.sqrt(val.dot(val)/len(val))
-                tmp.append({'site':site, 'sat':sat, 'val':rms})
-
-    data_tmp = pd.DataFrame(tmp)
+    # RMS of phase residuals for each site-sat pair
+    data_l = data[idx_L & ~data.sat.isin(sats_rm0)]
+    ms = (data_l.res ** 2).groupby([data_l.site, data_l.sat], observed=True, sort=True).mean()
+    data_tmp = pd.DataFrame({'site': ms.index.get_level_values(0).astype(str),
+                             'sat': ms.index.get_level_values(1).astype(str), 'val': np.sqrt(ms.values)})
     for i in range(20):
         idx_max = data_tmp['val'].idxmax()
         site_rm, sat_rm, val = data_tmp.loc[idx_max].values
@@ -479,6 +475,90 @@ def check_res_sigma(config, max_sig=8):
         config.remove_ambflag_file(site_rm)
 
 
+def _fit_epoch_time(data, nsigma=5.0):
+    """ least squares fit of time = c0 + c_rec * nrec + c_obs * nobs, epochs beyond nsigma are left out of the fit """
+    a = np.column_stack((np.ones(len(data)), data['nrec'].to_numpy(float), data['nobs'].to_numpy(float)))
+    y = data['time'].to_numpy(float)
+    use = np.ones(len(y), dtype=bool)
+    coef, sigma = np.zeros(3), 0.0
+    for _ in range(3):
+        coef = np.linalg.lstsq(a[use], y[use], rcond=None)[0]
+        res = y - a @ coef
+        # robust sigma from the median absolute residual
+        sigma = 1.4826 * np.median(np.abs(res[use]))
+        use = np.abs(res) <= nsigma * max(sigma, 1e-3)
+    return coef, sigma
+
+
+def sum_epoch_time(data):
+    """
+    Summary of the epoch processing times read by read_run_timing, one row per cmd, threads and nmp
+    total: processing time of all parts, wall: time of the slowest part, obs_per_sec: throughput of all parts
+    """
+    keys = ['cmd', 'threads', 'nmp']
+    dd = data.groupby(keys, sort=False).agg(
+        nlog=('log', 'nunique'), nepo=('time', 'size'), total=('time', 'sum'), mean=('time', 'mean'),
+        median=('time', 'median'), p95=('time', lambda x: x.quantile(0.95)), max=('time', 'max'),
+        nrec=('nrec', 'mean'), nobs=('nobs', 'mean'), sum_obs=('nobs', 'sum')).reset_index()
+    wall = data.groupby(keys + ['log'], sort=False)['time'].sum().groupby(keys, sort=False).max()
+    dd['wall'] = wall.to_numpy()
+    dd['obs_per_sec'] = dd['sum_obs'] / dd['total']
+    return dd.drop(columns='sum_obs')
+
+
+def check_epoch_time(run_dir='.', f_hist=None, nsigma=5.0, min_sec=0.5, max_ratio=1.5, min_epo=100, max_runs=30):
+    """
+    Analyze the epoch processing times of the GREAT logs of a run (tmp/*.log)
+    a throughput model (seconds per epoch vs nrec/nobs) is fitted per cmd and num_threads on the history of the
+    previous runs (f_hist), or on the run itself if there is not enough history. Epochs slower than the model by
+    more than nsigma and min_sec seconds, and runs slower than max_ratio times the model are reported.
+    The summary is written to tmp/epoch_time.csv and returned, the run is added to the history
+    """
+    data = gf.read_run_timing(run_dir)
+    if data is None:
+        return
+    run = os.path.abspath(run_dir)
+    hist = load_frame(f_hist) if f_hist else None
+    if hist is not None:
+        hist = hist[hist['run'] != run]
+
+    stats = []
+    for (cmd, threads), dd in data.groupby(['cmd', 'threads'], sort=False):
+        ref = None
+        if hist is not None:
+            ref = hist[(hist['cmd'] == cmd) & (hist['threads'] == threads)]
+        from_hist = ref is not None and len(ref) >= min_epo
+        coef, sigma = _fit_epoch_time(ref if from_hist else dd, nsigma)
+        pred = coef[0] + coef[1] * dd['nrec'].to_numpy(float) + coef[2] * dd['nobs'].to_numpy(float)
+        res = dd['time'].to_numpy() - pred
+        slow = res > max(nsigma * sigma, min_sec)
+        ratio = dd['time'].sum() / max(pred.sum(), 1e-6) if from_hist else np.nan
+        stats.append({'cmd': cmd, 'threads': threads, 'nslow': int(slow.sum()), 'ratio': ratio,
+                      'c0': coef[0], 'c_rec': coef[1], 'c_obs': coef[2], 'sigma': sigma})
+        if slow.any():
+            worst = dd.iloc[np.argmax(res)]
+            logging.warning(f"{cmd} ({threads} threads): {slow.sum()} slow epochs, "
+                            f"max {res.max():.2f} s above model at {worst['date']} in {worst['log']}")
+        if ratio > max_ratio:
+            logging.warning(f"{cmd} ({threads} threads): run is {ratio:.2f} times slower than history")
+
+    summary = sum_epoch_time(data).merge(pd.DataFrame(stats), on=['cmd', 'threads'], how='left')
+    f_sum = os.path.join(run_dir, 'tmp', 'epoch_time.csv')
+    summary.to_csv(f_sum, index=False, float_format='%.6g')
+    logging.info(f"epoch time summary written to {f_sum}")
+
+    if f_hist:
+        new = pd.DataFrame({'run': run, 'cmd': data['cmd'], 'threads': data['threads'],
+                            'time': data['time'].astype(np.float32), 'nrec': data['nrec'].astype(np.int32),
+                            'nobs': data['nobs'].astype(np.int32)})
+        hist = new if hist is None else pd.concat([hist, new], ignore_index=True)
+        runs = pd.unique(hist['run'])
+        if len(runs) > max_runs:
+            hist = hist[hist['run'].isin(set(runs[-max_runs:]))]
+        save_frame(f_hist, hist.reset_index(drop=True))
+    return summary
+
+
 def backup_dir(dir1, dir2):
     if not os.path.isdir(dir1):
         logging.error(f"directory not exists {dir1}")
@@ -697,47 +777,81 @@ def merge_upd_all(config, gsys, files):
     config.gsys = gsys
 
 
+def _upd_epoch_blocks(f_name):
+    """ yield (mjd, sod), EPOCH-TIME line and satellite lines of each epoch of an epoch-wise UPD file """
+    key, head, lines = None, '', []
+    with open(f_name) as f:
+        for line in f:
+            if line.startswith(' EPOCH-TIME'):
+                if key is not None:
+                    yield key, head, lines
+                info = line.split()
+                key, head, lines = (int(info[1]), round(float(info[2]), 3)), line, []
+            elif key is not None and line[0] != '%' and line.find('EOF') < 0:
+                lines.append(line)
+    if key is not None:
+        yield key, head, lines
+
+
+def _prefetch(blocks, size=64):
+    """ iterate over a generator run in a background thread, at most size items ahead """
+    queue = Queue(maxsize=size)
+    end = object()
+    error = []
+
+    def produce():
+        try:
+            for item in blocks:
+                queue.put(item)
+        except Exception as e:
+            error.append(e)
+        finally:
+            queue.put(end)
+
+    Thread(target=produce, daemon=True).start()
+    while True:
+        item = queue.get()
+        if item is end:
+            if error:
+                raise error[0]
+            return
+        yield item
+
+
+def merge_epo_upd(f_ins, f_out):
+    """
+    Merge epoch-wise UPD files (one per system) epoch by epoch, the files are streamed in parallel
+    the blocks are aligned by their EPOCH-TIME, an epoch missing in some files is written with the other systems
+    """
+    files = [f for f in f_ins if os.path.isfile(f)]
+    for f in set(f_ins) - set(files):
+        logging.warning(f"UPD file not found {f}")
+    if not files:
+        return
+    streams = [((key, i, head, lines) for key, head, lines in _prefetch(_upd_epoch_blocks(f)))
+               for i, f in enumerate(files)]
+    with open(files[0]) as f:
+        first_line = f.readline()
+    nepo, nmiss = 0, 0
+    with open(f_out, 'w') as file_object:
+        file_object.write(first_line if first_line.startswith('%') else '% UPD generated using upd_NL\n')
+        for key, group in groupby(heapq.merge(*streams, key=lambda x: x[0:2]), key=lambda x: x[0]):
+            group = list(group)
+            file_object.write(group[0][2])
+            for _, _, _, lines in group:
+                file_object.writelines(lines)
+            nepo += 1
+            nmiss += len(files) - len(group)
+        file_object.write("EOF\n")
+    if nmiss:
+        logging.warning(f"{nmiss} epoch blocks missing in the UPD files merged into {f_out}")
+    logging.info(f"{nepo} epochs of {len(files)} UPD files merged into {f_out}")
+
+
 def merge_upd(f_ins, f_out, mode, intv=30):
+    """ merge UPD files of several systems, intv is not used: NL epochs are aligned by their EPOCH-TIME """
     if mode == "NL":
-        lines_in = []
-        nlines = []
-        nsats = []
-        idx_sys = []
-        for isys in range(0, len(f_ins)):
-            idxHeads = []
-            with open(f_ins[isys]) as file_object:
-                lines = file_object.readlines()
-            nline = len(lines)
-            nlines.append(nline)
-            for i in range(0, nline):
-                lines_in.append(lines[i])
-                if len(idxHeads) < 3:
-                    if "EPOCH-TIME" in lines[i]:
-                        idxHeads.append(i)
-            recLen = idxHeads[1] - idxHeads[0] - 1
-            nsats.append(recLen)
-
-        idx_sys.append(0)
-        idx = nlines[0]
-        for isys in range(1, len(f_ins)):
-            idx_sys.append(idx)
-            idx += nlines[isys]
-
-        nepo = int(86400 / intv) + 1
-        with open(f_out, 'w') as file_object:
-            file_object.write('% UPD generated using upd_NL\n')
-            for i in range(1, nepo):
-                idx1 = 2 + (i - 1) * (nsats[0] + 1) - 1
-                idx2 = 1 + i * (nsats[0] + 1) - 1
-                for j in range(idx1, idx2 + 1):
-                    file_object.write(lines_in[j])
-
-                for isys in range(1, len(f_ins)):
-                    idx1 = idx_sys[isys] + 3 + (i - 1) * (nsats[isys] + 1) - 1
-                    idx2 = idx_sys[isys] + 1 + i * (nsats[isys] + 1) - 1
-                    for j in range(idx1, idx2 + 1):
-                        file_object.write(lines_in[j])
-            file_object.write("EOF\n")
+        merge_epo_upd(f_ins, f_out)
     elif mode in ["EWL25", "EWL24", "EWL", "WL"]:
         with open(f_out, 'w') as f1:
             f1.write(f"% UPD generated using upd_{mode}\n")
@@ -750,50 +864,61 @@ def merge_upd(f_ins, f_out, mode, intv=30):
 
 
 def get_crd_snx(f_snx, site_list):
+    """ coordinates, receiver and antenna of the sites in a SINEX file as a long table (site, type, val, sig, obj) """
+    index = gf.snx_site_index(f_snx)
+    if index is None:
+        return pd.DataFrame()
     data = []
-    try:
-        with open(f_snx, 'r', encoding='UTF-8') as f:
-            block = ''
-            for line in f:
-                if line.startswith('-SOLUTION/ESTIMATE'):
-                    break
-                if line.startswith('+'):
-                    block = line[1:].rstrip()
-                    continue
-                if line.startswith('-'):
-                    block = ''
-                    continue
-                if line[0] != ' ':
-                    continue
-                if block == 'SITE/RECEIVER':
-                    site = line[1:5].lower()
-                    if site not in site_list:
-                        continue
-                    data.append({'site': site, 'type': 'rec', 'val': line[42:62], 'obj': 'SNX'})
-                elif block == 'SITE/ANTENNA':
-                    site = line[1:5].lower()
-                    if site not in site_list:
-                        continue
-                    data.append({'site': site, 'type': 'ant', 'val': line[42:62], 'obj': 'SNX'})
-                elif block == 'SOLUTION/ESTIMATE':
-                    site = line[14:18].lower()
-                    if site not in site_list:
-                        continue
-                    if line[7:11] == 'STAX':
-                        data.append({'site': site, 'type': 'crd_x', 'val': float(line[47:68]),
-                                     'sig': float(line[69:80]), 'obj': 'SNX'})
-                    elif line[7:11] == 'STAY':
-                        data.append({'site': site, 'type': 'crd_y', 'val': float(line[47:68]),
-                                     'sig': float(line[69:80]), 'obj': 'SNX'})
-                    elif line[7:11] == 'STAZ':
-                        data.append({'site': site, 'type': 'crd_z', 'val': float(line[47:68]),
-                                     'sig': float(line[69:80]), 'obj': 'SNX'})
-
-    except FileNotFoundError:
-        logging.warning(f'file not found {f_snx}')
+    for site in site_list:
+        rec = index.get(site)
+        if rec is None:
+            continue
+        if rec['rec']:
+            data.append({'site': site, 'type': 'rec', 'val': rec['rec'], 'obj': 'SNX'})
+        if rec['ant']:
+            data.append({'site': site, 'type': 'ant', 'val': rec['ant'], 'obj': 'SNX'})
+        for i, tp in enumerate(['crd_x', 'crd_y', 'crd_z']):
+            if not np.isnan(rec['xyz'][i]):
+                data.append({'site': site, 'type': tp, 'val': float(rec['xyz'][i]),
+                             'sig': float(rec['sig'][i]), 'obj': 'SNX'})
     return pd.DataFrame(data)
 
 
+def snx_receiver_info(site_list, f_snxs):
+    """
+    Receiver attributes (X/Y/Z, dX/dY/dZ, id, obj, rec, ant) of the sites from one or more SINEX files
+    the first file with complete coordinates of a site is used, return a dict of site -> attributes
+    """
+    if isinstance(f_snxs, str):
+        f_snxs = [f_snxs]
+    indexes = [gf.snx_site_index(f) for f in f_snxs if os.path.isfile(f)]
+    indexes = [idx for idx in indexes if idx]
+    info = {}
+    for site in site_list:
+        recs = [idx[site] for idx in indexes if site in idx]
+        crd = next((r for r in recs if not np.isnan(r['xyz']).any()), None)
+        if crd is None:
+            continue
+        info[site] = receiver_attrib(site, crd['xyz'], crd['sig'], 'SNX',
+                                     rec=next((r['rec'] for r in recs if r['rec']), ''),
+                                     ant=next((r['ant'] for r in recs if r['ant']), ''))
+    return info
+
+
+def receiver_attrib(site, xyz, sig, obj, rec='', ant=''):
+    """ attributes of a <rec> element of the receiver XML section """
+    info = {
+        'X': f'{xyz[0]:20.8f}', 'Y': f'{xyz[1]:20.8f}', 'Z': f'{xyz[2]:20.8f}',
+        'dX': f'{sig[0]:8.4f}', 'dY': f'{sig[1]:8.4f}', 'dZ': f'{sig[2]:8.4f}',
+        'id': site.upper(), 'obj': obj
+    }
+    if rec:
+        info['rec'] = rec
+    if ant:
+        info['ant'] = ant
+    return info
+
+
 def get_crd_res(f_res, site_list, max_sig=8):
     try:
         with open(f_res) as f:
@@ -835,38 +960,15 @@ def get_crd_res(f_res, site_list, max_sig=8):
 def xml_receiver_snx(sites: list, f_snxs: list, f_xml):
 
     receiver = ET.Element('receiver')
-    data = pd.DataFrame()
-    for file in f_snxs:
-        if not os.path.isfile(file):
-            continue
-        data = data.append(get_crd_snx(file, sites))
+    info = snx_receiver_info(sites, f_snxs)
 
     sites_used = []
     for site in sites:
-        df = data[data.site == site]
-        df_x = df[df.type == 'crd_x'].sort_values(by=['obj'], ascending=False)
-        df_y = df[df.type == 'crd_y'].sort_values(by=['obj'], ascending=False)
-        df_z = df[df.type == 'crd_z'].sort_values(by=['obj'], ascending=False)
-        if df_x.empty or df_y.empty or df_z.empty:
+        if site not in info:
             logging.warning(f'site info not found: {site}')
             continue
-
         sites_used.append(site)
-        info = {
-            'X': f'{df_x.val.values[0]:20.8f}',
-            'Y': f'{df_y.val.values[0]:20.8f}',
-            'Z': f'{df_z.val.values[0]:20.8f}',
-            'dX': f'{df_x.sig.values[0]:8.4f}',
-            'dY': f'{df_y.sig.values[0]:8.4f}',
-            'dZ': f'{df_z.sig.values[0]:8.4f}',
-            'id': site.upper(), 'obj': df_x.obj.values[0]
-        }
-        if not df[df.type == 'rec'].empty:
-            info['rec'] = df[df.type == 'rec']['val'].values[0]
-        if not df[df.type == 'ant'].empty:
-            info['ant'] = df[df.type == 'ant']['val'].values[0]
-
-        ET.SubElement(receiver, 'rec', attrib=info)
+        ET.SubElement(receiver, 'rec', attrib=info[site])
 
     root = ET.Element('config')
     gen = ET.SubElement(root, 'gen')